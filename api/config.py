@@ -6,8 +6,110 @@ class Settings(BaseSettings):
     API_SECRET_KEY: str
     DEBUG: bool = False
     DATABASE_URL: str
+    # Opcional; por padrão deriva de DATABASE_URL trocando o driver por asyncpg
+    DATABASE_ASYNC_URL: str | None = None
     REDIS_URL: str
     GLOBAL_IP_ALLOWLIST: str = "127.0.0.1"
+    # Proxies cujo X-Forwarded-For é aceito (ex.: o nginx da stack)
+    TRUSTED_PROXIES: str = "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
     WEBHOOK_HMAC_SECRET: str
+
+    # Pool de conexões (valem para os engines síncrono e assíncrono)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+
+    # Armazenamento dos resultados dos scans (compartilhado entre API e worker)
+    RESULT_STORAGE_PATH: str = "/home/appuser/results"
+    RESULT_COMPRESSION_LEVEL: int = 6
+    # Por quanto tempo um resultado pode ser reaproveitado por scans idênticos (max_age)
+    RESULT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Divisão de scans grandes em jobs paralelos (hosts por shard; 0 desativa,
+    # o padrão: opt-in, ver scripts/check_shard_pipeline.py)
+    SCAN_SHARD_HOSTS: int = 0
+    SCAN_MAX_SHARDS: int = 64
+    # Partes de portas (port_shards) simultâneas contra os mesmos alvos (0 = sem limite)
+    SCAN_PORT_SHARD_PARALLEL: int = 2
+
+    # Scans idênticos pendentes aguardam o mesmo job em vez de executar de novo;
+    # o registro do job em execução expira após o TTL se o worker morrer
+    SCAN_COALESCE: bool = True
+    SCAN_INFLIGHT_TTL_SECONDS: int = 24 * 3600
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 24 * 3600
+
+    # Jobs simultâneos contra o mesmo host/sub-rede (0 desativa, o padrão) e
+    # intervalo até um job sem vaga ser tentado de novo. Um alvo maior que o
+    # agrupamento ocupa no máximo SCAN_HOST_LIMIT_MAX_KEYS chaves
+    SCAN_HOST_CONCURRENCY: int = 0
+    SCAN_HOST_LIMIT_PREFIX_V4: int = 32
+    SCAN_HOST_LIMIT_PREFIX_V6: int = 128
+    SCAN_HOST_LIMIT_MAX_KEYS: int = 1024
+    SCAN_HOST_RETRY_SECONDS: int = 30
+
+    # Vagas do worker (python -m api.worker): jobs simultâneos por contêiner,
+    # reduzidas até o mínimo enquanto a carga por CPU passar do limite (0 = fixo)
+    SCAN_WORKER_SLOTS: int = 4
+    SCAN_WORKER_MIN_SLOTS: int = 1
+    SCAN_WORKER_MAX_LOAD: float = 1.5
+    SCAN_WORKER_RESIZE_SECONDS: int = 30
+    # Vagas sem fork por job (módulos e conexões reaproveitados), renovadas
+    # após SCAN_WORKER_MAX_JOBS jobs (0 = nunca)
+    SCAN_WORKER_WARM: bool = True
+    SCAN_WORKER_MAX_JOBS: int = 1000
+
+    # Pacotes/s de cada Nmap (--max-rate) e orçamento somado de todos os
+    # workers; o orçamento limita os Nmaps simultâneos (0 desativa)
+    NMAP_MAX_RATE: int = 0
+    SCAN_GLOBAL_MAX_RATE: int = 0
+
+    # Agendamento justo: jobs ficam em backlogs por token/prioridade e são
+    # liberados por deficit round robin para a fila do RQ, que guarda no
+    # máximo SCAN_FAIR_QUEUE_DEPTH jobs; workers ociosos olham os backlogs a
+    # cada SCAN_FAIR_POLL_SECONDS. Jobs "high" têm SCAN_FAIR_HIGH_RESERVE vagas
+    # a mais e passam à frente dos já liberados
+    SCAN_FAIR_QUEUE: bool = True
+    SCAN_FAIR_QUEUE_DEPTH: int = 1
+    SCAN_FAIR_HIGH_RESERVE: int = 1
+    SCAN_FAIR_POLL_SECONDS: int = 1
+    # Por quanto tempo cada réplica da API reaproveita a posição/início
+    # estimado dos scans na fila (0 recalcula a cada requisição)
+    SCAN_QUEUE_ESTIMATES_SECONDS: int = 5
+
+    # Rescans incrementais (baseline_id): hosts cuja entrada na referência é
+    # mais antiga que isto passam pelo perfil completo mesmo sem mudanças
+    SCAN_INCREMENTAL_MAX_AGE_SECONDS: int = 7 * 24 * 3600
+
+    # Progresso ao vivo: intervalo do --stats-every do Nmap e taxa máxima de
+    # publicação no Redis por scan/shard
+    NMAP_STATS_EVERY_SECONDS: int = 5
+    SCAN_PROGRESS_MIN_INTERVAL: float = 1.0
+
+    # Tokens emitidos antes do formato com prefixo: verificados um a um (todos
+    # os ainda não migrados) até serem migrados; desative após
+    # `python -m scripts.legacy_tokens` não listar nenhum
+    LEGACY_TOKEN_LOOKUP: bool = True
+
+    # Cache em processo de tokens verificados (0 desativa)
+    TOKEN_CACHE_SIZE: int = 1024
+    TOKEN_CACHE_TTL_SECONDS: int = 60
+
+    # Pool dedicado à autenticação (consulta ao banco + argon2); as threads
+    # rodam com prioridade de CPU reduzida em AUTH_EXECUTOR_NICE (0 = igual)
+    AUTH_EXECUTOR_WORKERS: int = 4
+    AUTH_EXECUTOR_MAX_PENDING: int = 64
+    AUTH_EXECUTOR_NICE: int = 10
+
+    # Limite de requisições por token e rota (balde de fichas no Redis), em
+    # requisições por minuto; rotas identificadas pelo nome do endpoint.
+    # Desligado por padrão; RATE_LIMIT_ROUTES limita rotas específicas (ex.:
+    # {"create_scan": 60}). Token.rate_limits sobrepõe por token (0 = sem limite)
+    RATE_LIMIT_PER_MINUTE: int = 0
+    RATE_LIMIT_ROUTES: dict[str, int] = {}
+    # Scans na fila ou em execução por token (Token.max_active_scans sobrepõe; 0 = sem limite)
+    SCAN_MAX_ACTIVE_PER_TOKEN: int = 0
     
 settings = Settings()
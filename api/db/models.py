@@ -1,11 +1,23 @@
 import uuid
 from sqlalchemy import (
-    Column, Integer, String, DateTime, ForeignKey,
+    Column, Integer, BigInteger, String, DateTime, ForeignKey,
     Text, Boolean, JSON, Index
 )
 from sqlalchemy.orm import relationship, DeclarativeBase
-from sqlalchemy.sql import func, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import cast, func, text, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+# JSONB no Postgres permite filtros por contenção (@>) indexados por GIN
+JSONList = JSON().with_variant(JSONB(), 'postgresql')
+
+
+def tags_with_token(tags, token_id):
+    """
+    Tags do scan mais o id do token (como número JSON): a listagem de um
+    token filtra por tag com `@> [tag, token_id]` em um único índice GIN,
+    sem percorrer todos os scans do token.
+    """
+    return type_coerce(tags.op('||')(cast(cast(token_id, Text), JSONB)), JSONB)
 
 
 class Base(DeclarativeBase):
@@ -18,12 +30,22 @@ class Token(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False, index=True)
     hashed_token = Column(String(255), nullable=False, unique=True)
+    # Identificador público embutido no token (ou digest, para tokens legados)
+    # usado para localizar a linha antes da única verificação argon2.
+    token_prefix = Column(String(64), nullable=True, unique=True, index=True)
     scopes = Column(JSON, nullable=False)
     expires_at = Column(DateTime, nullable=True)
     is_revoked = Column(Boolean, nullable=False, server_default='false')
     owner_username = Column(String(80), nullable=True, index=True)
     allowed_ips = Column(JSON, default=list)
     allowed_targets = Column(JSON, default=list)
+    # Peso do token no agendamento justo dos scans (ver services/fair_queue.py)
+    scan_weight = Column(Integer, nullable=False, server_default='1')
+    # Requisições por minuto por rota (nome do endpoint ou "default") e scans
+    # ativos simultâneos; nulos seguem os padrões da configuração
+    # (ver services/rate_limits.py)
+    rate_limits = Column(JSON, nullable=True)
+    max_active_scans = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     __table_args__ = (
@@ -42,14 +64,94 @@ class Scan(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     status = Column(String(50), nullable=False, server_default='queued')
     profile = Column(String(100), nullable=False)
-    targets = Column(JSON, nullable=False)
+    targets = Column(JSONList, nullable=False)
     ports = Column(String(255), nullable=True)
     notes = Column(Text, nullable=True)
     callback_url = Column(String(2048), nullable=True)
-    tags = Column(JSON, default=list)
+    tags = Column(JSONList, default=list)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     started_at = Column(DateTime(timezone=True), nullable=True)
     finished_at = Column(DateTime(timezone=True), nullable=True)
-    result_xml = Column(Text, nullable=True)
     token_id = Column(Integer, ForeignKey('tokens.id'))
+    # Scans grandes são divididos em shards executados em jobs separados;
+    # shard_count é nulo quando o scan roda em um único job.
+    shard_count = Column(Integer, nullable=True)
+    shards_finished = Column(Integer, nullable=False, server_default='0')
+    shards_failed = Column(Integer, nullable=False, server_default='0')
+    # Impressão digital do que o scan executa (ver services/result_cache.py)
+    # e, para scans atendidos pelo cache ou agrupados a um scan idêntico em
+    # execução, o scan cujo resultado foi (ou será) reaproveitado.
+    fingerprint = Column(String(64), nullable=True)
+    cached_from = Column(UUID(as_uuid=True), ForeignKey('scans.id', ondelete='SET NULL'), nullable=True)
+    # Referência de um rescan incremental (ver services/incremental.py)
+    baseline_id = Column(UUID(as_uuid=True), ForeignKey('scans.id', ondelete='SET NULL'), nullable=True)
+    # Hosts indexados em scan_hosts na ingestão (nulo: resultado ainda não indexado)
+    host_count = Column(Integer, nullable=True)
+    # "delta": o webhook leva só as diferenças em relação ao scan anterior
+    callback_mode = Column(String(10), nullable=True)
+    # Prioridade na fila (low/normal/high; nulo = normal)
+    priority = Column(String(10), nullable=True)
     token = relationship("Token")
+    results = relationship("ScanResult", lazy="noload", cascade="all, delete-orphan")
+
+    # Índices da listagem paginada por (created_at, id); ver routers/scans.py
+    __table_args__ = (
+        Index('ix_scans_created_at_id', created_at.desc(), id.desc()),
+        Index('ix_scans_token_created_at_id', token_id, created_at.desc(), id.desc()),
+        # Filtros por estado e por tag restritos ao token (listagem sem admin:read)
+        Index('ix_scans_token_status_created_at_id', token_id, status, created_at.desc(), id.desc()),
+        Index(
+            'ix_scans_token_active_created_at_id', token_id, created_at.desc(), id.desc(),
+            postgresql_where=text("status IN ('queued', 'running')")
+        ),
+        Index(
+            'ix_scans_token_tags', tags_with_token(tags, token_id).label('token_tags'),
+            postgresql_using='gin', postgresql_ops={'token_tags': 'jsonb_path_ops'}
+        ),
+        Index(
+            'ix_scans_active_created_at_id', created_at.desc(), id.desc(),
+            postgresql_where=text("status IN ('queued', 'running')")
+        ),
+        Index(
+            'ix_scans_failed_created_at_id', created_at.desc(), id.desc(),
+            postgresql_where=text("status = 'failed'")
+        ),
+        # Scans pendentes que aguardam o resultado de outro (ver services/tasks.py)
+        Index(
+            'ix_scans_pending_cached_from', cached_from,
+            postgresql_where=text("status IN ('queued', 'running')")
+        ),
+        # Scan anterior com a mesma impressão digital (webhooks "delta")
+        Index(
+            'ix_scans_fingerprint_finished_at', fingerprint, finished_at.desc(),
+            postgresql_where=text("status = 'succeeded'")
+        ),
+        Index('ix_scans_tags', tags, postgresql_using='gin', postgresql_ops={'tags': 'jsonb_path_ops'}),
+        Index('ix_scans_targets', targets, postgresql_using='gin', postgresql_ops={'targets': 'jsonb_path_ops'}),
+    )
+
+
+class ScanHost(Base):
+    """Impressão digital compacta de um host do resultado, para comparar scans (ver services/host_index.py)."""
+    __tablename__ = 'scan_hosts'
+
+    scan_id = Column(UUID(as_uuid=True), ForeignKey('scans.id', ondelete='CASCADE'), primary_key=True)
+    address = Column(String(255), primary_key=True)
+    status = Column(String(20), nullable=False)
+    digest = Column(String(64), nullable=False)
+    # {"ports": {"tcp/80": {"state", "service", "scripts"}}, "scripts": {...}}
+    data = Column(JSON, nullable=False)
+
+
+class ScanResult(Base):
+    """Metadados de um resultado armazenado fora da tabela `scans` (ver services/results.py)."""
+    __tablename__ = 'scan_results'
+
+    scan_id = Column(UUID(as_uuid=True), ForeignKey('scans.id', ondelete='CASCADE'), primary_key=True)
+    kind = Column(String(20), primary_key=True)
+    storage_key = Column(String(512), nullable=False)
+    encoding = Column(String(20), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    stored_size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
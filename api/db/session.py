@@ -1,13 +1,189 @@
+import os
+import threading
+import time
+from collections import deque
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ArgumentError, InvalidRequestError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
 from ..config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+
+class PoolMetrics:
+    """Tempo de espera por uma conexão livre e quantos checkouts estouraram o timeout."""
+
+    def __init__(self, samples: int = 1024):
+        self._lock = threading.Lock()
+        self._waits: deque[float] = deque(maxlen=samples)
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def record(self, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            self._waits.append(waited)
+            self.checkouts += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts, timeouts = self.checkouts, self.timeouts
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 3)
+
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "checkout_wait_ms_p50": percentile(0.50),
+            "checkout_wait_ms_p99": percentile(0.99),
+            "checkout_wait_ms_max": round(waits[-1] * 1000, 3) if waits else 0.0,
+        }
+
+
+class _InstrumentedPoolMixin:
+    # Atributo de classe: sobrevive ao `recreate()` que o SQLAlchemy faz no dispose()
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.record(time.perf_counter() - started, timed_out)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics = PoolMetrics()
+
+
+class InstrumentedAsyncPool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _async_database_url() -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+def _is_postgres(url: str) -> bool:
+    return make_url(url).get_backend_name() == "postgresql"
+
+
+_sync_connect_args = {}
+_async_connect_args = {}
+if settings.DB_STATEMENT_TIMEOUT_MS and _is_postgres(settings.DATABASE_URL):
+    _sync_connect_args = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    _async_connect_args = {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+
+# Engine síncrono: usado pelo worker RQ, pelos scripts e pela autenticação.
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    connect_args=_sync_connect_args,
+    **_pool_options(),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrono para os roteadores FastAPI de leitura. Criado no primeiro
+# uso: o worker e os scripts só usam o síncrono e não precisam de um driver
+# assíncrono para o DATABASE_URL.
+_async_engine: AsyncEngine | None = None
+_async_session_factory: async_sessionmaker | None = None
+_async_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_session_factory
+    with _async_lock:
+        if _async_engine is None:
+            url = _async_database_url()
+            try:
+                _async_engine = create_async_engine(
+                    url,
+                    poolclass=InstrumentedAsyncPool,
+                    connect_args=_async_connect_args,
+                    **_pool_options(),
+                )
+            except (ArgumentError, InvalidRequestError) as e:
+                raise RuntimeError(
+                    f"Sem driver assíncrono para '{make_url(url).drivername}'; defina DATABASE_ASYNC_URL "
+                    f"(ex.: postgresql+asyncpg://...) para os roteadores assíncronos: {e}"
+                ) from e
+            _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+        return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+def _reset_pool_after_fork() -> None:
+    # Conexões herdadas do processo pai (ex.: work-horse do RQ) não podem ser
+    # compartilhadas; o filho abandona o pool herdado sem fechá-las.
+    engine.dispose(close=False)
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def pool_stats() -> dict:
+    def describe(pool, metrics: PoolMetrics) -> dict:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        return {
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "checked_out": checked_out,
+            "overflow": pool.overflow(),
+            "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+            **metrics.snapshot(),
+        }
+
+    stats = {"sync": describe(engine.pool, InstrumentedQueuePool.metrics)}
+    if _async_engine is not None:
+        stats["async"] = describe(_async_engine.pool, InstrumentedAsyncPool.metrics)
+    return stats
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
@@ -1,7 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers import scans, admin, profiles
+from .routers import scans, admin, profiles, health
 from .config import settings
 from .security.ip_allowlist import IPAllowlistMiddleware
+from .db.session import dispose_async_engine, get_async_engine
+from .security.auth import auth_executor
+from .security.token_cache import start_revocation_listener
+from .services.tasks import redis_conn
+from .services.scan_events import async_redis
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Recebe revogações de tokens publicadas por qualquer réplica da API
+    listener = start_revocation_listener(redis_conn)
+    # Falha já na subida se o DATABASE_URL não tiver driver assíncrono
+    get_async_engine()
+    yield
+    if listener is not None:
+        listener.stop()
+    auth_executor.shutdown()
+    await async_redis.aclose()
+    await dispose_async_engine()
 
 app = FastAPI(
     title="autonmap-api",
@@ -9,6 +28,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs" if settings.DEBUG else None,
     redoc_url="/redoc" if settings.DEBUG else None,
+    lifespan=lifespan,
 )
 
 # Adiciona o middleware de Allowlist de IP
@@ -18,6 +38,7 @@ app.add_middleware(IPAllowlistMiddleware)
 app.include_router(scans.router)
 app.include_router(admin.router)
 app.include_router(profiles.router)
+app.include_router(health.router)
 
 @app.get("/", tags=["Root"])
 def read_root():
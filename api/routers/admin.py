@@ -2,13 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import List
-import secrets
 from datetime import datetime, timedelta, timezone
 
 from .. import schemas
 from ..db import models
 from ..db.session import get_db
 from ..security import auth
+from ..security.token_cache import publish_revocation
+from ..services.tasks import redis_conn
 
 router = APIRouter(prefix="/v1/tokens", tags=["Admin & Tokens"])
 
@@ -18,7 +19,7 @@ def create_token(
     db: Session = Depends(get_db),
     current_token: models.Token = Depends(auth.require_scope("admin:write"))
 ):
-    api_token = secrets.token_urlsafe(32)
+    api_token, token_prefix = auth.generate_api_token()
     hashed_token = auth.hash_token(api_token)
     
     expires_at = None
@@ -28,9 +29,13 @@ def create_token(
     db_token = models.Token(
         name=token_req.name,
         hashed_token=hashed_token,
+        token_prefix=token_prefix,
         scopes=token_req.scopes,
         expires_at=expires_at,
-        owner_username=token_req.owner_username
+        owner_username=token_req.owner_username,
+        scan_weight=token_req.scan_weight,
+        rate_limits=token_req.rate_limits,
+        max_active_scans=token_req.max_active_scans,
     )
     
     try:
@@ -57,6 +62,28 @@ def list_tokens(
     tokens = db.query(models.Token).filter(models.Token.is_revoked == False).all()
     return tokens
 
+@router.patch("/{token_id}/limits", response_model=schemas.TokenResponse)
+def update_token_limits(
+    token_id: int,
+    limits_req: schemas.TokenLimitsUpdateRequest,
+    db: Session = Depends(get_db),
+    current_token: models.Token = Depends(auth.require_scope("admin:write"))
+):
+    """Ajusta o peso, os limites de requisições e a cota de scans ativos do token."""
+    db_token = db.query(models.Token).filter(models.Token.id == token_id, models.Token.is_revoked == False).first()
+    if not db_token:
+        raise HTTPException(status_code=404, detail="Token not found")
+
+    for field, value in limits_req.model_dump(exclude_unset=True).items():
+        if field == "scan_weight" and value is None:
+            value = 1
+        setattr(db_token, field, value)
+    db.commit()
+    db.refresh(db_token)
+    # Tira o token dos caches das réplicas para que os novos limites valham já
+    publish_revocation(redis_conn, token_id)
+    return db_token
+
 @router.delete("/{token_id}", status_code=204)
 def revoke_token(
     token_id: int,
@@ -69,4 +96,5 @@ def revoke_token(
     
     db_token.is_revoked = True
     db.commit()
+    publish_revocation(redis_conn, token_id)
     return None
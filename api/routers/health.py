@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends
+
+from ..db import models
+from ..db.session import pool_stats
+from ..security import auth
+from ..security.token_cache import token_cache
+from ..services.result_cache import result_cache
+
+router = APIRouter(prefix="/v1/health", tags=["Health"])
+
+@router.get("/metrics")
+def get_metrics(
+    current_token: models.Token = Depends(auth.require_scope("admin:read"))
+):
+    """Contadores internos desta réplica da API."""
+    return {
+        "token_cache": token_cache.stats(),
+        "auth_executor": auth.auth_executor.stats(),
+        "db_pools": pool_stats(),
+        "result_cache": result_cache.stats(),
+    }
@@ -1,95 +1,762 @@
 import os
 import json
+import hashlib
+import base64
+import uuid
 import logging
-import xmltodict
-from typing import List
+from typing import List, Literal, Optional
+from datetime import datetime, timezone
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import insert, select, tuple_, type_coerce, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from .. import schemas
 from ..db import models
-from ..db.session import get_db
+from ..db.session import get_async_db, get_db
 from ..services import tasks as scan_tasks
+from ..services.fair_queue import priority_error, priority_rank
+from ..services.nmap_stream import iter_nmap_json, iter_nmap_ndjson
+from ..services.result_cache import result_cache, scan_fingerprint
+from ..services.host_index import copy_host_index
+from ..services.rate_limits import QUOTA_RETRY_AFTER_SECONDS, active_scan_limit, active_scan_quota
+from ..services.results import copy_result_rows, result_store
+from ..services.scan_diff import diff_scans, ensure_host_index
+from ..services.scan_events import (
+    TERMINAL_STATUSES, async_redis, event_state_key, events_channel, status_event,
+    wait_for_status_changes,
+)
+from ..services.sharding import parse_port_spec
+from ..services.singleflight import (
+    claim_idempotency_key, claim_scan, release_idempotency_key, scan_in_flight,
+)
 from ..security import auth
 
 router = APIRouter(prefix="/v1/scans", tags=["Scans"])
 logger = logging.getLogger(__name__)
 
+RESULT_MEDIA_TYPES = {
+    "xml": "application/xml",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+# Autenticado, logo "private"; o conteúdo de um resultado nunca muda
+RESULT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Comentário enviado no stream SSE quando não há eventos, para manter a
+# conexão viva através de proxies (o nginx encerra após 300s sem dados)
+SSE_KEEPALIVE_SECONDS = 15
+
+# Tempo máximo de espera dos endpoints /wait (abaixo do proxy_read_timeout do nginx)
+WAIT_MAX_SECONDS = 120
+WAIT_MAX_SCANS = 100
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+def _can_read(token: models.Token, scan: models.Scan) -> bool:
+    """Tokens sem escopo admin:read só acessam os próprios scans."""
+    return "admin:read" in token.scopes or scan.token_id == token.id
+
+def _accepts_gzip(accept_encoding: str | None) -> bool:
+    if not accept_encoding:
+        return False
+    codings = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip()] = q
+    return codings.get("gzip", codings.get("*", 0.0)) > 0
+
+def _convert_stored_xml(storage_key: str, converter):
+    """Converte o XML armazenado em blocos; roda no threadpool do StreamingResponse."""
+    with result_store.open(storage_key) as f:
+        yield from converter(f)
+
+def _targets_error(targets: list[str], token: models.Token) -> str | None:
+    rejected = token.target_policy.disallowed(targets)
+    if rejected:
+        return f"Targets not allowed for this API Token: {', '.join(rejected)}"
+    return None
+
+def _ports_error(scan_req: schemas.ScanCreateRequest) -> str | None:
+    if not scan_req.port_shards:
+        return None
+    if not scan_req.ports:
+        return "port_shards requires an explicit ports specification"
+    try:
+        parse_port_spec(scan_req.ports)
+    except ValueError:
+        return f"Invalid ports specification: {scan_req.ports}"
+    return None
+
+def _same_ports(a: str | None, b: str | None) -> bool:
+    if not a or not b:
+        return not a and not b
+    try:
+        return set(parse_port_spec(a)) == set(parse_port_spec(b))
+    except ValueError:
+        return a == b
+
+def _baseline_error(db: Session, scan_req: schemas.ScanCreateRequest, token: models.Token) -> str | None:
+    if not scan_req.baseline_id:
+        if scan_req.baseline_max_age is not None:
+            return "baseline_max_age requires baseline_id"
+        return None
+    if scan_req.port_shards:
+        return "port_shards cannot be combined with baseline_id"
+    baseline = db.get(models.Scan, scan_req.baseline_id)
+    if not baseline or not _can_read(token, baseline):
+        return f"Baseline scan not found: {scan_req.baseline_id}"
+    if baseline.status != "succeeded":
+        return f"Baseline scan has not succeeded: {scan_req.baseline_id}"
+    if baseline.profile != scan_req.profile.value or not _same_ports(baseline.ports, scan_req.ports):
+        return "Baseline scan must use the same profile and ports"
+    return None
+
+def _fingerprint(scan_req: schemas.ScanCreateRequest, token: models.Token) -> str:
+    return scan_fingerprint(
+        token.id, scan_req.targets, scan_req.profile.value, scan_req.ports, scan_req.timing_template.value,
+        scan_req.baseline_id, scan_req.baseline_max_age,
+    )
+
+def _cached_results(db: Session, scan_req: schemas.ScanCreateRequest, fingerprint: str):
+    """
+    Com `max_age`, procura um scan idêntico bem-sucedido recente. Retorna
+    (id do scan de origem, linhas de resultado dele) ou None.
+    """
+    if scan_req.max_age is None:
+        return None
+
+    found: list[models.ScanResult] = []
+
+    def is_valid(scan_id: str) -> bool:
+        found[:] = db.query(models.ScanResult).filter(
+            models.ScanResult.scan_id == UUID(scan_id),
+            models.ScanResult.kind.in_(("xml", "json")),
+        ).all()
+        return len(found) == 2
+
+    source_id = result_cache.lookup(scan_tasks.redis_conn, fingerprint, scan_req.max_age, is_valid)
+    return (UUID(source_id), found) if source_id else None
+
+def _attach_to_pending(db: Session, scans: list[tuple[UUID, str, str]]) -> set[UUID]:
+    """
+    Agrupa cada scan recém-criado (já gravado) a um scan idêntico ainda
+    pendente, se houver: o scan não é enfileirado e recebe o desfecho do
+    outro quando ele terminar (ver tasks._complete_scan). Um scan de
+    prioridade maior que a do pendente executa sozinho, para não esperar na
+    fila do outro. Retorna os ids agrupados.
+    """
+    followers: dict[UUID, tuple[UUID, str]] = {}
+    priorities: dict[UUID, str] = {}
+    for scan_id, fingerprint, priority in scans:
+        leader_id = claim_scan(scan_tasks.redis_conn, fingerprint, scan_id)
+        if leader_id:
+            followers[scan_id] = (leader_id, fingerprint)
+            priorities[scan_id] = priority
+    if not followers:
+        return set()
+
+    leader_priorities = dict(db.execute(
+        select(models.Scan.id, models.Scan.priority)
+        .where(models.Scan.id.in_({leader_id for leader_id, _ in followers.values()}))
+    ).all())
+    for scan_id, (leader_id, _) in list(followers.items()):
+        if priority_rank(priorities[scan_id]) < priority_rank(leader_priorities.get(leader_id)):
+            del followers[scan_id]
+    if not followers:
+        return set()
+
+    db.execute(update(models.Scan), [
+        {"id": scan_id, "cached_from": leader_id} for scan_id, (leader_id, _) in followers.items()
+    ])
+    db.commit()
+
+    # Se o líder terminou antes do UPDATE acima, ninguém entregará o
+    # resultado: o scan deixa o grupo e executa sozinho. Se o líder já o
+    # concluiu, o UPDATE condicional não encontra nada e o grupo se mantém.
+    for scan_id, (leader_id, fingerprint) in list(followers.items()):
+        if scan_in_flight(scan_tasks.redis_conn, fingerprint, leader_id):
+            continue
+        detached = db.execute(
+            update(models.Scan)
+            .where(
+                models.Scan.id == scan_id,
+                models.Scan.cached_from == leader_id,
+                models.Scan.status.in_(('queued', 'running')),
+            )
+            .values(cached_from=None)
+        ).rowcount
+        if detached:
+            del followers[scan_id]
+    db.commit()
+    return set(followers)
+
+def _quota_error(token: models.Token) -> str:
+    return f"Active scan quota exceeded: at most {active_scan_limit(token)} scans queued or running per API Token."
+
+def _request_hash(scan_req: schemas.ScanCreateRequest) -> str:
+    return hashlib.sha256(scan_req.model_dump_json().encode("utf-8")).hexdigest()
+
 @router.post("/", response_model=schemas.ScanResponse, status_code=202)
 def create_scan(
     scan_req: schemas.ScanCreateRequest,
+    response: Response,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    token: models.Token = Depends(auth.require_scope("scan:write"))
+    token: models.Token = Depends(auth.require_scope("scan:write")),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    """
+    Cria um scan. Com o cabeçalho Idempotency-Key, repetições da mesma
+    requisição pelo mesmo token devolvem o scan criado na primeira.
+    """
+    targets_error = _targets_error(scan_req.targets, token) or priority_error(scan_req.priority, token.scopes)
+    if targets_error:
+        raise HTTPException(status_code=403, detail=targets_error)
+    ports_error = _ports_error(scan_req) or _baseline_error(db, scan_req, token)
+    if ports_error:
+        raise HTTPException(status_code=422, detail=ports_error)
+
+    scan_id = uuid.uuid4()
+    if not idempotency_key:
+        return _create_scan(scan_req, scan_id, response, background_tasks, db, token)
+
+    request_hash = _request_hash(scan_req)
+    original = claim_idempotency_key(
+        scan_tasks.redis_conn, token.id, idempotency_key, scan_id, request_hash
+    )
+    if original:
+        if original["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request.")
+        db_scan = db.get(models.Scan, UUID(original["scan_id"]))
+        if not db_scan:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed.")
+        response.status_code = 200
+        response.headers["Idempotent-Replayed"] = "true"
+        return db_scan
+
+    try:
+        return _create_scan(scan_req, scan_id, response, background_tasks, db, token)
+    except Exception:
+        release_idempotency_key(scan_tasks.redis_conn, token.id, idempotency_key, scan_id)
+        raise
+
+def _create_scan(
+    scan_req: schemas.ScanCreateRequest,
+    scan_id: UUID,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: Session,
+    token: models.Token,
 ):
+    fingerprint = _fingerprint(scan_req, token)
     db_scan = models.Scan(
+        id=scan_id,
         profile=scan_req.profile.value,
         targets=scan_req.targets,
         ports=scan_req.ports,
         notes=scan_req.notes,
         callback_url=str(scan_req.callback_url) if scan_req.callback_url else None,
         tags=scan_req.tags,
-        token_id=token.id
-    )
-    db.add(db_scan)
-    db.commit()
-    db.refresh(db_scan)
-
-    scan_tasks.create_scan_task(
-        scan_id=str(db_scan.id),
-        targets=db_scan.targets,
-        profile=db_scan.profile,
-        ports=db_scan.ports,
-        timing_template=scan_req.timing_template.value,
-        callback_url=db_scan.callback_url
+        token_id=token.id,
+        fingerprint=fingerprint,
+        baseline_id=scan_req.baseline_id,
+        callback_mode=scan_req.callback_mode,
+        priority=scan_req.priority,
     )
+
+    cached = _cached_results(db, scan_req, fingerprint)
+    if cached:
+        source_id, source_results = cached
+        now = datetime.now(timezone.utc)
+        db_scan.status = 'succeeded'
+        db_scan.started_at = db_scan.finished_at = now
+        db_scan.cached_from = source_id
+        db.add(db_scan)
+        db.flush()
+        db.execute(insert(models.ScanResult), copy_result_rows(db_scan.id, source_results))
+        copy_host_index(db, source_id, db_scan.id)
+        db.commit()
+        db.refresh(db_scan)
+        if db_scan.callback_url:
+            background_tasks.add_task(scan_tasks.send_cached_result_webhook, db_scan.id, db_scan.callback_url)
+        logger.info(f"Scan {db_scan.id} atendido pelo cache (resultado de {source_id}) para token {token.id}")
+        response.status_code = 200
+        return db_scan
+
+    if not active_scan_quota.acquire(scan_tasks.redis_conn, token, [scan_id]):
+        raise HTTPException(
+            status_code=429,
+            detail=_quota_error(token),
+            headers={"Retry-After": str(QUOTA_RETRY_AFTER_SECONDS)},
+        )
+
+    try:
+        db.add(db_scan)
+        db.commit()
+
+        if _attach_to_pending(db, [(db_scan.id, fingerprint, scan_req.priority)]):
+            db.refresh(db_scan)
+            logger.info(f"Scan {db_scan.id} agrupado ao scan idêntico {db_scan.cached_from} para token {token.id}")
+            return db_scan
+
+        db.refresh(db_scan)
+        scan_tasks.create_scan_task(
+            scan_id=str(db_scan.id),
+            targets=db_scan.targets,
+            profile=db_scan.profile,
+            ports=db_scan.ports,
+            timing_template=scan_req.timing_template.value,
+            callback_url=db_scan.callback_url,
+            port_shards=scan_req.port_shards,
+            baseline_id=str(scan_req.baseline_id) if scan_req.baseline_id else None,
+            baseline_max_age=scan_req.baseline_max_age,
+            token_id=token.id,
+            priority=scan_req.priority,
+            weight=token.scan_weight,
+        )
+    except Exception:
+        active_scan_quota.release(scan_tasks.redis_conn, [(token.id, scan_id)])
+        raise
     
     logger.info(f"Scan {db_scan.id} enfileirado por token {token.id}")
-    return db_scan
+    return _with_queue_estimates(schemas.ScanResponse, [db_scan])[0]
 
-@router.get("/", response_model=List[schemas.ScanResponse])
-def list_scans(
+@router.post("/batch", response_model=schemas.ScanBatchResponse, status_code=202)
+def create_scan_batch(
+    batch_req: schemas.ScanBatchRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
+    token: models.Token = Depends(auth.require_scope("scan:write"))
+):
+    """
+    Cria vários scans de uma vez: valida cada item individualmente, insere os
+    válidos em um único INSERT multi-linha e os enfileira em um único
+    pipeline Redis. Itens inválidos são reportados sem afetar os demais.
+    Itens com `max_age` atendidos pelo cache já nascem concluídos; itens
+    idênticos a um scan pendente aguardam o resultado dele. Itens além da
+    cota de scans ativos do token são recusados.
+    """
+    results: list[schemas.ScanBatchItemResult] = []
+    rows: list[dict] = []
+    result_rows: list[dict] = []
+    jobs: list[dict] = []
+    pending: list[tuple[UUID, str, str]] = []
+    index_copies: list[tuple[UUID, UUID]] = []
+    webhooks: list[tuple[UUID, str]] = []
+    now = datetime.now(timezone.utc)
+
+    for index, raw_item in enumerate(batch_req.scans):
+        try:
+            scan_req = schemas.ScanCreateRequest.model_validate(raw_item)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            results.append(schemas.ScanBatchItemResult(index=index, error=errors))
+            continue
+
+        targets_error = _targets_error(scan_req.targets, token) or priority_error(scan_req.priority, token.scopes)
+        if targets_error:
+            results.append(schemas.ScanBatchItemResult(index=index, error=targets_error))
+            continue
+        ports_error = _ports_error(scan_req) or _baseline_error(db, scan_req, token)
+        if ports_error:
+            results.append(schemas.ScanBatchItemResult(index=index, error=ports_error))
+            continue
+
+        scan_id = uuid.uuid4()
+        callback_url = str(scan_req.callback_url) if scan_req.callback_url else None
+        fingerprint = _fingerprint(scan_req, token)
+        cached = _cached_results(db, scan_req, fingerprint)
+        # Todas as linhas precisam das mesmas colunas no INSERT multi-linha
+        rows.append({
+            "id": scan_id,
+            "status": "succeeded" if cached else "queued",
+            "profile": scan_req.profile.value,
+            "targets": scan_req.targets,
+            "ports": scan_req.ports,
+            "notes": scan_req.notes,
+            "callback_url": callback_url,
+            "tags": scan_req.tags,
+            "token_id": token.id,
+            "fingerprint": fingerprint,
+            "cached_from": cached[0] if cached else None,
+            "baseline_id": scan_req.baseline_id,
+            "callback_mode": scan_req.callback_mode,
+            "priority": scan_req.priority,
+            "started_at": now if cached else None,
+            "finished_at": now if cached else None,
+        })
+        if cached:
+            result_rows.extend(copy_result_rows(scan_id, cached[1]))
+            index_copies.append((cached[0], scan_id))
+            if callback_url:
+                webhooks.append((scan_id, callback_url))
+            results.append(schemas.ScanBatchItemResult(index=index, id=scan_id, status="succeeded"))
+            continue
+
+        pending.append((scan_id, fingerprint, scan_req.priority))
+        jobs.append({
+            "scan_id": str(scan_id),
+            "targets": scan_req.targets,
+            "profile": scan_req.profile.value,
+            "ports": scan_req.ports,
+            "timing_template": scan_req.timing_template.value,
+            "callback_url": callback_url,
+            "port_shards": scan_req.port_shards,
+            "baseline_id": str(scan_req.baseline_id) if scan_req.baseline_id else None,
+            "baseline_max_age": scan_req.baseline_max_age,
+            "priority": scan_req.priority,
+        })
+        results.append(schemas.ScanBatchItemResult(index=index, id=scan_id, status="queued"))
+
+    # Itens além da cota de scans ativos do token são recusados, na ordem do lote
+    admitted = active_scan_quota.acquire(scan_tasks.redis_conn, token, [scan_id for scan_id, _, _ in pending])
+    if admitted < len(pending):
+        over_quota = {scan_id for scan_id, _, _ in pending[admitted:]}
+        pending = pending[:admitted]
+        rows = [row for row in rows if row["id"] not in over_quota]
+        jobs = [job for job in jobs if UUID(job["scan_id"]) not in over_quota]
+        results = [
+            schemas.ScanBatchItemResult(index=result.index, error=_quota_error(token))
+            if result.id in over_quota else result
+            for result in results
+        ]
+
+    if rows:
+        try:
+            db.execute(insert(models.Scan), rows)
+            if result_rows:
+                db.execute(insert(models.ScanResult), result_rows)
+            for source_id, scan_id in index_copies:
+                copy_host_index(db, source_id, scan_id)
+            db.commit()
+            # Itens idênticos a scans pendentes (inclusive deste lote) não são enfileirados
+            attached = {str(scan_id) for scan_id in _attach_to_pending(db, pending)}
+            jobs = [job for job in jobs if job["scan_id"] not in attached]
+            if jobs:
+                scan_tasks.create_scan_tasks(jobs, token.id, token.scan_weight)
+        except Exception:
+            active_scan_quota.release(scan_tasks.redis_conn, [(token.id, scan_id) for scan_id, _, _ in pending])
+            raise
+        for scan_id, callback_url in webhooks:
+            background_tasks.add_task(scan_tasks.send_cached_result_webhook, scan_id, callback_url)
+
+    logger.info(f"Lote de {len(rows)} scans enfileirado por token {token.id} ({len(results) - len(rows)} rejeitados)")
+    return schemas.ScanBatchResponse(accepted=len(rows), rejected=len(results) - len(rows), results=results)
+
+def _with_queue_estimates(schema: type[schemas.ScanResponse], scans: list[models.Scan]) -> list[schemas.ScanResponse]:
+    """Scans na resposta, com posição e início estimado dos que aguardam na fila."""
+    queued = [str(scan.id) for scan in scans if scan.status == "queued" and not scan.cached_from]
+    try:
+        estimates = scan_tasks.q.estimates(queued) if queued else {}
+    except RedisError as e:
+        logger.warning(f"Falha ao estimar a posição dos scans na fila: {e}")
+        estimates = {}
+    responses = []
+    for scan in scans:
+        response = schema.model_validate(scan)
+        if str(scan.id) in estimates:
+            position, start = estimates[str(scan.id)]
+            response = response.model_copy(update={"queue_position": position, "estimated_start_at": start})
+        responses.append(response)
+    return responses
+
+def _encode_cursor(scan: models.Scan) -> str:
+    raw = f"{scan.created_at.isoformat()}|{scan.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, scan_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(scan_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+@router.get("/", response_model=List[schemas.ScanResponse])
+async def list_scans(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     token: models.Token = Depends(auth.require_scope("scan:read")),
-    skip: int = 0,
-    limit: int = 100
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor da página anterior."),
+    skip: int = Query(0, ge=0, deprecated=True, description="Obsoleto: o custo cresce com o deslocamento; use `cursor`."),
+    status: Optional[List[str]] = Query(None),
+    profile: Optional[schemas.ScanProfile] = None,
+    tag: Optional[str] = None,
+    target: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    finished_after: Optional[datetime] = None,
+    finished_before: Optional[datetime] = None,
 ):
-    scans = db.query(models.Scan).order_by(models.Scan.created_at.desc()).offset(skip).limit(limit).all()
-    return scans
+    """
+    Lista scans do mais novo para o mais antigo com paginação por cursor
+    sobre (created_at, id). Tokens sem escopo admin:read só veem os próprios.
+    `skip` (OFFSET) continua aceito por compatibilidade e pode ser combinado
+    com o cursor; respostas que o usam trazem o cabeçalho Deprecation.
+    """
+    query = select(models.Scan)
+
+    scoped = "admin:read" not in token.scopes
+    if scoped:
+        query = query.where(models.Scan.token_id == token.id)
+    if status:
+        query = query.where(models.Scan.status.in_(status))
+    if profile:
+        query = query.where(models.Scan.profile == profile.value)
+    if tag and scoped:
+        # Casa com o índice ix_scans_token_tags (tags + id do token)
+        query = query.where(models.tags_with_token(models.Scan.tags, models.Scan.token_id).contains([tag, token.id]))
+    elif tag:
+        query = query.where(type_coerce(models.Scan.tags, JSONB).contains([tag]))
+    if target:
+        query = query.where(type_coerce(models.Scan.targets, JSONB).contains([target]))
+    if created_after:
+        query = query.where(models.Scan.created_at >= created_after)
+    if created_before:
+        query = query.where(models.Scan.created_at < created_before)
+    if finished_after:
+        query = query.where(models.Scan.finished_at >= finished_after)
+    if finished_before:
+        query = query.where(models.Scan.finished_at < finished_before)
+    if cursor:
+        query = query.where(tuple_(models.Scan.created_at, models.Scan.id) < tuple_(*_decode_cursor(cursor)))
+
+    query = query.order_by(models.Scan.created_at.desc(), models.Scan.id.desc())
+    if skip:
+        query = query.offset(skip)
+        response.headers["Deprecation"] = "true"
+    result = await db.execute(query.limit(limit + 1))
+    scans = result.scalars().all()
+
+    if len(scans) > limit:
+        scans = scans[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(scans[-1])
+    return await run_in_threadpool(_with_queue_estimates, schemas.ScanResponse, scans)
+
+async def _wait_for_scans(
+    db: AsyncSession, token: models.Token, ids: list[UUID], mode: str, timeout: int
+) -> list[models.Scan]:
+    """
+    Devolve os scans assim que `mode` ("any" ou "all") deles estiver em
+    estado final, ou no fim do `timeout`. A espera é acordada pelos eventos
+    de status publicados pelo worker no Redis, sem reconsultar o banco.
+    Scans de outros tokens contam como inexistentes.
+    """
+    ids = list(dict.fromkeys(ids))
+    result = await db.execute(select(models.Scan).where(models.Scan.id.in_(ids)))
+    scans_by_id = {scan.id: scan for scan in result.scalars() if _can_read(token, scan)}
+    missing = [str(scan_id) for scan_id in ids if scan_id not in scans_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Scan not found: {', '.join(missing)}")
+
+    check = any if mode == "any" else all
+    done = lambda statuses: check(status in TERMINAL_STATUSES for status in statuses.values())
+    statuses = {str(scan_id): scans_by_id[scan_id].status for scan_id in ids}
+
+    if timeout and not done(statuses):
+        # Encerra a transação para não segurar uma conexão do pool durante a espera
+        await db.commit()
+        await wait_for_status_changes(ids, statuses, done, timeout)
+        result = await db.execute(
+            select(models.Scan).where(models.Scan.id.in_(ids)).execution_options(populate_existing=True)
+        )
+        scans_by_id.update({scan.id: scan for scan in result.scalars()})
+
+    return [scans_by_id[scan_id] for scan_id in ids if scan_id in scans_by_id]
+
+@router.get("/wait", response_model=List[schemas.ScanResultResponse])
+async def wait_for_scans(
+    ids: List[UUID] = Query(..., min_length=1, max_length=WAIT_MAX_SCANS),
+    mode: Literal["any", "all"] = Query("all", description="Retorna quando qualquer um ('any') ou todos ('all') terminarem."),
+    timeout: int = Query(60, ge=0, le=WAIT_MAX_SECONDS),
+    db: AsyncSession = Depends(get_async_db),
+    token: models.Token = Depends(auth.require_scope("scan:read"))
+):
+    """Long-poll de vários scans; a resposta traz o estado atual de todos eles."""
+    return await _wait_for_scans(db, token, ids, mode, timeout)
 
 @router.get("/{id}", response_model=schemas.ScanResultResponse)
-def get_scan_details(
+async def get_scan_details(
+    id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+    token: models.Token = Depends(auth.require_scope("scan:read"))
+):
+    db_scan = await db.get(models.Scan, id)
+    if not db_scan or not _can_read(token, db_scan):
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return (await run_in_threadpool(_with_queue_estimates, schemas.ScanResultResponse, [db_scan]))[0]
+
+@router.get("/{id}/diff/{other_id}", response_model=schemas.ScanDiffResponse)
+def get_scan_diff(
     id: UUID,
+    other_id: UUID,
     db: Session = Depends(get_db),
     token: models.Token = Depends(auth.require_scope("scan:read"))
 ):
-    db_scan = db.query(models.Scan).filter(models.Scan.id == id).first()
-    if not db_scan:
+    """
+    O que mudou de `id` para `other_id`: hosts novos e removidos, portas
+    abertas e fechadas, versões de serviço e achados de scripts alterados.
+    Calculado a partir do índice de hosts gravado na ingestão; resultados
+    anteriores a ele são indexados na primeira comparação.
+    """
+    for scan_id in (id, other_id):
+        db_scan = db.get(models.Scan, scan_id)
+        if not db_scan or not _can_read(token, db_scan):
+            raise HTTPException(status_code=404, detail=f"Scan not found: {scan_id}")
+        if not ensure_host_index(db, db_scan):
+            raise HTTPException(status_code=409, detail=f"Scan has no result to compare: {scan_id}")
+    return diff_scans(db, id, other_id)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _scan_event_stream(scan_id: UUID, initial_status: dict):
+    """
+    Emite o estado atual do scan e, em seguida, os eventos publicados pelo
+    worker até o scan terminar. A inscrição acontece antes da leitura do
+    último estado no Redis, então nenhuma transição se perde entre os dois.
+    """
+    pubsub = async_redis.pubsub()
+    await pubsub.subscribe(events_channel(scan_id))
+    try:
+        stored_status, stored_progress = await async_redis.mget(
+            event_state_key(scan_id, "status"), event_state_key(scan_id, "progress")
+        )
+        status = json.loads(stored_status)["data"] if stored_status else initial_status
+        yield "retry: 5000\n" + _sse("status", status)
+        if status["status"] in TERMINAL_STATUSES:
+            return
+        if stored_progress:
+            yield _sse("progress", json.loads(stored_progress)["data"])
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            payload = json.loads(message["data"])
+            yield _sse(payload["event"], payload["data"])
+            if payload["event"] == "status" and payload["data"]["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+@router.get("/{id}/wait", response_model=schemas.ScanResultResponse)
+async def wait_for_scan(
+    id: UUID,
+    timeout: int = Query(60, ge=0, le=WAIT_MAX_SECONDS),
+    db: AsyncSession = Depends(get_async_db),
+    token: models.Token = Depends(auth.require_scope("scan:read"))
+):
+    """
+    Long-poll: responde quando o scan chega a "succeeded"/"failed" ou após
+    `timeout` segundos, com o estado atual do scan em ambos os casos.
+    """
+    scans = await _wait_for_scans(db, token, [id], "all", timeout)
+    return scans[0]
+
+@router.get("/{id}/events")
+async def stream_scan_events(
+    id: UUID,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    token: models.Token = Depends(auth.require_scope("scan:read"))
+):
+    """
+    Server-Sent Events com o andamento do scan: eventos "status" (mudanças
+    de estado e de shards) e "progress" (percentual, ETC, hosts concluídos e
+    portas abertas, lidos da saída do Nmap). O stream termina quando o scan
+    chega a "succeeded" ou "failed".
+    """
+    db_scan = await db.get(models.Scan, id)
+    if not db_scan or not _can_read(token, db_scan):
         raise HTTPException(status_code=404, detail="Scan not found")
-    return db_scan
+
+    return StreamingResponse(
+        _scan_event_stream(id, status_event(db_scan)),
+        media_type="text/event-stream",
+        headers={**response.headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/{id}/result.{format}")
-def get_scan_result(
+async def get_scan_result(
     id: UUID,
     format: str,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     token: models.Token = Depends(auth.require_scope("scan:read"))
 ):
-    if format not in ["json", "xml"]:
-        raise HTTPException(status_code=400, detail="Invalid format. Use 'json' or 'xml'.")
+    """
+    Resultados de scans concluídos nunca mudam: respondem com ETag forte
+    (digest armazenado), 304 para If-None-Match sem tocar no resultado e,
+    quando o cliente aceita gzip, com a cópia já compactada do armazenamento.
+    """
+    if format not in RESULT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'json', 'ndjson' or 'xml'.")
 
-    db_scan = db.query(models.Scan).filter(models.Scan.id == id).first()
-    if not db_scan:
+    db_scan = await db.get(models.Scan, id)
+    if not db_scan or not _can_read(token, db_scan):
         raise HTTPException(status_code=404, detail="Scan not found")
-    if db_scan.status != 'succeeded':
+    if db_scan.status not in TERMINAL_STATUSES:
         raise HTTPException(status_code=409, detail=f"Scan result not available. Status is '{db_scan.status}'.")
 
-    if not db_scan.result_xml:
-        raise HTTPException(status_code=404, detail="Scan result data not found in database.")
+    stored = await db.get(models.ScanResult, (id, format))
+    # NDJSON (e o JSON de scans antigos) é gerado host a host a partir do XML
+    source = stored or await db.get(models.ScanResult, (id, "xml"))
+    if source is None:
+        if db_scan.status != 'succeeded':
+            raise HTTPException(status_code=409, detail=f"Scan result not available. Status is '{db_scan.status}'.")
+        raise HTTPException(status_code=404, detail="Scan result data not found.")
 
-    if format == "xml":
-        return Response(content=db_scan.result_xml, media_type="application/xml")
-    
-    if format == "json":
-        data_dict = xmltodict.parse(db_scan.result_xml)
-        return Response(content=json.dumps(data_dict), media_type="application/json")
+    # A ETag é a da representação que vai ser enviada: a cópia compactada tem a sua
+    gzipped = stored is not None and stored.encoding == "gzip" and _accepts_gzip(request.headers.get("accept-encoding"))
+    etag = stored.sha256 if stored else f"{source.sha256}-{format}"
+    if gzipped:
+        etag = f"{etag}-gzip"
+    # Respostas devolvidas diretamente não herdam os cabeçalhos das dependências (X-RateLimit-*)
+    headers = {**response.headers, "Cache-Control": RESULT_CACHE_CONTROL, "Vary": "Accept-Encoding", "ETag": f'"{etag}"'}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = RESULT_MEDIA_TYPES[format]
+    if not stored:
+        converter = iter_nmap_ndjson if format == "ndjson" else iter_nmap_json
+        return StreamingResponse(
+            _convert_stored_xml(source.storage_key, converter), media_type=media_type, headers=headers
+        )
+
+    if gzipped:
+        headers.update({"Content-Encoding": "gzip", "Content-Length": str(stored.stored_size)})
+        return StreamingResponse(result_store.iter_raw_chunks(stored.storage_key), media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(stored.size)
+    return StreamingResponse(result_store.iter_chunks(stored.storage_key), media_type=media_type, headers=headers)
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel, Field, HttpUrl
-from typing import List, Optional
+from typing import Annotated, Any, Dict, List, Literal, Optional
 from uuid import UUID
 import datetime
 
@@ -36,11 +36,33 @@ class ScanCreateRequest(BaseModel):
     ports: Optional[str] = Field(None, description="Ex: '1-1024' ou '80,443'. Se omitido, usa as portas padrão do Nmap.", pattern=r"^[0-9,-]+$")
     
     timing_template: Optional[TimingTemplate] = Field(TimingTemplate.T3, description="Velocidade e agressividade do scan (T0 a T5). Padrão: T3.")
+    port_shards: Optional[int] = Field(None, ge=2, le=32, description="Divide `ports` em N partes executadas em paralelo (ex.: para '1-65535'). Requer `ports`.")
+    max_age: Optional[int] = Field(None, ge=0, description="Reaproveita o resultado de um scan idêntico do mesmo token concluído há no máximo N segundos, sem executar o Nmap.")
+    baseline_id: Optional[UUID] = Field(None, description="Rescan incremental: executa o perfil só nos hosts que mudaram desde este scan (mesmo perfil e portas).")
+    baseline_max_age: Optional[int] = Field(None, ge=0, description="Com `baseline_id`, reexamina também hosts cuja entrada na referência tem mais de N segundos.")
     
     notes: Optional[str] = Field(None, max_length=512)
     callback_url: Optional[HttpUrl] = None
+    callback_mode: Literal["full", "delta"] = Field("full", description="'delta' envia ao callback_url só as diferenças em relação à referência (baseline_id) ou ao último scan idêntico.")
+    priority: Literal["low", "normal", "high"] = Field("normal", description="Prioridade na fila. 'high' requer o escopo scan:priority:high.")
     tags: Optional[List[str]] = []
 
+# --- Modelos de Lote de Scans ---
+class ScanBatchRequest(BaseModel):
+    # Itens validados um a um no endpoint para que erros sejam reportados por item
+    scans: List[Dict[str, Any]] = Field(..., min_length=1, max_length=1000, description="Itens no formato de ScanCreateRequest.")
+
+class ScanBatchItemResult(BaseModel):
+    index: int
+    id: Optional[UUID] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+class ScanBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[ScanBatchItemResult]
+
 # --- Modelos de Resposta de Scan ---
 class ScanResponse(BaseModel):
     id: UUID
@@ -48,19 +70,71 @@ class ScanResponse(BaseModel):
     profile: ScanProfile
     targets: List[str]
     created_at: datetime.datetime
+    priority: Optional[str] = None
+    queue_position: Optional[int] = Field(None, description="Jobs à frente deste na fila, enquanto aguarda")
+    estimated_start_at: Optional[datetime.datetime] = Field(None, description="Início estimado pela duração recente dos jobs e vagas dos workers")
     class Config:
         from_attributes = True
 
 class ScanResultResponse(ScanResponse):
     started_at: Optional[datetime.datetime]
     finished_at: Optional[datetime.datetime]
+    shard_count: Optional[int] = Field(None, description="Número de shards, quando o scan foi dividido")
+    shards_finished: int = 0
+    shards_failed: int = 0
+    cached_from: Optional[UUID] = Field(None, description="Scan cujo resultado foi reaproveitado (max_age) ou aguardado (scan idêntico pendente)")
+    baseline_id: Optional[UUID] = Field(None, description="Scan de referência de um rescan incremental")
+
+# --- Modelos de Comparação de Scans ---
+class HostAdded(BaseModel):
+    address: str
+    open_ports: List[str]
+
+class ServiceChange(BaseModel):
+    port: str
+    before: Optional[str]
+    after: Optional[str]
+
+class ScriptChange(BaseModel):
+    port: Optional[str] = Field(None, description="Nulo para scripts de host")
+    id: str
+    change: Literal["added", "removed", "changed"]
+
+class HostChange(BaseModel):
+    address: str
+    ports_opened: List[str]
+    ports_closed: List[str]
+    services_changed: List[ServiceChange]
+    scripts_changed: List[ScriptChange]
+
+class ScanDiffResponse(BaseModel):
+    before: Optional[UUID]
+    after: UUID
+    hosts_added: List[HostAdded]
+    hosts_removed: List[str]
+    hosts_changed: List[HostChange]
+    hosts_unchanged: int
 
 # --- Schemas de Token ---
+# Requisições por minuto de uma rota; 0 = sem limite
+RouteRateLimit = Annotated[int, Field(ge=0)]
+
 class TokenCreateRequest(BaseModel):
     name: str = Field(..., description="Um nome legível para o token")
     scopes: List[str] = Field(..., description="Lista de permissões")
     expires_in_days: Optional[int] = Field(30, description="Duração do token em dias")
     owner_username: Optional[str] = Field(None, description="Username do usuário do painel que é dono do token")
+    scan_weight: int = Field(1, ge=1, le=100, description="Peso do token no agendamento justo dos scans")
+    rate_limits: Optional[Dict[str, RouteRateLimit]] = Field(
+        None, description="Requisições por minuto por rota (nome do endpoint ou 'default'); 0 = sem limite"
+    )
+    max_active_scans: Optional[int] = Field(None, ge=0, description="Scans ativos simultâneos; 0 = sem limite")
+
+class TokenLimitsUpdateRequest(BaseModel):
+    # Só os campos enviados são alterados; null volta ao padrão da configuração
+    scan_weight: Optional[int] = Field(None, ge=1, le=100)
+    rate_limits: Optional[Dict[str, RouteRateLimit]] = None
+    max_active_scans: Optional[int] = Field(None, ge=0)
 
 class TokenResponse(BaseModel):
     id: int
@@ -69,6 +143,9 @@ class TokenResponse(BaseModel):
     created_at: datetime.datetime
     expires_at: Optional[datetime.datetime]
     owner_username: Optional[str]
+    scan_weight: int = 1
+    rate_limits: Optional[Dict[str, int]] = None
+    max_active_scans: Optional[int] = None
     class Config:
         from_attributes = True
 
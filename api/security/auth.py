@@ -1,50 +1,174 @@
-from fastapi import Depends, HTTPException, Security
+from fastapi import Depends, HTTPException, Request, Response, Security
 from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
+import hashlib
+import logging
 import secrets
 from datetime import datetime, timezone
 
 from ..db import models
-from ..db.session import get_db
+from ..config import settings
+from ..db.session import SessionLocal
+from ..services.executor import BoundedExecutor, ExecutorSaturated
+from ..services.rate_limits import rate_limiter
+from ..services.tasks import redis_conn
+from .token_cache import snapshot_token, token_cache, token_digest
+
+logger = logging.getLogger(__name__)
 
 api_key_header = APIKeyHeader(name="X-API-Token", auto_error=False)
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
+# Tokens emitidos no formato "<prefixo>.<segredo>". O prefixo é público e
+# indexado; o "." nunca aparece em token_urlsafe, então o split é inequívoco.
+TOKEN_PREFIX_BYTES = 8
+TOKEN_SEPARATOR = "."
+
+# Consultas síncronas e argon2 rodam neste pool para não travar o event loop;
+# as threads dele cedem a CPU ao event loop (AUTH_EXECUTOR_NICE)
+auth_executor = BoundedExecutor(
+    "auth", settings.AUTH_EXECUTOR_WORKERS, settings.AUTH_EXECUTOR_MAX_PENDING, nice=settings.AUTH_EXECUTOR_NICE
+)
+
 def hash_token(token: str) -> str:
     return pwd_context.hash(token)
 
 def verify_token(plain_token: str, hashed_token: str) -> bool:
     return pwd_context.verify(plain_token, hashed_token)
 
-async def get_current_token(
-    api_key: str = Security(api_key_header), db: Session = Depends(get_db)
-) -> models.Token:
+def generate_api_token() -> tuple[str, str]:
+    """Gera um novo token de API. Retorna (token_cru, prefixo)."""
+    prefix = secrets.token_hex(TOKEN_PREFIX_BYTES)
+    return f"{prefix}{TOKEN_SEPARATOR}{secrets.token_urlsafe(32)}", prefix
+
+def legacy_token_prefix(plain_token: str) -> str:
+    """Chave de busca para tokens emitidos antes do formato com prefixo."""
+    return hashlib.sha256(plain_token.encode('utf-8')).hexdigest()[:32]
+
+def token_lookup_prefix(plain_token: str) -> str:
+    prefix, sep, _ = plain_token.partition(TOKEN_SEPARATOR)
+    if sep and len(prefix) == TOKEN_PREFIX_BYTES * 2:
+        return prefix
+    return legacy_token_prefix(plain_token)
+
+def _find_legacy_token(db: Session, api_key: str) -> models.Token | None:
+    """
+    Caminho de migração para tokens antigos (sem prefixo): verifica todos os
+    tokens ainda não indexados e, ao encontrar, grava o prefixo derivado para
+    que as próximas requisições façam uma única verificação. O prefixo é
+    derivado do token em claro, então não há migração offline possível; o
+    custo (uma verificação argon2 por token pendente) é registrado em log a
+    cada uso, e o caminho inteiro some com LEGACY_TOKEN_LOOKUP=false (ver
+    scripts/legacy_tokens.py).
+    """
+    if not settings.LEGACY_TOKEN_LOOKUP:
+        return None
+    legacy_tokens = db.query(models.Token).filter(
+        models.Token.is_revoked == False,
+        models.Token.token_prefix.is_(None),
+    ).order_by(models.Token.id).all()
+    if not legacy_tokens:
+        return None
+
+    logger.warning(
+        f"Token sem prefixo apresentado: verificando {len(legacy_tokens)} token(s) legado(s) um a um. "
+        "Migre-os (make legacy-tokens) e defina LEGACY_TOKEN_LOOKUP=false."
+    )
+    for token in legacy_tokens:
+        if verify_token(api_key, token.hashed_token):
+            token.token_prefix = legacy_token_prefix(api_key)
+            db.commit()
+            db.refresh(token)
+            logger.warning(f"Token legado {token.id} migrado para busca por prefixo.")
+            return token
+    return None
+
+def _lookup_token(db: Session, api_key: str) -> models.Token | None:
+    db_token = db.query(models.Token).filter(
+        models.Token.token_prefix == token_lookup_prefix(api_key),
+        models.Token.is_revoked == False,
+    ).first()
+
+    if db_token is not None:
+        if not verify_token(api_key, db_token.hashed_token):
+            return None
+        return db_token
+
+    if TOKEN_SEPARATOR not in api_key:
+        return _find_legacy_token(db, api_key)
+    return None
+
+def _authenticate(api_key: str) -> models.Token | None:
+    """
+    Busca e verificação do token; executa fora do event loop, com uma
+    sessão própria: a da requisição pode ser fechada (requisição cancelada)
+    enquanto esta thread ainda a usaria. Retorna uma cópia desanexada.
+    """
+    db = SessionLocal()
+    try:
+        db_token = _lookup_token(db, api_key)
+        return snapshot_token(db_token) if db_token is not None else None
+    finally:
+        db.close()
+
+def _check_token_ip(token: models.Token, request: Request) -> None:
+    if token.ip_index is None:
+        return
+    # Resolvido pelo IPAllowlistMiddleware, que respeita TRUSTED_PROXIES
+    client_ip = getattr(request.state, "client_ip", None)
+    if client_ip is None or client_ip not in token.ip_index:
+        raise HTTPException(status_code=403, detail="Client IP address is not allowed for this API Token.")
+
+async def get_current_token(request: Request, api_key: str = Security(api_key_header)) -> models.Token:
     if not api_key:
         raise HTTPException(status_code=401, detail="API Token required")
 
-    all_tokens = db.query(models.Token).filter(models.Token.is_revoked == False).all()
-    
-    db_token = None
-    for token in all_tokens:
-        if verify_token(api_key, token.hashed_token):
-            db_token = token
-            break
-            
+    digest = token_digest(api_key)
+    cached = token_cache.get(digest)
+    if cached is not None:
+        _check_token_ip(cached, request)
+        return cached
+
+    # Revogações que chegarem durante a verificação impedem o put abaixo
+    generation = token_cache.generation()
+    try:
+        db_token = await auth_executor.run(_authenticate, api_key)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication backlog is full, retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+
     if db_token is None:
         raise HTTPException(status_code=401, detail="Invalid API Token")
 
     if db_token.expires_at and db_token.expires_at.replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
         raise HTTPException(status_code=401, detail="API Token has expired")
 
+    token_cache.put(digest, db_token, generation)
+    _check_token_ip(db_token, request)
     return db_token
 
+def _check_rate_limit(token: models.Token, request: Request, response: Response) -> None:
+    # Cada rota tem o seu balde, identificado pelo nome do endpoint
+    status = rate_limiter.hit(redis_conn, token, request.scope["endpoint"].__name__)
+    if status is None:
+        return
+    if not status.allowed:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded for this API Token.", headers=status.headers())
+    response.headers.update(status.headers())
+
 def require_scope(required_scope: str):
-    def dependency(token: models.Token = Depends(get_current_token)) -> models.Token:
+    def dependency(
+        request: Request, response: Response, token: models.Token = Depends(get_current_token)
+    ) -> models.Token:
         if required_scope not in token.scopes:
             raise HTTPException(
                 status_code=403,
                 detail=f"Insufficient permissions. Scope '{required_scope}' required.",
             )
+        _check_rate_limit(token, request, response)
         return token
     return dependency
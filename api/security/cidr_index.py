@@ -0,0 +1,132 @@
+from bisect import bisect_right
+from functools import lru_cache
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network
+from typing import Iterable
+
+
+class CIDRIndex:
+    """
+    Conjunto de redes compilado em intervalos inteiros ordenados e mesclados,
+    um por versão de IP. Pertinência de endereços e de redes inteiras é
+    resolvida por busca binária, independente da quantidade de redes.
+    """
+
+    def __init__(self, networks: Iterable):
+        intervals: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        for net in networks:
+            intervals[net.version].append((int(net.network_address), int(net.broadcast_address)))
+
+        self._starts: dict[int, list[int]] = {}
+        self._ends: dict[int, list[int]] = {}
+        self._size = 0
+        for version, spans in intervals.items():
+            merged: list[list[int]] = []
+            for start, end in sorted(spans):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [s for s, _ in merged]
+            self._ends[version] = [e for _, e in merged]
+            self._size += len(spans)
+
+    @classmethod
+    def from_strings(cls, entries: Iterable[str]) -> "CIDRIndex":
+        """Compila entradas IP/CIDR, ignorando as que não forem redes válidas."""
+        networks = []
+        for entry in entries:
+            try:
+                networks.append(ip_network(str(entry).strip(), strict=False))
+            except ValueError:
+                pass
+        return cls(networks)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _covers(self, version: int, first: int, last: int) -> bool:
+        starts = self._starts[version]
+        pos = bisect_right(starts, first) - 1
+        return pos >= 0 and self._ends[version][pos] >= last
+
+    def __contains__(self, address) -> bool:
+        if not isinstance(address, (IPv4Address, IPv6Address)):
+            try:
+                address = ip_address(address)
+            except ValueError:
+                return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        value = int(address)
+        return self._covers(address.version, value, value)
+
+    def contains_network(self, network) -> bool:
+        """True se a rede inteira estiver coberta pelo índice."""
+        return self._covers(network.version, int(network.network_address), int(network.broadcast_address))
+
+
+def _hostname_allowed(hostname: str, patterns: tuple[str, ...]) -> bool:
+    for pattern in patterns:
+        if pattern.startswith("*."):
+            if hostname.endswith(pattern[1:]):
+                return True
+        elif hostname == pattern:
+            return True
+    return False
+
+
+class TargetPolicy:
+    """
+    allowed_targets de um token, compilado: redes num CIDRIndex e hostnames
+    (literais ou curingas "*.exemplo.com") numa tupla. Lista vazia libera tudo.
+    """
+
+    def __init__(self, allowed: Iterable[str]):
+        entries = tuple(str(a).strip().lower() for a in allowed)
+        self.unrestricted = not entries
+        self.index = CIDRIndex.from_strings(entries)
+        self.hostnames = tuple(e for e in entries if e and not _is_network(e))
+
+    def disallowed(self, targets: list[str]) -> list[str]:
+        """
+        Retorna os alvos fora da política. Alvos IP/CIDR precisam estar
+        inteiramente contidos nas redes permitidas; hostnames precisam casar
+        com uma entrada literal ou curinga.
+        """
+        if self.unrestricted:
+            return []
+        rejected = []
+        for target in targets:
+            candidate = target.strip().lower()
+            try:
+                network = ip_network(candidate, strict=False)
+            except ValueError:
+                if not _hostname_allowed(candidate, self.hostnames):
+                    rejected.append(target)
+                continue
+            if not self.index.contains_network(network):
+                rejected.append(target)
+        return rejected
+
+
+def disallowed_targets(targets: list[str], allowed: list[str]) -> list[str]:
+    """
+    Retorna os alvos fora de `allowed` (ver TargetPolicy). Para tokens
+    autenticados, prefira `token.target_policy`, já compilado no snapshot.
+    """
+    if not allowed:
+        return []
+    return _compile_target_policy(tuple(allowed)).disallowed(targets)
+
+
+@lru_cache(maxsize=1024)
+def _compile_target_policy(entries: tuple[str, ...]) -> TargetPolicy:
+    return TargetPolicy(entries)
+
+
+def _is_network(entry: str) -> bool:
+    try:
+        ip_network(entry, strict=False)
+        return True
+    except ValueError:
+        return False
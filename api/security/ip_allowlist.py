@@ -1,45 +1,82 @@
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from ipaddress import ip_address, ip_network
-from typing import Set
+from ipaddress import ip_address
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.websockets import WebSocketClose
 
 from ..config import settings
+from .cidr_index import CIDRIndex
 
-class IPAllowlistMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app):
-        super().__init__(app)
-        self.allowed_ips: Set[ip_network] = self._parse_ips(settings.GLOBAL_IP_ALLOWLIST)
-
-    def _parse_ips(self, ip_list_str: str) -> Set[ip_network]:
-        if not ip_list_str:
-            return set()
-        
-        allowed_set = set()
-        for ip_str in ip_list_str.split(','):
-            try:
-                allowed_set.add(ip_network(ip_str.strip()))
-            except ValueError:
-                pass
-        return allowed_set
-
-    async def dispatch(self, request: Request, call_next):
-        if not self.allowed_ips:
-            return await call_next(request)
-
-        forwarded_for = request.headers.get('X-Forwarded-For')
-        if forwarded_for:
-            client_ip_str = forwarded_for.split(',')[0].strip()
-        else:
-            client_ip_str = request.client.host
-
-        try:
-            client_ip = ip_address(client_ip_str)
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid client IP address")
-
-        is_allowed = any(client_ip in network for network in self.allowed_ips)
-
-        if not is_allowed:
-            raise HTTPException(status_code=403, detail=f"IP address {client_ip_str} is not allowed.")
-        
-        return await call_next(request)
+def _parse_networks(ip_list_str: str) -> CIDRIndex:
+    if not ip_list_str:
+        return CIDRIndex([])
+    return CIDRIndex.from_strings(ip_list_str.split(','))
+
+def _parse_ip(value: str):
+    try:
+        return ip_address(value.strip())
+    except ValueError:
+        return None
+
+class IPAllowlistMiddleware:
+    """
+    Middleware ASGI puro: resolve o IP do cliente a partir do `scope`, recusa
+    cedo quem não estiver na allowlist e, para os demais, repassa
+    receive/send intactos (sem bufferizar nem copiar corpos).
+
+    X-Forwarded-For só é considerado quando o par TCP imediato é um proxy
+    confiável (TRUSTED_PROXIES); nesse caso o cliente é o endereço mais à
+    direita da cadeia que não seja, ele próprio, um proxy confiável.
+    """
+
+    def __init__(self, app: ASGIApp, allowlist: str | None = None, trusted_proxies: str | None = None):
+        self.app = app
+        self.allowed_ips = _parse_networks(settings.GLOBAL_IP_ALLOWLIST if allowlist is None else allowlist)
+        self.trusted_proxies = _parse_networks(settings.TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies)
+
+    def client_ip(self, scope: Scope):
+        client = scope.get("client")
+        peer = _parse_ip(client[0]) if client else None
+        if peer is None or peer not in self.trusted_proxies:
+            return peer
+
+        forwarded = [
+            value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+            if name == b"x-forwarded-for"
+        ]
+        if not forwarded:
+            return peer
+
+        chain = [hop for hop in ",".join(forwarded).split(",") if hop.strip()]
+        for hop in reversed(chain):
+            hop_ip = _parse_ip(hop)
+            if hop_ip is None:
+                return None
+            if hop_ip not in self.trusted_proxies:
+                return hop_ip
+        return _parse_ip(chain[0]) if chain else peer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = self.client_ip(scope)
+        # Disponível para a checagem de allowed_ips por token em auth.py
+        scope.setdefault("state", {})["client_ip"] = client_ip
+
+        if self.allowed_ips:
+            if client_ip is None:
+                await self._reject(scope, receive, send, 400, "Invalid client IP address")
+                return
+            if client_ip not in self.allowed_ips:
+                await self._reject(scope, receive, send, 403, f"IP address {client_ip} is not allowed.")
+                return
+
+        await self.app(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, status_code: int, detail: str) -> None:
+        if scope["type"] == "websocket":
+            await WebSocketClose(code=1008, reason=detail)(scope, receive, send)
+            return
+        await JSONResponse({"detail": detail}, status_code=status_code)(scope, receive, send)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from redis.exceptions import RedisError
+
+from ..config import settings
+from ..db import models
+from .cidr_index import CIDRIndex, TargetPolicy
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_CHANNEL = "autonmap:tokens:revoked"
+
+
+def token_digest(plain_token: str) -> str:
+    return hashlib.sha256(plain_token.encode('utf-8')).hexdigest()
+
+
+def snapshot_token(token: models.Token) -> models.Token:
+    """
+    Cópia transiente (fora de qualquer sessão) das colunas do token, com
+    allowed_ips e allowed_targets já compilados (`ip_index`, nulo quando não
+    há restrição, e `target_policy`): o caminho quente não recompila nada.
+    """
+    snapshot = models.Token(**{c.key: getattr(token, c.key) for c in models.Token.__table__.columns})
+    snapshot.ip_index = CIDRIndex.from_strings(snapshot.allowed_ips) if snapshot.allowed_ips else None
+    snapshot.target_policy = TargetPolicy(snapshot.allowed_targets or [])
+    return snapshot
+
+
+class TokenCache:
+    """
+    Cache LRU+TTL de tokens já verificados, indexado pelo digest do token
+    apresentado. Evita a consulta ao banco e o hash argon2 no caminho quente.
+
+    Cada invalidação avança uma geração. Quem vai verificar um token anota
+    `generation()` antes e a repassa a `put`: se o token (ou o cache todo) foi
+    invalidado depois disso, a verificação pode ter lido o token antes da
+    revogação e o resultado não é guardado.
+    """
+
+    # Gerações de revogação lembradas por token; as mais antigas viram piso
+    MAX_REVOCATIONS = 4096
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, models.Token]] = OrderedDict()
+        self._digests_by_id: dict[int, set[str]] = {}
+        self._generation = 0
+        self._revoked_at: OrderedDict[int, int] = OrderedDict()
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, digest: str) -> models.Token | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            deadline, token = entry
+            if deadline <= time.monotonic():
+                self._remove(digest)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return token
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, digest: str, token: models.Token, since: int | None = None) -> None:
+        """Guarda `token`, que precisa ser um snapshot (ver snapshot_token)."""
+        if self.max_size <= 0:
+            return
+        ttl = float(self.ttl_seconds)
+        if token.expires_at:
+            remaining = (token.expires_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+            ttl = min(ttl, remaining)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if since is not None and (since < self._floor or self._revoked_at.get(token.id, -1) > since):
+                return
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (time.monotonic() + ttl, token)
+            self._digests_by_id.setdefault(token.id, set()).add(digest)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, token_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._revoked_at.pop(token_id, None)
+            self._revoked_at[token_id] = self._generation
+            while len(self._revoked_at) > self.MAX_REVOCATIONS:
+                _, self._floor = self._revoked_at.popitem(last=False)
+            for digest in self._digests_by_id.pop(token_id, set()):
+                self._entries.pop(digest, None)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._revoked_at.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._digests_by_id.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, digest: str) -> None:
+        _, token = self._entries.pop(digest)
+        digests = self._digests_by_id.get(token.id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._digests_by_id[token.id]
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL_SECONDS)
+
+
+def publish_revocation(redis_conn, token_id: int) -> None:
+    """Invalida o token localmente e avisa as demais réplicas da API."""
+    token_cache.invalidate(token_id)
+    try:
+        redis_conn.publish(REVOCATION_CHANNEL, str(token_id))
+    except RedisError as e:
+        logger.error(f"Falha ao publicar revogação do token {token_id}: {e}")
+
+
+def _on_revocation(message: dict) -> None:
+    try:
+        token_cache.invalidate(int(message["data"]))
+    except (TypeError, ValueError):
+        logger.warning(f"Mensagem de revogação inválida: {message!r}")
+
+
+def _on_subscriber_error(exc, pubsub, thread) -> None:
+    # Mensagens podem ter sido perdidas enquanto a conexão estava fora:
+    # descarta tudo e deixa o próximo acesso revalidar no banco.
+    logger.error(f"Assinatura de revogações interrompida: {exc}")
+    token_cache.clear()
+    time.sleep(1.0)
+
+
+def start_revocation_listener(redis_conn):
+    """Assina o canal de revogações em uma thread daemon. Retorna a thread."""
+    try:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{REVOCATION_CHANNEL: _on_revocation})
+        return pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=_on_subscriber_error)
+    except RedisError as e:
+        logger.error(f"Não foi possível assinar o canal de revogações; cache de tokens desativado: {e}")
+        token_cache.max_size = 0
+        token_cache.clear()
+        return None
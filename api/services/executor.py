@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(Exception):
+    """A fila do executor atingiu o limite configurado."""
+
+
+class BoundedExecutor:
+    """
+    Pool de threads com fila limitada para tirar trabalho bloqueante
+    (consultas síncronas, hashes) do event loop. Mede o tempo que cada
+    tarefa esperou na fila antes de começar a executar.
+
+    Com `nice` > 0 (Linux), as threads do pool rodam com prioridade de CPU
+    menor que a do resto do processo: com a CPU saturada, o event loop
+    continua sendo atendido primeiro.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, samples: int = 1024, nice: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.nice = nice
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name, initializer=self._lower_priority if nice > 0 else None,
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queue_waits: deque[float] = deque(maxlen=samples)
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def _lower_priority(self) -> None:
+        # No Linux a prioridade vale por thread (o id nativo é o da tarefa)
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Não foi possível reduzir a prioridade das threads do executor {self.name}: {e}")
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+            self._in_flight += 1
+            self.submitted += 1
+
+        enqueued_at = time.perf_counter()
+
+        def job():
+            waited = time.perf_counter() - enqueued_at
+            with self._lock:
+                self._queue_waits.append(waited)
+            return fn(*args, **kwargs)
+
+        # O contador só é liberado quando a thread termina de fato, mesmo
+        # que a requisição que aguardava tenha sido cancelada.
+        future = self._pool.submit(job)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._queue_waits)
+            in_flight = self._in_flight
+            submitted, rejected, completed = self.submitted, self.rejected, self.completed
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 3)
+
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.max_workers),
+            "submitted": submitted,
+            "completed": completed,
+            "rejected": rejected,
+            "queue_wait_ms_p50": percentile(0.50),
+            "queue_wait_ms_p99": percentile(0.99),
+            "queue_wait_ms_max": round(waits[-1] * 1000, 3) if waits else 0.0,
+        }
@@ -0,0 +1,355 @@
+import logging
+import math
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from statistics import mean
+
+from redis.exceptions import RedisError
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+from rq.worker import Worker, WorkerStatus
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+FAIR_PREFIX = "autonmap:fair:"
+# Ordem estrita: um nível só é atendido com os anteriores vazios
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+# Escopo exigido do token para cada prioridade acima da padrão
+PRIORITY_SCOPES = {"high": "scan:priority:high"}
+# Durações recentes de jobs usadas na estimativa de início
+DURATION_SAMPLES = 200
+# Jobs ausentes de um retrato das estimativas (enfileirados depois dele)
+# forçam um novo no máximo a este intervalo
+ESTIMATES_MIN_REFRESH_SECONDS = 1
+
+# Coloca o job no backlog do token e, se o backlog estava vazio, o token no
+# fim da vez (ring) da prioridade. KEYS: backlog, ring, pesos.
+_PUSH_SCRIPT = """
+local size
+if ARGV[4] == '1' then
+    size = redis.call('LPUSH', KEYS[1], ARGV[1])
+else
+    size = redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+if size == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+return size
+"""
+
+# Deficit round robin: move jobs dos backlogs para a fila do RQ até ela ter
+# ARGV[1] jobs. Cada token da vez recebe crédito igual ao seu peso ao chegar
+# à frente e cede a vez quando o crédito acaba ou o backlog esvazia. A
+# primeira prioridade tem ARGV[3] vagas a mais e entra na fila do RQ à frente
+# dos jobs das demais já liberados (após os dela, na ordem), que ficam
+# listados no conjunto KEYS[4] enquanto aguardam.
+# KEYS: fila do RQ, pesos, conjunto de filas do RQ, jobs urgentes; ARGV:
+# profundidade, prefixo, reserva e prioridades em ordem. Os backlogs são
+# derivados do prefixo.
+_DISPATCH_SCRIPT = """
+local queue, weights, urgent = KEYS[1], KEYS[2], KEYS[4]
+local depth, prefix, reserve = tonumber(ARGV[1]), ARGV[2], tonumber(ARGV[3])
+for _, queued in ipairs(redis.call('SMEMBERS', urgent)) do
+    if not redis.call('LPOS', queue, queued) then
+        redis.call('SREM', urgent, queued)
+    end
+end
+local moved = 0
+while true do
+    local size = redis.call('LLEN', queue)
+    if size >= depth + reserve then break end
+    local job, level = false, 0
+    for i = 4, #ARGV do
+        if i > 4 and size >= depth then break end
+        local ring = prefix .. ARGV[i] .. ':ring'
+        local deficits = prefix .. ARGV[i] .. ':deficit'
+        local token = redis.call('LINDEX', ring, 0)
+        while token and not job do
+            local backlog = prefix .. ARGV[i] .. ':jobs:' .. token
+            job = redis.call('LPOP', backlog)
+            if job then
+                local deficit = tonumber(redis.call('HGET', deficits, token) or '0')
+                if deficit < 1 then
+                    deficit = deficit + tonumber(redis.call('HGET', weights, token) or '1')
+                end
+                deficit = deficit - 1
+                if redis.call('LLEN', backlog) == 0 then
+                    redis.call('LPOP', ring)
+                    redis.call('HDEL', deficits, token)
+                else
+                    if deficit < 1 then
+                        redis.call('RPUSH', ring, redis.call('LPOP', ring))
+                    end
+                    redis.call('HSET', deficits, token, deficit)
+                end
+            else
+                redis.call('LPOP', ring)
+                redis.call('HDEL', deficits, token)
+                token = redis.call('LINDEX', ring, 0)
+            end
+        end
+        if job then
+            level = i
+            break
+        end
+    end
+    if not job then break end
+    local pivot = false
+    if level == 4 then
+        for _, queued in ipairs(redis.call('LRANGE', queue, 0, -1)) do
+            if redis.call('SISMEMBER', urgent, queued) == 0 then
+                pivot = queued
+                break
+            end
+        end
+        redis.call('SADD', urgent, job)
+    end
+    if pivot then
+        redis.call('LINSERT', queue, 'BEFORE', pivot, job)
+    else
+        redis.call('RPUSH', queue, job)
+    end
+    redis.call('SADD', KEYS[3], queue)
+    moved = moved + 1
+end
+return moved
+"""
+
+_scripts: dict[str, object] = {}
+
+
+def _script(connection, name: str, source: str):
+    if name not in _scripts:
+        _scripts[name] = connection.register_script(source)
+    return _scripts[name]
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def priority_error(priority: str, scopes: list[str]) -> str | None:
+    """Erro se o token não tem o escopo exigido pela prioridade pedida."""
+    scope = PRIORITY_SCOPES.get(priority)
+    if scope and scope not in scopes:
+        return f"Scope '{scope}' required for priority '{priority}'."
+    return None
+
+
+def priority_rank(priority: str | None) -> int:
+    """Posição da prioridade em PRIORITIES: menor é mais urgente."""
+    return PRIORITIES.index(priority or DEFAULT_PRIORITY)
+
+
+def _drr_order(ring: list[str], deficits: dict[str, float], weights: dict[str, int],
+               backlogs: dict[str, list[str]]) -> list[str]:
+    """Ordem em que o _DISPATCH_SCRIPT entregaria os jobs de uma prioridade."""
+    ring, deficits = deque(ring), dict(deficits)
+    cursors: dict[str, int] = {}
+    order = []
+    while ring:
+        token = ring[0]
+        jobs, i = backlogs.get(token, []), cursors.get(token, 0)
+        if i >= len(jobs):
+            ring.popleft()
+            continue
+        deficit = deficits.get(token, 0.0)
+        if deficit < 1:
+            deficit += weights.get(token, 1)
+        deficit -= 1
+        order.append(jobs[i])
+        cursors[token] = i + 1
+        if i + 1 >= len(jobs):
+            ring.popleft()
+            deficits.pop(token, None)
+        else:
+            if deficit < 1:
+                ring.rotate(-1)
+            deficits[token] = deficit
+    return order
+
+
+@dataclass
+class _EstimatesSnapshot:
+    """Retrato da fila usado pelas estimativas: posição de cada job e vagas dos workers."""
+    taken_at: float
+    now: datetime
+    positions: dict[str, int]
+    slots: int
+    idle: int
+    average: float | None
+
+
+class FairQueue(Queue):
+    """
+    Fila do RQ com agendamento justo entre tokens. Jobs enfileirados por uma
+    instância de `for_tenant` não vão direto para a fila: ficam no backlog
+    do token, por prioridade, e são liberados para a fila do RQ (mantida
+    com SCAN_FAIR_QUEUE_DEPTH jobs) por deficit round robin ponderado pelo
+    peso do token. Quem libera são os próprios workers, antes de cada
+    espera por job (`dequeue_any`), e a API, logo após enfileirar.
+
+    Jobs de prioridade "high" têm SCAN_FAIR_HIGH_RESERVE vagas a mais na
+    fila do RQ e passam à frente dos já liberados das outras prioridades:
+    esperam no máximo pelos jobs em execução, não pelos já escolhidos.
+
+    Os demais caminhos (reagendamentos, continuações) usam a fila
+    diretamente, como no RQ.
+    """
+
+    def __init__(self, *args, tenant: tuple[int, str, int] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tenant = tenant
+        self._snapshot: _EstimatesSnapshot | None = None
+        self._snapshot_lock = threading.Lock()
+
+    @property
+    def fair_prefix(self) -> str:
+        return f"{FAIR_PREFIX}{self.name}:"
+
+    def for_tenant(self, token_id: int | None, priority: str | None = None, weight: int | None = None) -> "FairQueue":
+        return FairQueue(
+            self.name, connection=self.connection, serializer=self.serializer,
+            tenant=(token_id or 0, priority or DEFAULT_PRIORITY, max(1, weight or 1)),
+        )
+
+    def push_job_id(self, job_id: str, pipeline=None, at_front: bool = False):
+        if self.tenant is None or not settings.SCAN_FAIR_QUEUE:
+            return super().push_job_id(job_id, pipeline=pipeline, at_front=at_front)
+        token_id, priority, weight = self.tenant
+        prefix = f"{self.fair_prefix}{priority}"
+        _script(self.connection, "push", _PUSH_SCRIPT)(
+            keys=[f"{prefix}:jobs:{token_id}", f"{prefix}:ring", self.fair_prefix + "weights"],
+            args=[job_id, token_id, weight, 1 if at_front else 0],
+            client=pipeline if pipeline is not None else self.connection,
+        )
+
+    @classmethod
+    def dispatch_to(cls, queue: Queue) -> int:
+        """Libera jobs dos backlogs para a fila `queue`. Retorna quantos."""
+        prefix = f"{FAIR_PREFIX}{queue.name}:"
+        return _script(queue.connection, "dispatch", _DISPATCH_SCRIPT)(
+            keys=[queue.key, prefix + "weights", queue.redis_queues_keys, prefix + "urgent"],
+            args=[settings.SCAN_FAIR_QUEUE_DEPTH, prefix, settings.SCAN_FAIR_HIGH_RESERVE, *PRIORITIES],
+            client=queue.connection,
+        )
+
+    def dispatch(self) -> int:
+        try:
+            return self.dispatch_to(self)
+        except RedisError as e:
+            # Os workers liberam os jobs na próxima espera
+            logger.warning(f"Falha ao liberar jobs do backlog da fila {self.name}: {e}")
+            return 0
+
+    @classmethod
+    def dequeue_any(cls, queues, timeout, connection=None, **kwargs):
+        """
+        Como o do RQ, mas libera jobs dos backlogs antes de esperar e espera
+        em intervalos de SCAN_FAIR_POLL_SECONDS, para que workers ociosos
+        vejam jobs que chegam aos backlogs.
+        """
+        if not settings.SCAN_FAIR_QUEUE:
+            return super().dequeue_any(queues, timeout, connection=connection, **kwargs)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for queue in queues:
+                cls.dispatch_to(queue)
+            wait = timeout
+            if deadline is not None:
+                wait = max(1, min(settings.SCAN_FAIR_POLL_SECONDS, math.ceil(deadline - time.monotonic())))
+            try:
+                return super().dequeue_any(queues, wait, connection=connection, **kwargs)
+            except DequeueTimeout:
+                if deadline is None or time.monotonic() >= deadline:
+                    raise
+
+    def record_duration(self, seconds: float) -> None:
+        """Guarda a duração de um job executado, para as estimativas de início."""
+        try:
+            pipe = self.connection.pipeline(transaction=False)
+            pipe.lpush(self.fair_prefix + "durations", round(seconds, 3))
+            pipe.ltrim(self.fair_prefix + "durations", 0, DURATION_SAMPLES - 1)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Falha ao registrar a duração do job: {e}")
+
+    def _take_snapshot(self) -> _EstimatesSnapshot:
+        """Ordem de entrega de todos os jobs em espera e vagas dos workers (custo proporcional ao backlog)."""
+        pipe = self.connection.pipeline(transaction=False)
+        pipe.lrange(self.key, 0, -1)
+        pipe.hgetall(self.fair_prefix + "weights")
+        pipe.lrange(self.fair_prefix + "durations", 0, -1)
+        for priority in PRIORITIES:
+            pipe.lrange(f"{self.fair_prefix}{priority}:ring", 0, -1)
+            pipe.hgetall(f"{self.fair_prefix}{priority}:deficit")
+        ready, weights, durations, *levels = pipe.execute()
+        weights = {_decode(token): int(weight) for token, weight in weights.items()}
+
+        rings = [[_decode(token) for token in levels[i]] for i in range(0, len(levels), 2)]
+        pipe = self.connection.pipeline(transaction=False)
+        for priority, ring in zip(PRIORITIES, rings):
+            for token in ring:
+                pipe.lrange(f"{self.fair_prefix}{priority}:jobs:{token}", 0, -1)
+        backlog_jobs = iter(pipe.execute())
+
+        order = [_decode(job_id) for job_id in ready]
+        for ring, deficits in zip(rings, levels[1::2]):
+            backlogs = {token: [_decode(job_id) for job_id in next(backlog_jobs)] for token in ring}
+            deficits = {_decode(token): float(deficit) for token, deficit in deficits.items()}
+            order.extend(_drr_order(ring, deficits, weights, backlogs))
+
+        slots = idle = 0
+        if order:
+            workers = Worker.all(queue=self)
+            slots = len(workers)
+            idle = sum(1 for worker in workers if worker.get_state() == WorkerStatus.IDLE)
+        return _EstimatesSnapshot(
+            taken_at=time.monotonic(),
+            now=datetime.now(timezone.utc),
+            positions={job_id: position for position, job_id in enumerate(order)},
+            slots=slots,
+            idle=idle,
+            average=mean(float(seconds) for seconds in durations) if durations else None,
+        )
+
+    def estimates(self, job_ids: list[str]) -> dict[str, tuple[int, datetime | None]]:
+        """
+        Posição (jobs à frente) e início estimado dos jobs que ainda aguardam
+        na fila ou nos backlogs. O início considera as vagas dos workers da
+        fila e a duração média recente dos jobs; é nulo sem esses dados.
+
+        Montar a ordem custa o backlog inteiro, então cada réplica reaproveita
+        o mesmo retrato por SCAN_QUEUE_ESTIMATES_SECONDS; jobs enfileirados
+        depois dele forçam um novo, no máximo a cada
+        ESTIMATES_MIN_REFRESH_SECONDS.
+        """
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            age = time.monotonic() - snapshot.taken_at if snapshot else None
+            if (
+                snapshot is None
+                or age >= settings.SCAN_QUEUE_ESTIMATES_SECONDS
+                or (age >= ESTIMATES_MIN_REFRESH_SECONDS and any(j not in snapshot.positions for j in job_ids))
+            ):
+                snapshot = self._snapshot = self._take_snapshot()
+
+        positions = {job_id: snapshot.positions[job_id] for job_id in job_ids if job_id in snapshot.positions}
+        slots, idle, average = snapshot.slots, snapshot.idle, snapshot.average
+
+        def start(position: int) -> datetime | None:
+            if position < idle:
+                return snapshot.now
+            if not slots or average is None:
+                return None
+            # Meia duração até a primeira vaga livre, depois uma rodada por vaga
+            return snapshot.now + timedelta(seconds=average / 2 + (position - idle) // slots * average)
+
+        return {job_id: (position, start(position)) for job_id, position in positions.items()}
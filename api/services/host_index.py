@@ -0,0 +1,88 @@
+import hashlib
+import json
+import xml.etree.ElementTree as ET
+from typing import BinaryIO
+
+from sqlalchemy import insert, literal, select, update
+
+from ..db.models import Scan, ScanHost
+from .nmap_merge import iter_hosts
+
+# Linhas de scan_hosts por INSERT durante a ingestão
+INDEX_BATCH_SIZE = 1000
+
+
+def _script_digests(scripts: list[ET.Element]) -> dict[str, str]:
+    # Só um hash curto da saída: o suficiente para detectar mudança no achado
+    return {
+        script.get("id"): hashlib.sha256(script.get("output", "").encode("utf-8")).hexdigest()[:16]
+        for script in scripts
+    }
+
+
+def host_summary(host: ET.Element) -> tuple[str, dict]:
+    """(estado do host, resumo das portas/serviços/scripts) de um elemento host."""
+    ports = {}
+    for port in host.iterfind("ports/port"):
+        state, service = port.find("state"), port.find("service")
+        entry = {"state": state.get("state") if state is not None else None}
+        if service is not None:
+            description = " ".join(
+                service.get(attr) for attr in ("name", "product", "version", "extrainfo") if service.get(attr)
+            )
+            if description:
+                entry["service"] = description
+        scripts = _script_digests(port.findall("script"))
+        if scripts:
+            entry["scripts"] = scripts
+        ports[f"{port.get('protocol')}/{port.get('portid')}"] = entry
+
+    data = {"ports": ports}
+    host_scripts = _script_digests(host.findall("hostscript/script"))
+    if host_scripts:
+        data["scripts"] = host_scripts
+    status = host.find("status")
+    return (status.get("state") if status is not None else "unknown"), data
+
+
+def _digest(status: str, data: dict) -> str:
+    canonical = json.dumps({"status": status, **data}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def index_scan_hosts(db, scan_id, source: BinaryIO) -> int:
+    """
+    Grava em scan_hosts a impressão digital de cada host do XML, em lotes,
+    substituindo um índice anterior do scan. Retorna o número de hosts.
+    """
+    db.query(ScanHost).filter(ScanHost.scan_id == scan_id).delete(synchronize_session=False)
+    batch: list[dict] = []
+    count = 0
+    for address, host in iter_hosts(source):
+        status, data = host_summary(host)
+        batch.append({
+            "scan_id": scan_id, "address": address, "status": status,
+            "digest": _digest(status, data), "data": data,
+        })
+        if len(batch) >= INDEX_BATCH_SIZE:
+            db.execute(insert(ScanHost), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(ScanHost), batch)
+        count += len(batch)
+    db.execute(update(Scan).where(Scan.id == scan_id).values(host_count=count))
+    return count
+
+
+def copy_host_index(db, source_id, scan_id) -> None:
+    """Índice de hosts de um scan que reaproveita o resultado de outro."""
+    host_count = db.execute(select(Scan.host_count).where(Scan.id == source_id)).scalar()
+    if host_count is None:
+        return
+    db.execute(insert(ScanHost).from_select(
+        ["scan_id", "address", "status", "digest", "data"],
+        select(literal(scan_id, ScanHost.scan_id.type), ScanHost.address, ScanHost.status, ScanHost.digest, ScanHost.data)
+        .where(ScanHost.scan_id == source_id),
+    ))
+    db.execute(update(Scan).where(Scan.id == scan_id).values(host_count=host_count))
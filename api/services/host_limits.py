@@ -0,0 +1,176 @@
+import logging
+import time
+from ipaddress import ip_network
+
+from redis.exceptions import RedisError
+
+from ..config import settings
+from .nmap_runner import NMAP_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+HOST_SLOTS_PREFIX = "autonmap:host-slots:"
+# Jobs sobre alvos dentro da sub-rede (ver host_keys)
+HOST_UNDER_PREFIX = "autonmap:host-under:"
+# Nmaps em execução em todos os workers, para o orçamento global de pacotes
+RATE_SLOTS_KEY = "autonmap:rate-slots"
+# Margem sobre o tempo limite do Nmap antes de uma vaga abandonada expirar
+# (ex.: worker morto sem liberar)
+LEASE_MARGIN_SECONDS = 300
+
+# Ocupa as vagas pedidas ou nenhuma. Cada chave é um sorted set de detentores
+# com o instante de expiração da vaga como score. ARGV, após now, expires e
+# holder: o número de verificações e, para cada uma, o limite, quantas chaves
+# somar e os índices delas em KEYS; por fim os índices das chaves a ocupar.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expires = tonumber(ARGV[2])
+local holder = ARGV[3]
+for _, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+end
+local i = 5
+for _ = 1, tonumber(ARGV[4]) do
+    local limit, count = tonumber(ARGV[i]), tonumber(ARGV[i + 1])
+    local used = 0
+    for j = i + 2, i + 1 + count do
+        local key = KEYS[tonumber(ARGV[j])]
+        used = used + redis.call('ZCARD', key)
+        if redis.call('ZSCORE', key, holder) then
+            used = used - 1
+        end
+    end
+    if used >= limit then
+        return 0
+    end
+    i = i + 2 + count
+end
+for j = i, #ARGV do
+    local key = KEYS[tonumber(ARGV[j])]
+    redis.call('ZADD', key, expires, holder)
+    redis.call('EXPIREAT', key, math.ceil(expires))
+end
+return 1
+"""
+
+
+def _levels(version: int) -> list[int]:
+    """
+    Prefixos em que os alvos são agrupados, do agrupamento configurado para
+    cima, espaçados para que um alvo caiba em até SCAN_HOST_LIMIT_MAX_KEYS
+    sub-redes do nível logo abaixo dele.
+    """
+    prefix = settings.SCAN_HOST_LIMIT_PREFIX_V4 if version == 4 else settings.SCAN_HOST_LIMIT_PREFIX_V6
+    return list(range(prefix, -1, -max(1, settings.SCAN_HOST_LIMIT_MAX_KEYS.bit_length())))
+
+
+def host_keys(targets: list[str]) -> dict[str, set[str]]:
+    """
+    Chaves de limite dos alvos, cada uma com as sub-redes maiores que a
+    contêm. Endereços são agrupados na sub-rede de SCAN_HOST_LIMIT_PREFIX_V4/V6
+    (/32 e /128 = por host). Uma rede maior ocupa cada sub-rede que cobre no
+    primeiro nível de _levels em que elas não passam de
+    SCAN_HOST_LIMIT_MAX_KEYS: 10.0.0.0/24 ocupa as 256 chaves /32, e uma /16
+    ocupa sub-redes maiores.
+    """
+    keys: dict[str, set[str]] = {}
+    for target in targets:
+        try:
+            network = ip_network(target.strip(), strict=False)
+        except ValueError:
+            keys.setdefault(target.strip().lower().rstrip("."), set())
+            continue
+        levels = _levels(network.version)
+        level = min((lv for lv in levels if lv >= network.prefixlen), default=levels[0])
+        if network.prefixlen >= level:
+            subnets = [network.supernet(new_prefix=level)]
+        else:
+            subnets = network.subnets(new_prefix=level)
+        ancestors = {str(network.supernet(new_prefix=lv)) for lv in levels if lv < level}
+        for subnet in subnets:
+            keys.setdefault(str(subnet), set()).update(ancestors)
+    return keys
+
+
+def rate_slots() -> int:
+    """
+    Nmaps simultâneos que cabem em SCAN_GLOBAL_MAX_RATE pacotes/s, cada um
+    limitado a NMAP_MAX_RATE (0 = sem orçamento global).
+    """
+    if settings.SCAN_GLOBAL_MAX_RATE <= 0 or settings.NMAP_MAX_RATE <= 0:
+        return 0
+    return max(1, settings.SCAN_GLOBAL_MAX_RATE // settings.NMAP_MAX_RATE)
+
+
+class HostLimiter:
+    """
+    Semáforo no Redis por host/sub-rede alvo: no máximo `limit` jobs de
+    scan tocam o mesmo alvo ao mesmo tempo. Com `global_limit`, também no
+    máximo esse número de jobs roda no total, em todos os workers. Quem não
+    consegue vaga não espera ocupando o worker: o job é reagendado para
+    mais tarde.
+    """
+
+    def __init__(self, limit: int, global_limit: int = 0):
+        self.limit = limit
+        self.global_limit = global_limit
+        self._script = None
+
+    def _plan(self, targets: list[str]) -> tuple[list[tuple[int, list[str]]], list[str]]:
+        """
+        (verificações, chaves ocupadas). Cada chave de host_keys só tem vaga
+        se os jobs nela, os jobs sobre alvos dentro dela (HOST_UNDER_PREFIX) e
+        os jobs nas sub-redes maiores que a contêm somam menos que o limite; o
+        job se registra como "dentro" dessas sub-redes maiores.
+        """
+        checks: list[tuple[int, list[str]]] = []
+        joins: list[str] = []
+        if self.limit > 0:
+            under = set()
+            for key, ancestors in sorted(host_keys(targets).items()):
+                slot = HOST_SLOTS_PREFIX + key
+                checks.append((self.limit, [slot, HOST_UNDER_PREFIX + key,
+                                            *(HOST_SLOTS_PREFIX + a for a in sorted(ancestors))]))
+                joins.append(slot)
+                under.update(HOST_UNDER_PREFIX + a for a in ancestors)
+            joins.extend(sorted(under))
+        if self.global_limit > 0:
+            checks.append((self.global_limit, [RATE_SLOTS_KEY]))
+            joins.append(RATE_SLOTS_KEY)
+        return checks, joins
+
+    def acquire(self, redis_conn, holder: str, targets: list[str]) -> bool:
+        checks, joins = self._plan(targets)
+        if not checks:
+            return True
+        keys = sorted({key for _, summed in checks for key in summed} | set(joins))
+        index = {key: i + 1 for i, key in enumerate(keys)}
+        now = time.time()
+        args = [now, now + NMAP_TIMEOUT_SECONDS + LEASE_MARGIN_SECONDS, holder, len(checks)]
+        for limit, summed in checks:
+            args.extend([limit, len(summed), *(index[key] for key in summed)])
+        args.extend(index[key] for key in joins)
+        try:
+            if self._script is None:
+                self._script = redis_conn.register_script(_ACQUIRE_SCRIPT)
+            acquired = self._script(keys=keys, args=args, client=redis_conn)
+        except RedisError as e:
+            # Sem o Redis o job também não teria sido entregue; não trava o scan
+            logger.warning(f"Falha ao obter vaga por host para {holder}; executando sem limite: {e}")
+            return True
+        return bool(acquired)
+
+    def release(self, redis_conn, holder: str, targets: list[str]) -> None:
+        _, joins = self._plan(targets)
+        if not joins:
+            return
+        try:
+            pipe = redis_conn.pipeline(transaction=False)
+            for key in joins:
+                pipe.zrem(key, holder)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Falha ao liberar as vagas por host de {holder}: {e}")
+
+
+host_limiter = HostLimiter(settings.SCAN_HOST_CONCURRENCY, rate_slots())
@@ -0,0 +1,73 @@
+import logging
+import tempfile
+import time
+from typing import Callable
+
+from .nmap_merge import host_open_ports, merge_incremental
+from .nmap_runner import NmapRun, run_nmap_scan
+from .results import result_store
+
+logger = logging.getLogger(__name__)
+
+
+def plan_rescan(discovered: dict, baseline: dict, max_age: int, now: float,
+                baseline_time: float) -> tuple[list[str], set[str]]:
+    """
+    Separa os hosts da passada de descoberta entre os que passam pelo perfil
+    completo (ausentes da referência, com outro conjunto de portas abertas
+    ou com entrada mais antiga que `max_age` segundos) e os que são copiados
+    da referência. `baseline_time` vale para hosts sem endtime no XML.
+    """
+    rescan: list[str] = []
+    carried: set[str] = set()
+    for host, (open_ports, _) in discovered.items():
+        previous = baseline.get(host)
+        if previous is None or previous[0] != open_ports:
+            rescan.append(host)
+            continue
+        scanned_at = previous[1] or baseline_time
+        if now - scanned_at > max_age:
+            rescan.append(host)
+        else:
+            carried.add(host)
+    return rescan, carried
+
+
+def run_incremental_scan(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str,
+                         xml_key: str, baseline_key: str, baseline_time: float, max_age: int,
+                         on_progress: Callable[[dict], None] | None = None) -> NmapRun:
+    """
+    Rescan incremental contra o XML de referência em `baseline_key`: uma
+    passada de descoberta em todos os alvos e o perfil completo só nos hosts
+    que mudaram; os demais são copiados da referência. O resultado combinado
+    é gravado em `xml_key`, como em run_nmap_scan.
+    """
+    discovery_key = result_store.key_for(scan_id, "discovery.xml")
+    fresh_key = result_store.key_for(scan_id, "incremental.xml")
+    try:
+        run = run_nmap_scan(scan_id, targets, profile, ports, timing_template, discovery_key, on_progress, discovery=True)
+        if not run.stored:
+            return run
+
+        with result_store.open(discovery_key) as discovered, result_store.open(baseline_key) as baseline:
+            rescan, carried = plan_rescan(
+                host_open_ports(discovered), host_open_ports(baseline), max_age, time.time(), baseline_time
+            )
+        logger.info(f"Scan incremental {scan_id}: {len(rescan)} hosts a reexaminar, {len(carried)} copiados da referência.")
+
+        header_key = discovery_key
+        if rescan:
+            run = run_nmap_scan(scan_id, rescan, profile, ports, timing_template, fresh_key, on_progress)
+            if not run.stored:
+                return run
+            header_key = fresh_key
+
+        with tempfile.TemporaryFile() as merged:
+            with result_store.open(header_key) as fresh, result_store.open(baseline_key) as baseline:
+                merge_incremental(fresh, baseline, carried, merged, fresh_hosts=bool(rescan))
+            merged.seek(0)
+            stored = result_store.save_stream(xml_key, merged)
+        return NmapRun(returncode=run.returncode, stored=stored, stderr_tail=run.stderr_tail)
+    finally:
+        result_store.delete(discovery_key)
+        result_store.delete(fresh_key)
@@ -0,0 +1,302 @@
+import time
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Iterable
+from xml.sax.saxutils import quoteattr
+
+# Elementos de cabeçalho copiados apenas do primeiro arquivo (os scripts de
+# pré-scan não dependem dos alvos e rodam iguais em todos os shards)
+HEADER_TAGS = {"scaninfo", "verbose", "debugging", "prescript"}
+# Ruído de progresso do -vv que não faz sentido num resultado combinado
+SKIPPED_TAGS = {"taskbegin", "taskprogress", "taskend", "hosthint", "output"}
+
+
+class _RunStats:
+    def __init__(self):
+        self.finished = 0
+        self.up = 0
+        self.down = 0
+        self.total = 0
+        self.exit = "success"
+        self.errormsg = None
+
+    def add(self, runstats: ET.Element) -> None:
+        finished = runstats.find("finished")
+        if finished is not None:
+            self.finished = max(self.finished, int(finished.get("time", "0")))
+            if finished.get("exit", "success") != "success":
+                self.exit = finished.get("exit")
+                self.errormsg = finished.get("errormsg", self.errormsg)
+        hosts = runstats.find("hosts")
+        if hosts is not None:
+            self.up += int(hosts.get("up", "0"))
+            self.down += int(hosts.get("down", "0"))
+            self.total += int(hosts.get("total", "0"))
+
+    def to_xml(self, start: int) -> str:
+        finished = self.finished or int(time.time())
+        elapsed = max(0, finished - start) if start else 0
+        timestr = time.strftime("%a %b %d %H:%M:%S %Y", time.localtime(finished))
+        summary = (
+            f"Nmap done at {timestr}; {self.total} IP address{'es' if self.total != 1 else ''} "
+            f"({self.up} host{'s' if self.up != 1 else ''} up) scanned in {elapsed:.2f} seconds"
+        )
+        attrs = {
+            "time": str(finished),
+            "timestr": timestr,
+            "summary": summary,
+            "elapsed": f"{elapsed:.2f}",
+            "exit": self.exit,
+        }
+        if self.errormsg:
+            attrs["errormsg"] = self.errormsg
+        finished_tag = "<finished" + "".join(f" {k}={quoteattr(v)}" for k, v in attrs.items()) + "/>"
+        hosts_tag = f'<hosts up="{self.up}" down="{self.down}" total="{self.total}"/>'
+        return f"<runstats>{finished_tag}{hosts_tag}</runstats>\n"
+
+
+def _children(source: BinaryIO):
+    """(atributos do nmaprun, filhos diretos um a um) sem carregar o documento."""
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = elem
+                yield "root", dict(elem.attrib)
+            continue
+        depth -= 1
+        if depth == 1:
+            yield "child", elem
+            root.clear()
+
+
+class _MergedWriter:
+    """Escreve o documento combinado: cabeçalho do primeiro XML, filhos e runstats."""
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.stats = _RunStats()
+        self.start = 0
+        self.first = True
+        self.started = False
+
+    def write(self, text: str) -> None:
+        self.out.write(text.encode("utf-8"))
+
+    def feed(self, source: BinaryIO, on_host=None, on_other=None) -> None:
+        """
+        Copia os filhos de `source` para a saída. Se informados, `on_host` e
+        `on_other` recebem os hosts e os demais elementos em vez disso.
+        """
+        for kind, value in _children(source):
+            if kind == "root":
+                if self.first:
+                    self.start = int(value.get("start", "0"))
+                    attrs = "".join(f" {k}={quoteattr(v)}" for k, v in value.items())
+                    self.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE nmaprun>\n')
+                    self.write(f"<nmaprun{attrs}>\n")
+                    self.started = True
+                continue
+
+            tag = value.tag
+            if tag == "runstats":
+                self.stats.add(value)
+                continue
+            if tag in SKIPPED_TAGS or (tag in HEADER_TAGS and not self.first):
+                continue
+            if tag == "host" and on_host is not None:
+                on_host(value)
+            elif tag != "host" and on_other is not None:
+                on_other(value)
+            else:
+                self.write_element(value)
+        self.first = False
+
+    def write_element(self, elem: ET.Element) -> None:
+        elem.tail = "\n"
+        self.write(ET.tostring(elem, encoding="unicode"))
+
+    def close(self) -> None:
+        if not self.started:
+            raise ValueError("Nenhum XML para combinar.")
+        self.write(self.stats.to_xml(self.start))
+        self.write("</nmaprun>\n")
+
+
+def merge_nmap_xml(sources: Iterable[BinaryIO], out: BinaryIO) -> None:
+    """
+    Combina vários XMLs do Nmap sobre alvos distintos (ex.: um por shard de
+    alvos) em um único documento compatível com a saída do Nmap: atributos
+    do nmaprun e cabeçalho do primeiro arquivo, todos os hosts na ordem dos
+    arquivos e um runstats com os totais somados. Processa um elemento por vez.
+    """
+    writer = _MergedWriter(out)
+    for source in sources:
+        writer.feed(source)
+    writer.close()
+
+
+def _host_key(host: ET.Element) -> str:
+    addresses = host.findall("address")
+    for address in addresses:
+        if address.get("addrtype") in ("ipv4", "ipv6"):
+            return address.get("addr")
+    if addresses:
+        return addresses[0].get("addr")
+    hostname = host.find("hostnames/hostname")
+    return hostname.get("name") if hostname is not None else ET.tostring(host, encoding="unicode")
+
+
+def _merge_counts(into: ET.Element, other: ET.Element, child_tag: str, key_attr: str) -> None:
+    """Soma o atributo count de filhos com a mesma chave (extraports/extrareasons)."""
+    existing = {child.get(key_attr): child for child in into.findall(child_tag)}
+    for child in other.findall(child_tag):
+        match = existing.get(child.get(key_attr))
+        if match is None:
+            into.append(child)
+            existing[child.get(key_attr)] = child
+            continue
+        match.set("count", str(int(match.get("count", "0")) + int(child.get("count", "0"))))
+        _merge_counts(match, child, "extrareasons", "reason")
+
+
+def _merge_ports(into: ET.Element, other: ET.Element) -> None:
+    _merge_counts(into, other, "extraports", "state")
+    ports = into.findall("port") + other.findall("port")
+    for port in into.findall("port"):
+        into.remove(port)
+    ports.sort(key=lambda p: (p.get("protocol", ""), int(p.get("portid", "0"))))
+    into.extend(ports)
+
+
+def _merge_host(into: ET.Element, other: ET.Element) -> None:
+    """Funde em `into` o mesmo host visto por outro shard de portas."""
+    for attr, pick in (("starttime", min), ("endtime", max)):
+        if into.get(attr) and other.get(attr):
+            into.set(attr, str(pick(int(into.get(attr)), int(other.get(attr)))))
+
+    status, other_status = into.find("status"), other.find("status")
+    if other_status is not None and other_status.get("state") == "up" and (
+        status is None or status.get("state") != "up"
+    ):
+        if status is not None:
+            into.remove(status)
+        into.insert(0, other_status)
+
+    for child in other:
+        if child.tag == "status":
+            continue
+        current = into.find(child.tag)
+        if current is None:
+            into.append(child)
+        elif child.tag == "ports":
+            _merge_ports(current, child)
+        elif child.tag == "hostscript":
+            known = {script.get("id") for script in current.findall("script")}
+            current.extend(s for s in child.findall("script") if s.get("id") not in known)
+
+
+def combine_port_results(sources: Iterable[BinaryIO], out: BinaryIO) -> None:
+    """
+    Combina XMLs do Nmap dos mesmos alvos com faixas de portas diferentes
+    (shards de portas): cada host aparece uma vez, com as portas de todos os
+    arquivos. Os hosts ficam em memória até o fim, então o custo é
+    proporcional ao número de hosts dos alvos, não ao de arquivos.
+    """
+    writer = _MergedWriter(out)
+    hosts: dict[str, ET.Element] = {}
+    postscripts: list[ET.Element] = []
+    totals = []
+
+    def on_host(host: ET.Element) -> None:
+        key = _host_key(host)
+        if key in hosts:
+            _merge_host(hosts[key], host)
+        else:
+            hosts[key] = host
+
+    def on_other(elem: ET.Element) -> None:
+        # Mesmos alvos em todos os arquivos: um postscript basta, após os hosts
+        if elem.tag != "postscript":
+            writer.write_element(elem)
+        elif not postscripts:
+            postscripts.append(elem)
+
+    for source in sources:
+        before = writer.stats.total
+        writer.feed(source, on_host, on_other)
+        totals.append(writer.stats.total - before)
+
+    for elem in list(hosts.values()) + postscripts:
+        writer.write_element(elem)
+
+    # Todos os arquivos cobrem os mesmos alvos: os totais não se somam
+    up = sum(1 for h in hosts.values() if h.find("status") is not None and h.find("status").get("state") == "up")
+    total = max(totals, default=0) or len(hosts)
+    writer.stats.up, writer.stats.total = up, max(total, up)
+    writer.stats.down = writer.stats.total - up
+    writer.close()
+
+
+def iter_hosts(source: BinaryIO):
+    """(chave do host, elemento host) de um XML do Nmap, um host por vez."""
+    for kind, value in _children(source):
+        if kind == "child" and value.tag == "host":
+            yield _host_key(value), value
+
+
+def host_open_ports(source: BinaryIO) -> dict[str, tuple[frozenset[str], int | None]]:
+    """
+    Impressão digital de cada host de um XML do Nmap: conjunto de portas
+    abertas ("tcp/80") e o endtime do host (None se ausente).
+    """
+    hosts = {}
+    for key, value in iter_hosts(source):
+        open_ports = frozenset(
+            f"{port.get('protocol')}/{port.get('portid')}"
+            for port in value.iterfind("ports/port")
+            if port.find("state") is not None and port.find("state").get("state") == "open"
+        )
+        endtime = value.get("endtime")
+        hosts[key] = (open_ports, int(endtime) if endtime and endtime.isdigit() else None)
+    return hosts
+
+
+def merge_incremental(fresh: BinaryIO, baseline: BinaryIO, carried: set[str], out: BinaryIO,
+                      fresh_hosts: bool = True) -> None:
+    """
+    Resultado de um rescan incremental: nmaprun, cabeçalho e hosts
+    reexaminados de `fresh`, seguidos dos hosts `carried` copiados sem
+    alteração do XML de referência. Com fresh_hosts=False só o cabeçalho de
+    `fresh` é usado (nenhum host precisou ser reexaminado).
+    """
+    writer = _MergedWriter(out)
+    postscripts: list[ET.Element] = []
+    counts = {"up": 0, "total": 0}
+
+    def write_host(host: ET.Element) -> None:
+        status = host.find("status")
+        counts["up"] += status is not None and status.get("state") == "up"
+        counts["total"] += 1
+        writer.write_element(host)
+
+    def on_fresh_other(elem: ET.Element) -> None:
+        if elem.tag == "postscript":
+            postscripts.append(elem)
+        else:
+            writer.write_element(elem)
+
+    def carry_host(host: ET.Element) -> None:
+        if _host_key(host) in carried:
+            write_host(host)
+
+    writer.feed(fresh, write_host if fresh_hosts else (lambda host: None), on_fresh_other)
+    writer.feed(baseline, carry_host, lambda elem: None)
+    for elem in postscripts:
+        writer.write_element(elem)
+
+    # Os totais refletem os hosts escritos, não a soma dos arquivos
+    writer.stats.up, writer.stats.total = counts["up"], counts["total"]
+    writer.stats.down = counts["total"] - counts["up"]
+    writer.close()
@@ -0,0 +1,90 @@
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+
+class NmapProgressParser:
+    """
+    Acompanha o XML do Nmap (-oX -) conforme ele é produzido e mantém um
+    resumo do progresso: fase atual, percentual e ETC (elementos
+    taskbegin/taskprogress/taskend emitidos com --stats-every), hosts
+    concluídos e portas abertas encontradas. Cada filho do nmaprun é
+    descartado após processado, então a memória fica limitada ao maior host.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._depth = 0
+        self._root = None
+        self._start: int | None = None
+        self.phase: str | None = None
+        self.percent: float | None = None
+        self.etc: str | None = None
+        self.remaining_seconds: int | None = None
+        self.elapsed_seconds: int | None = None
+        self.hosts_completed = 0
+        self.hosts_up = 0
+        self.open_ports = 0
+
+    def feed(self, data: bytes) -> bool:
+        """Processa mais um bloco do XML; retorna True se o resumo mudou."""
+        self._parser.feed(data)
+        changed = False
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+                if self._depth == 1:
+                    self._root = elem
+                    if elem.get("start", "").isdigit():
+                        self._start = int(elem.get("start"))
+                continue
+
+            self._depth -= 1
+            if self._depth == 1:
+                changed = self._on_child(elem) or changed
+                self._root.clear()
+        return changed
+
+    def _elapsed(self, elem: ET.Element) -> None:
+        if self._start is not None and elem.get("time", "").isdigit():
+            self.elapsed_seconds = int(elem.get("time")) - self._start
+
+    def _on_child(self, elem: ET.Element) -> bool:
+        if elem.tag == "taskbegin":
+            self.phase, self.percent, self.etc, self.remaining_seconds = elem.get("task"), 0.0, None, None
+            self._elapsed(elem)
+            return True
+        if elem.tag == "taskprogress":
+            self.phase = elem.get("task")
+            self.percent = float(elem.get("percent", "0"))
+            self.remaining_seconds = int(elem.get("remaining")) if elem.get("remaining", "").isdigit() else None
+            etc = elem.get("etc", "")
+            self.etc = datetime.fromtimestamp(int(etc), timezone.utc).isoformat() if etc.isdigit() else None
+            self._elapsed(elem)
+            return True
+        if elem.tag == "taskend":
+            self.phase, self.percent, self.etc, self.remaining_seconds = elem.get("task"), 100.0, None, 0
+            self._elapsed(elem)
+            return True
+        if elem.tag == "host":
+            self.hosts_completed += 1
+            status = elem.find("status")
+            if status is not None and status.get("state") == "up":
+                self.hosts_up += 1
+            self.open_ports += sum(
+                1 for port in elem.iterfind("ports/port")
+                if port.find("state") is not None and port.find("state").get("state") == "open"
+            )
+            return True
+        return False
+
+    def snapshot(self) -> dict:
+        return {
+            "phase": self.phase,
+            "percent": self.percent,
+            "etc": self.etc,
+            "remaining_seconds": self.remaining_seconds,
+            "elapsed_seconds": self.elapsed_seconds,
+            "hosts_completed": self.hosts_completed,
+            "hosts_up": self.hosts_up,
+            "open_ports": self.open_ports,
+        }
@@ -1,7 +1,15 @@
 import subprocess
-import tempfile
 import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+from xml.etree.ElementTree import ParseError
+from ..config import settings
 from ..schemas import ScanProfile, TimingTemplate
+from .nmap_progress import NmapProgressParser
+from .nmap_stream import strip_progress_elements
+from .results import CHUNK_SIZE, StoredResult, result_store
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +21,49 @@ SCAN_PROFILES_COMMANDS = {
     ScanProfile.PROXY_VULN_SCAN: ["proxychains", "-q", "nmap", "-A", "-Pn", "-sT", "--script=vuln"]
 }
 
-def run_nmap_scan(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str) -> tuple[str, str, str]:
+# Passada barata dos rescans incrementais: só o estado das portas, com o mesmo
+# tipo de scan (e evasão/proxy) do perfil, sem detecção de versão nem scripts
+SCAN_DISCOVERY_COMMANDS = {
+    ScanProfile.BASIC_VERSION_DETECTION: ["-Pn"],
+    ScanProfile.AGGRESSIVE_SCAN: ["-Pn"],
+    ScanProfile.VULN_TCP_EVASIVE: ["-n", "-Pn", "-sT", "-f", "--mtu", "24"],
+    ScanProfile.VULN_SYN_STEALTH: ["-n", "-Pn", "-sS", "-f", "--mtu", "24"],
+    ScanProfile.PROXY_VULN_SCAN: ["proxychains", "-q", "nmap", "-Pn", "-sT"]
+}
+
+NMAP_TIMEOUT_SECONDS = 7200
+# Só o final do stderr é mantido, para o log de erros
+STDERR_TAIL_LINES = 200
+STDERR_MAX_LINE = 4096
+
+
+@dataclass
+class NmapRun:
+    returncode: int | None
+    # XML já gravado no armazenamento de resultados (None se vazio/ausente)
+    stored: StoredResult | None
+    stderr_tail: str
+    timed_out: bool = False
+
+
+def _drain_tail(stream, tail: deque) -> None:
+    for line in iter(lambda: stream.readline(STDERR_MAX_LINE), b""):
+        tail.append(line.decode("utf-8", errors="replace"))
+
+
+def run_nmap_scan(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str,
+                  xml_key: str, on_progress: Callable[[dict], None] | None = None, discovery: bool = False) -> NmapRun:
+    """
+    Executa o Nmap com o XML na saída padrão (-oX -) e o grava, em blocos,
+    direto no armazenamento de resultados sob `xml_key`. O mesmo fluxo
+    alimenta o acompanhamento de progresso (`on_progress`), o único que vê os
+    elementos do --stats-every: eles não são gravados. Do stderr fica
+    só o final, em memória; a memória do worker não depende do tamanho da
+    saída.
+
+    Com `discovery`, executa a variante barata do perfil
+    (SCAN_DISCOVERY_COMMANDS) usada pelos rescans incrementais.
+    """
     try:
         profile_enum = ScanProfile(profile)
     except ValueError:
@@ -22,12 +72,7 @@ def run_nmap_scan(scan_id: str, targets: list[str], profile: str, ports: str | N
     if profile_enum not in SCAN_PROFILES_COMMANDS:
         raise ValueError("Perfil de scan não implementado")
 
-    with tempfile.NamedTemporaryFile(
-        delete=False, mode='w', suffix='.xml', prefix=f"nmap_{scan_id}_"
-    ) as tmp_xml:
-        xml_output_path = tmp_xml.name
-    
-    base_command = SCAN_PROFILES_COMMANDS[profile_enum]
+    base_command = (SCAN_DISCOVERY_COMMANDS if discovery else SCAN_PROFILES_COMMANDS)[profile_enum]
     command = []
     
     if profile_enum == ScanProfile.PROXY_VULN_SCAN:
@@ -36,9 +81,12 @@ def run_nmap_scan(scan_id: str, targets: list[str], profile: str, ports: str | N
         command.append("/usr/bin/nmap")
         command.extend(base_command)
 
-    command.extend(["-oX", xml_output_path])
+    command.extend(["-oX", "-"])
     command.append(f"-{timing_template}")
     command.append("-vv")
+    command.extend(["--stats-every", f"{settings.NMAP_STATS_EVERY_SECONDS}s"])
+    if settings.NMAP_MAX_RATE > 0:
+        command.extend(["--max-rate", str(settings.NMAP_MAX_RATE)])
     
     if ports:
         command.extend(["-p", ports])
@@ -46,32 +94,64 @@ def run_nmap_scan(scan_id: str, targets: list[str], profile: str, ports: str | N
     command.extend(targets)
 
     logger.info(f"Executando Nmap para o scan {scan_id}: {' '.join(command)}")
-    
+
     try:
-        process = subprocess.run(
+        process = subprocess.Popen(
             command,
-            capture_output=True,
-            text=True,
-            check=False,
-            timeout=7200,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
         )
-        
-        stdout_path = f"{xml_output_path}.out"
-        stderr_path = f"{xml_output_path}.err"
-
-        with open(stdout_path, "w") as f_out:
-            f_out.write(process.stdout)
-        with open(stderr_path, "w") as f_err:
-            f_err.write(process.stderr)
-        
-        if process.returncode != 0:
-            logger.error(f"Scan Nmap {scan_id} falhou com código {process.returncode}: {process.stderr}")
-            
-        return xml_output_path, stdout_path, stderr_path
-
-    except subprocess.TimeoutExpired:
-        logger.error(f"Scan Nmap {scan_id} excedeu o tempo limite.")
-        return "", "", ""
     except FileNotFoundError:
         logger.critical("Comando nmap ou proxychains não encontrado.")
-        return "", "", ""
\ No newline at end of file
+        return NmapRun(returncode=None, stored=None, stderr_tail="")
+
+    stderr_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(target=_drain_tail, args=(process.stderr, stderr_tail), daemon=True)
+    stderr_reader.start()
+
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    parser = NmapProgressParser() if on_progress else None
+
+    def xml_chunks():
+        nonlocal parser
+        # read1 devolve o que já estiver disponível, sem esperar CHUNK_SIZE bytes
+        for chunk in iter(lambda: process.stdout.read1(CHUNK_SIZE), b""):
+            if parser is not None:
+                try:
+                    if parser.feed(chunk):
+                        on_progress(parser.snapshot())
+                except ParseError:
+                    parser = None
+            yield chunk
+
+    timer = threading.Timer(NMAP_TIMEOUT_SECONDS, kill_on_timeout)
+    timer.start()
+    try:
+        stored = result_store.save_chunks(xml_key, strip_progress_elements(xml_chunks()))
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_reader.join()
+
+    tail = "".join(stderr_tail)
+    if timed_out.is_set():
+        logger.error(f"Scan Nmap {scan_id} excedeu o tempo limite.")
+        result_store.delete(xml_key)
+        return NmapRun(returncode=returncode, stored=None, stderr_tail=tail, timed_out=True)
+
+    if returncode != 0:
+        logger.error(f"Scan Nmap {scan_id} falhou com código {returncode}: {tail}")
+
+    if stored.size == 0:
+        result_store.delete(xml_key)
+        stored = None
+    return NmapRun(returncode=returncode, stored=stored, stderr_tail=tail)
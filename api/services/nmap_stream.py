@@ -0,0 +1,199 @@
+import re
+import json
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Iterable, Iterator
+
+from .nmap_merge import SKIPPED_TAGS
+
+ATTR_PREFIX = "@"
+CDATA_KEY = "#text"
+FLUSH_SIZE = 64 * 1024
+
+# Linha que abre um elemento de SKIPPED_TAGS (o Nmap escreve cada filho do
+# nmaprun a partir do início de uma linha)
+_SKIPPED_LINE = re.compile(rb"\s*<(" + b"|".join(t.encode() for t in sorted(SKIPPED_TAGS)) + rb")[\s/>]")
+_SKIPPED_PREFIX = 64
+_LINE_PIECES = re.compile(rb"[^\n]*\n|[^\n]+")
+
+
+def _push(item: dict | None, key: str, value) -> dict:
+    """Mesma regra do xmltodict: chaves repetidas viram lista, na ordem do documento."""
+    if item is None:
+        item = {}
+    if key in item:
+        current = item[key]
+        if isinstance(current, list):
+            current.append(value)
+        else:
+            item[key] = [current, value]
+    else:
+        item[key] = value
+    return item
+
+
+def element_to_value(elem: ET.Element):
+    """Converte um elemento (já completo) no mesmo valor que xmltodict.parse produziria."""
+    item = {ATTR_PREFIX + k: v for k, v in elem.attrib.items()} or None
+    texts = [elem.text] if elem.text else []
+    for child in elem:
+        item = _push(item, child.tag, element_to_value(child))
+        if child.tail:
+            texts.append(child.tail)
+    data = "".join(texts).strip() or None
+    if item is not None:
+        if data:
+            item = _push(item, CDATA_KEY, data)
+        return item
+    return data
+
+
+def iter_nmaprun(source: BinaryIO) -> Iterator[tuple[str, str, object]]:
+    """
+    Percorre o XML do Nmap de forma incremental. Produz ("attrs", tag, dict)
+    para o elemento raiz e ("child", tag, valor) para cada filho direto dele
+    (um host por vez). Cada filho é descartado após convertido, então a
+    memória fica limitada ao maior host e não ao documento.
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = elem
+                yield "attrs", elem.tag, {ATTR_PREFIX + k: v for k, v in elem.attrib.items()}
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield "child", elem.tag, element_to_value(elem)
+            root.clear()
+
+
+def strip_progress_elements(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Remove do XML do Nmap, conforme ele passa, os elementos de SKIPPED_TAGS
+    (taskbegin/taskprogress/taskend do --stats-every, hosthint, output):
+    servem só ao acompanhamento de progresso e não devem ir para o resultado
+    armazenado, o JSON nem o ETag. Trabalha por linha; só o começo de cada
+    linha fica em memória até se saber se ela é mantida.
+    """
+    line = b""
+    keep = None       # decisão sobre a linha atual: None (ainda não), True, False
+    tag, tag_end = b"", 0
+    closing = None    # fechamento procurado dentro de um elemento de várias linhas
+    for chunk in chunks:
+        out = []
+        for piece in _LINE_PIECES.findall(chunk):
+            complete = piece.endswith(b"\n")
+            if keep:
+                out.append(piece)
+            else:
+                line += piece
+                if keep is None and closing is None and (complete or len(line) >= _SKIPPED_PREFIX):
+                    match = _SKIPPED_LINE.match(line)
+                    if match is None:
+                        keep = True
+                        out.append(line)
+                    else:
+                        keep, tag, tag_end = False, match.group(1), match.end() - 1
+            if not complete:
+                continue
+            if keep is False:
+                end = line.find(b">", tag_end)
+                if line[end - 1:end] != b"/" and b"</" + tag + b">" not in line:
+                    closing = b"</" + tag + b">"
+            elif closing is not None and closing in line:
+                closing = None
+            line, keep = b"", None
+        if out:
+            yield b"".join(out)
+    if line and keep is None and closing is None:
+        yield line
+
+
+def _dumps(value) -> str:
+    return json.dumps(value)
+
+
+def _batched(parts: Iterator[str]) -> Iterator[bytes]:
+    buffer: list[str] = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= FLUSH_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _json_parts(source: BinaryIO) -> Iterator[str]:
+    root_tag = None
+    entries: list[str] = []        # pares "chave": valor já serializados, antes dos hosts
+    others: dict | None = None     # demais filhos do nmaprun, agrupados como no xmltodict
+    first_host = None
+    host_count = 0
+    emitted = False
+
+    for kind, tag, value in iter_nmaprun(source):
+        if kind == "attrs":
+            root_tag = tag
+            entries = [f"{_dumps(k)}: {_dumps(v)}" for k, v in value.items()]
+            continue
+        if tag in SKIPPED_TAGS:
+            continue
+        if tag != "host":
+            others = _push(others, tag, value)
+            continue
+
+        host_count += 1
+        if host_count == 1:
+            first_host = value
+        elif host_count == 2:
+            entries.append(f'"host": [{_dumps(first_host)}')
+            yield f"{{{_dumps(root_tag)}: {{" + ", ".join(entries)
+            yield f", {_dumps(value)}"
+            first_host, entries, emitted = None, [], True
+        else:
+            yield f", {_dumps(value)}"
+
+    if root_tag is None:
+        raise ValueError("Documento XML vazio.")
+
+    tail: list[str] = []
+    if host_count == 1:
+        entries.append(f'"host": {_dumps(first_host)}')
+    for key, value in (others or {}).items():
+        tail.append(f"{_dumps(key)}: {_dumps(value)}")
+
+    if emitted:
+        yield "]" + "".join(f", {t}" for t in tail) + "}}"
+        return
+
+    entries.extend(tail)
+    if not entries:
+        yield f"{{{_dumps(root_tag)}: null}}"
+    else:
+        yield f"{{{_dumps(root_tag)}: {{" + ", ".join(entries) + "}}"
+
+
+def iter_nmap_json(source: BinaryIO) -> Iterator[bytes]:
+    """
+    JSON equivalente a json.dumps(xmltodict.parse(xml)) gerado em blocos, sem
+    montar o documento inteiro. As diferenças: "host" vem antes dos demais
+    filhos do nmaprun (scaninfo, runstats, ...) e os elementos de
+    SKIPPED_TAGS, de resultados gravados antes de strip_progress_elements,
+    ficam de fora.
+    """
+    return _batched(_json_parts(source))
+
+
+def iter_nmap_ndjson(source: BinaryIO) -> Iterator[bytes]:
+    """Um host por linha, no mesmo formato dos itens de nmaprun.host."""
+    return _batched(
+        _dumps(value) + "\n"
+        for kind, tag, value in iter_nmaprun(source)
+        if kind == "child" and tag == "host"
+    )
@@ -0,0 +1,187 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+from redis.exceptions import RedisError
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+RATE_BUCKET_PREFIX = "autonmap:rate:"
+ACTIVE_SCANS_PREFIX = "autonmap:active-scans:"
+# Chave de `Token.rate_limits` que vale para as rotas sem limite próprio
+DEFAULT_ROUTE = "default"
+# Esperas longas e streams: uma requisição dura minutos, então o limite
+# padrão não vale para elas, só um limite dado explicitamente à rota
+LONG_POLL_ROUTES = frozenset({"wait_for_scans", "wait_for_scan", "stream_scan_events"})
+# Sugestão de nova tentativa quando a cota de scans ativos está cheia
+QUOTA_RETRY_AFTER_SECONDS = 30
+
+# Balde de fichas: o hash guarda as fichas e o instante da última conta.
+# ARGV: agora, fichas por segundo, capacidade. Retorna (permitido, fichas
+# restantes, segundos até a próxima ficha, segundos até encher), os
+# números como texto para não perder as frações.
+_BUCKET_SCRIPT = """
+local now, rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+tokens = math.min(capacity, tokens + elapsed * rate)
+local allowed, wait = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+local full = (capacity - tokens) / rate
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(full) + 1)
+return {allowed, tostring(tokens), tostring(wait), tostring(full)}
+"""
+
+# Ocupa vagas de scans ativos (sorted set de ids com a expiração como
+# score) enquanto couberem no limite. ARGV: agora, expiração, limite, ids.
+# Retorna quantos dos ids, na ordem, foram admitidos.
+_ACQUIRE_SCRIPT = """
+local now, expires, limit = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local admitted = 0
+for i = 4, #ARGV do
+    if redis.call('ZCARD', KEYS[1]) >= limit then break end
+    redis.call('ZADD', KEYS[1], expires, ARGV[i])
+    admitted = admitted + 1
+end
+if admitted > 0 then
+    redis.call('EXPIREAT', KEYS[1], math.ceil(expires))
+end
+return admitted
+"""
+
+
+@dataclass
+class RateLimitStatus:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+    reset: int
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def route_rate_limit(token, route: str) -> int:
+    """
+    Requisições por minuto do token na rota (0 = sem limite). Vale, nesta
+    ordem, o limite da rota no token, o da rota em RATE_LIMIT_ROUTES, o
+    "default" do token e RATE_LIMIT_PER_MINUTE; os dois últimos não valem
+    para LONG_POLL_ROUTES.
+    """
+    overrides = token.rate_limits or {}
+    for limits in (overrides, settings.RATE_LIMIT_ROUTES):
+        if route in limits:
+            return limits[route]
+    if route in LONG_POLL_ROUTES:
+        return 0
+    return overrides.get(DEFAULT_ROUTE, settings.RATE_LIMIT_PER_MINUTE)
+
+
+def active_scan_limit(token) -> int:
+    """Scans na fila ou em execução permitidos ao token (0 = sem limite)."""
+    if token.max_active_scans is not None:
+        return token.max_active_scans
+    return settings.SCAN_MAX_ACTIVE_PER_TOKEN
+
+
+class RateLimiter:
+    """
+    Limite de requisições por token e rota em balde de fichas no Redis: a
+    capacidade é o limite por minuto, reposta continuamente ao longo do
+    minuto, de modo que rajadas até o limite passam e o ritmo sustentado
+    fica nele.
+    """
+
+    def __init__(self):
+        self._script = None
+
+    def hit(self, redis_conn, token, route: str) -> RateLimitStatus | None:
+        """Consome uma ficha. Retorna None se a rota não tem limite ou sem o Redis."""
+        limit = route_rate_limit(token, route)
+        if limit <= 0:
+            return None
+        try:
+            if self._script is None:
+                self._script = redis_conn.register_script(_BUCKET_SCRIPT)
+            allowed, tokens, wait, full = self._script(
+                keys=[f"{RATE_BUCKET_PREFIX}{token.id}:{route}"],
+                args=[time.time(), limit / 60, limit],
+                client=redis_conn,
+            )
+        except RedisError as e:
+            # Não derruba a API por falta do Redis; os scans em si já dependem dele
+            logger.warning(f"Falha ao aplicar o limite de requisições do token {token.id} em {route}: {e}")
+            return None
+        return RateLimitStatus(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=int(float(tokens)),
+            retry_after=max(1, math.ceil(float(wait))),
+            reset=math.ceil(float(full)),
+        )
+
+
+class ActiveScanQuota:
+    """
+    Cota de scans ativos (na fila ou em execução) por token: a API ocupa
+    uma vaga por scan antes de enfileirá-lo e o worker a libera quando o
+    scan termina. Vagas de scans perdidos (worker morto) expiram após
+    SCAN_INFLIGHT_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._script = None
+
+    def acquire(self, redis_conn, token, scan_ids: list) -> int:
+        """Ocupa vagas para os scans, na ordem. Retorna quantos couberam."""
+        limit = active_scan_limit(token)
+        if limit <= 0 or not scan_ids:
+            return len(scan_ids)
+        now = time.time()
+        try:
+            if self._script is None:
+                self._script = redis_conn.register_script(_ACQUIRE_SCRIPT)
+            return self._script(
+                keys=[f"{ACTIVE_SCANS_PREFIX}{token.id}"],
+                args=[now, now + settings.SCAN_INFLIGHT_TTL_SECONDS, limit, *(str(scan_id) for scan_id in scan_ids)],
+                client=redis_conn,
+            )
+        except RedisError as e:
+            logger.warning(f"Falha ao verificar a cota de scans ativos do token {token.id}; seguindo sem cota: {e}")
+            return len(scan_ids)
+
+    def release(self, redis_conn, scans: list[tuple[int | None, object]]) -> None:
+        """Libera as vagas de (token_id, scan_id) já concluídos."""
+        scans = [(token_id, scan_id) for token_id, scan_id in scans if token_id is not None]
+        if not scans:
+            return
+        try:
+            pipe = redis_conn.pipeline(transaction=False)
+            for token_id, scan_id in scans:
+                pipe.zrem(f"{ACTIVE_SCANS_PREFIX}{token_id}", str(scan_id))
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Falha ao liberar a cota de scans ativos: {e}")
+
+
+rate_limiter = RateLimiter()
+active_scan_quota = ActiveScanQuota()
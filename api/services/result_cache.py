@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from ipaddress import ip_network
+
+from ..config import settings
+from .sharding import format_port_spec, parse_port_spec
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_PREFIX = "autonmap:result-cache:"
+
+
+def _normalize_target(target: str) -> str:
+    target = target.strip()
+    try:
+        return str(ip_network(target, strict=False))
+    except ValueError:
+        return target.lower().rstrip(".")
+
+
+def _normalize_ports(ports: str | None) -> str | None:
+    if not ports:
+        return None
+    try:
+        return format_port_spec(parse_port_spec(ports))
+    except ValueError:
+        return ports
+
+
+def scan_fingerprint(token_id: int, targets: list[str], profile: str, ports: str | None, timing_template: str,
+                     baseline_id=None, baseline_max_age: int | None = None) -> str:
+    """
+    Identificador canônico do que o scan executa: alvos normalizados (sem
+    ordem nem repetição), perfil, portas normalizadas e timing template.
+    Scans com a mesma impressão digital produzem resultados equivalentes.
+    Rescans incrementais incluem a referência e o baseline_max_age, que
+    decidem quais hosts são copiados dela.
+
+    Inclui o token que criou o scan: cache, agrupamento de scans pendentes e
+    referência do webhook delta só reaproveitam scans do próprio token, os
+    mesmos que ele pode ver.
+    """
+    canonical = {
+        "token_id": token_id,
+        "targets": sorted({_normalize_target(t) for t in targets}),
+        "profile": profile,
+        "ports": _normalize_ports(ports),
+        "timing_template": timing_template,
+    }
+    if baseline_id:
+        canonical["baseline_id"] = str(baseline_id)
+        if baseline_max_age is not None:
+            canonical["baseline_max_age"] = baseline_max_age
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Índice no Redis de impressão digital -> último scan bem-sucedido, com
+    contadores de acerto desta réplica. As entradas expiram após
+    RESULT_CACHE_TTL_SECONDS, o mesmo prazo pelo qual um resultado pode
+    ser reaproveitado.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def remember(self, redis_conn, fingerprint: str | None, scan_id, finished_at) -> None:
+        if not fingerprint or self.ttl_seconds <= 0:
+            return
+        entry = json.dumps({"scan_id": str(scan_id), "finished_at": finished_at.timestamp()})
+        try:
+            redis_conn.set(RESULT_CACHE_PREFIX + fingerprint, entry, ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Falha ao indexar o resultado do scan {scan_id} no cache: {e}")
+
+    def lookup(self, redis_conn, fingerprint: str, max_age: int, is_valid=None) -> str | None:
+        """
+        Id do scan cujo resultado tem no máximo `max_age` segundos, se houver.
+        `is_valid(scan_id)` confirma que o resultado ainda existe; entradas
+        que não passam são removidas e contadas como falta.
+        """
+        try:
+            raw = redis_conn.get(RESULT_CACHE_PREFIX + fingerprint)
+        except Exception as e:
+            logger.warning(f"Falha ao consultar o cache de resultados: {e}")
+            raw = None
+
+        if raw is None:
+            self._count("misses")
+            return None
+        entry = json.loads(raw)
+        if time.time() - entry["finished_at"] > max_age:
+            self._count("stale")
+            return None
+        if is_valid is not None and not is_valid(entry["scan_id"]):
+            self._forget(redis_conn, fingerprint)
+            self._count("misses")
+            return None
+        self._count("hits")
+        return entry["scan_id"]
+
+    def _forget(self, redis_conn, fingerprint: str) -> None:
+        try:
+            redis_conn.delete(RESULT_CACHE_PREFIX + fingerprint)
+        except Exception as e:
+            logger.warning(f"Falha ao remover entrada do cache de resultados: {e}")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "lookups": lookups,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_TTL_SECONDS)
@@ -0,0 +1,185 @@
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+
+from ..config import settings
+from ..db.models import ScanResult
+from .host_index import index_scan_hosts
+from .nmap_stream import iter_nmap_json
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class StoredResult:
+    storage_key: str
+    encoding: str
+    size: int
+    stored_size: int
+    sha256: str
+
+
+class _DigestingWriter:
+    """Arquivo de escrita que compacta em gzip e conta/hasheia os bytes originais."""
+
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self._gzip = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=settings.RESULT_COMPRESSION_LEVEL, mtime=0)
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        self.size += len(data)
+        return self._gzip.write(data)
+
+    def close(self) -> None:
+        self._gzip.close()
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+
+class LocalResultStore:
+    """
+    Armazena resultados de scans compactados (gzip) em disco local, fora da
+    tabela `scans`. API e worker precisam enxergar o mesmo diretório
+    (volume compartilhado no compose).
+    """
+
+    encoding = "gzip"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def key_for(self, scan_id: str, name: str) -> str:
+        return f"{scan_id}/{name}.gz"
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Chave de resultado inválida: {key}")
+        return path
+
+    def save_chunks(self, key: str, chunks: Iterable[bytes]) -> StoredResult:
+        """Grava os blocos no armazenamento, compactando no caminho (escrita atômica)."""
+        target = self.path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                writer = _DigestingWriter(raw)
+                for chunk in chunks:
+                    writer.write(chunk)
+                writer.close()
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return StoredResult(
+            storage_key=key,
+            encoding=self.encoding,
+            size=writer.size,
+            stored_size=target.stat().st_size,
+            sha256=writer.sha256,
+        )
+
+    def save_stream(self, key: str, source: BinaryIO) -> StoredResult:
+        """Copia `source` em blocos para o armazenamento."""
+        return self.save_chunks(key, iter(lambda: source.read(CHUNK_SIZE), b""))
+
+    def save_file(self, key: str, source_path: str) -> StoredResult:
+        with open(source_path, 'rb') as source:
+            return self.save_stream(key, source)
+
+    def save_bytes(self, key: str, data: bytes) -> StoredResult:
+        return self.save_stream(key, io.BytesIO(data))
+
+    def open(self, key: str) -> BinaryIO:
+        """Leitor já descompactado."""
+        return gzip.open(self.path(key), 'rb')
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def iter_raw_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Bytes exatamente como armazenados (ainda compactados)."""
+        with open(self.path(key), 'rb') as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def read_bytes(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def delete(self, key: str) -> None:
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+result_store = LocalResultStore(settings.RESULT_STORAGE_PATH)
+
+
+def record_result(db, scan_id, kind: str, stored: StoredResult) -> ScanResult:
+    """Registra (ou substitui) os metadados de um resultado armazenado."""
+    return db.merge(ScanResult(
+        scan_id=scan_id,
+        kind=kind,
+        storage_key=stored.storage_key,
+        encoding=stored.encoding,
+        size=stored.size,
+        stored_size=stored.stored_size,
+        sha256=stored.sha256,
+    ))
+
+
+def ingest_stored_xml(db, scan_id, stored_xml: StoredResult) -> None:
+    """
+    Registra o XML bruto (já no armazenamento) de um scan concluído e gera
+    o JSON canônico a partir dele. O JSON é gerado uma única vez aqui, de
+    forma incremental (host a host), assim como o índice de hosts usado
+    para comparar scans.
+    """
+    record_result(db, scan_id, "xml", stored_xml)
+
+    with result_store.open(stored_xml.storage_key) as f:
+        stored_json = result_store.save_chunks(
+            result_store.key_for(str(scan_id), "result.json"), iter_nmap_json(f)
+        )
+    record_result(db, scan_id, "json", stored_json)
+
+    with result_store.open(stored_xml.storage_key) as f:
+        index_scan_hosts(db, scan_id, f)
+
+
+def ingest_xml_result(db, scan_id, xml_path: str) -> None:
+    """Como ingest_stored_xml, a partir de um arquivo XML local."""
+    stored_xml = result_store.save_file(result_store.key_for(str(scan_id), "result.xml"), xml_path)
+    ingest_stored_xml(db, scan_id, stored_xml)
+
+
+def copy_result_rows(scan_id, results: list[ScanResult]) -> list[dict]:
+    """Linhas de resultado de outro scan para `scan_id`, apontando para os mesmos arquivos."""
+    return [
+        {
+            "scan_id": scan_id,
+            "kind": r.kind,
+            "storage_key": r.storage_key,
+            "encoding": r.encoding,
+            "size": r.size,
+            "stored_size": r.stored_size,
+            "sha256": r.sha256,
+        }
+        for r in results
+    ]
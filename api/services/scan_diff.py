@@ -0,0 +1,145 @@
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..db.models import Scan, ScanHost, ScanResult
+from .host_index import index_scan_hosts
+from .results import result_store
+
+# Endereços por consulta ao carregar os detalhes dos hosts alterados
+DETAIL_BATCH_SIZE = 1000
+
+
+def ensure_host_index(db: Session, scan: Scan) -> bool:
+    """
+    Garante o índice de hosts do scan, gerando-o a partir do XML armazenado
+    para resultados anteriores à indexação. False se não há resultado.
+    """
+    if scan.host_count is not None:
+        return True
+    result = db.get(ScanResult, (scan.id, "xml"))
+    if not result:
+        return False
+    with result_store.open(result.storage_key) as f:
+        index_scan_hosts(db, scan.id, f)
+    db.commit()
+    db.refresh(scan)
+    return True
+
+
+def _host_states(db: Session, scan_id) -> dict[str, tuple[str, str]]:
+    rows = db.execute(
+        select(ScanHost.address, ScanHost.status, ScanHost.digest).where(ScanHost.scan_id == scan_id)
+    )
+    return {address: (status, digest) for address, status, digest in rows}
+
+
+def _host_data(db: Session, scan_id, addresses: list[str]) -> dict[str, dict]:
+    data = {}
+    for i in range(0, len(addresses), DETAIL_BATCH_SIZE):
+        rows = db.execute(
+            select(ScanHost.address, ScanHost.data)
+            .where(ScanHost.scan_id == scan_id, ScanHost.address.in_(addresses[i:i + DETAIL_BATCH_SIZE]))
+        )
+        data.update({address: host_data for address, host_data in rows})
+    return data
+
+
+def _open_ports(data: dict) -> set[str]:
+    return {port for port, entry in data.get("ports", {}).items() if entry.get("state") == "open"}
+
+
+def _script_changes(before: dict, after: dict, port: str | None) -> list[dict]:
+    changes = []
+    for script_id in sorted(before.keys() | after.keys()):
+        if script_id not in before:
+            change = "added"
+        elif script_id not in after:
+            change = "removed"
+        elif before[script_id] != after[script_id]:
+            change = "changed"
+        else:
+            continue
+        changes.append({"port": port, "id": script_id, "change": change})
+    return changes
+
+
+def _host_delta(address: str, before: dict, after: dict) -> dict:
+    before_open, after_open = _open_ports(before), _open_ports(after)
+    services, scripts = [], _script_changes(before.get("scripts", {}), after.get("scripts", {}), None)
+    for port in sorted(before_open & after_open):
+        old, new = before["ports"][port], after["ports"][port]
+        if old.get("service") != new.get("service"):
+            services.append({"port": port, "before": old.get("service"), "after": new.get("service")})
+        scripts.extend(_script_changes(old.get("scripts", {}), new.get("scripts", {}), port))
+    for port in sorted(after_open - before_open):
+        scripts.extend(_script_changes({}, after["ports"][port].get("scripts", {}), port))
+    return {
+        "address": address,
+        "ports_opened": sorted(after_open - before_open),
+        "ports_closed": sorted(before_open - after_open),
+        "services_changed": services,
+        "scripts_changed": scripts,
+    }
+
+
+def diff_scans(db: Session, before_id: UUID | None, after_id: UUID) -> dict:
+    """
+    Diferenças entre os resultados indexados de dois scans (ambos já com
+    ensure_host_index). Só os hosts cujo digest mudou são carregados por
+    completo. Sem `before_id`, todos os hosts ativos de `after_id` contam
+    como novos.
+    """
+    before = _host_states(db, before_id) if before_id else {}
+    after = _host_states(db, after_id)
+
+    def up(states: dict, address: str) -> bool:
+        return address in states and states[address][0] == "up"
+
+    added = sorted(address for address in after if up(after, address) and not up(before, address))
+    removed = sorted(address for address in before if up(before, address) and not up(after, address))
+    both = [address for address in after if up(after, address) and up(before, address)]
+    changed = sorted(address for address in both if before[address][1] != after[address][1])
+
+    after_data = _host_data(db, after_id, added + changed)
+    before_data = _host_data(db, before_id, changed) if changed else {}
+    hosts_changed = []
+    for address in changed:
+        delta = _host_delta(address, before_data[address], after_data[address])
+        if delta["ports_opened"] or delta["ports_closed"] or delta["services_changed"] or delta["scripts_changed"]:
+            hosts_changed.append(delta)
+
+    return {
+        "before": before_id,
+        "after": after_id,
+        "hosts_added": [
+            {"address": address, "open_ports": sorted(_open_ports(after_data[address]))} for address in added
+        ],
+        "hosts_removed": removed,
+        "hosts_changed": hosts_changed,
+        "hosts_unchanged": len(both) - len(hosts_changed),
+    }
+
+
+def delta_reference(db: Session, scan: Scan) -> Scan | None:
+    """
+    Scan contra o qual o webhook "delta" compara: a referência do rescan
+    incremental ou, sem ela, o último scan bem-sucedido idêntico anterior.
+    """
+    if scan.baseline_id:
+        return db.get(Scan, scan.baseline_id)
+    if not scan.fingerprint:
+        return None
+    return db.execute(
+        select(Scan)
+        .where(
+            Scan.fingerprint == scan.fingerprint,
+            Scan.status == "succeeded",
+            Scan.id != scan.id,
+            # Estrito: exclui os scans agrupados a este, que terminam junto
+            Scan.finished_at < scan.finished_at,
+        )
+        .order_by(Scan.finished_at.desc())
+        .limit(1)
+    ).scalar()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import time
+
+from redis.asyncio import Redis as AsyncRedis
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+# Último estado de cada tipo de evento, para quem se inscreve no meio do scan
+EVENT_STATE_TTL = 24 * 3600
+
+async_redis = AsyncRedis.from_url(settings.REDIS_URL)
+
+
+def events_channel(scan_id) -> str:
+    return f"autonmap:scans:{scan_id}:events"
+
+
+def event_state_key(scan_id, event: str) -> str:
+    return f"autonmap:scans:{scan_id}:{event}"
+
+
+def publish_scan_event(redis_conn, scan_id, event: str, data: dict) -> None:
+    """
+    Publica um evento do scan ("status" ou "progress") e guarda o último
+    valor de cada tipo. Melhor esforço: falhas no Redis nunca afetam o scan.
+    """
+    message = json.dumps({"event": event, "data": data})
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.set(event_state_key(scan_id, event), message, ex=EVENT_STATE_TTL)
+        pipe.publish(events_channel(scan_id), message)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Falha ao publicar evento '{event}' do scan {scan_id}: {e}")
+
+
+def status_event(scan) -> dict:
+    return {
+        "status": scan.status,
+        "shard_count": scan.shard_count,
+        "shards_finished": scan.shards_finished or 0,
+        "shards_failed": scan.shards_failed or 0,
+    }
+
+
+class ProgressPublisher:
+    """
+    Recebe cada atualização de progresso do Nmap e publica no máximo uma a
+    cada `min_interval` segundos; a mais recente descartada sai no flush().
+    """
+
+    def __init__(self, redis_conn, scan_id, shard: str | None = None,
+                 min_interval: float = settings.SCAN_PROGRESS_MIN_INTERVAL):
+        self.redis_conn = redis_conn
+        self.scan_id = scan_id
+        self.shard = shard
+        self.min_interval = min_interval
+        self._last = 0.0
+        self._pending: dict | None = None
+
+    def __call__(self, progress: dict) -> None:
+        now = time.monotonic()
+        if now - self._last < self.min_interval:
+            self._pending = progress
+            return
+        self._publish(progress, now)
+
+    def flush(self) -> None:
+        if self._pending is not None:
+            self._publish(self._pending, time.monotonic())
+
+    def _publish(self, progress: dict, now: float) -> None:
+        self._last, self._pending = now, None
+        data = dict(progress, shard=self.shard) if self.shard else progress
+        publish_scan_event(self.redis_conn, self.scan_id, "progress", data)
+
+
+async def wait_for_status_changes(scan_ids: list, statuses: dict[str, str], done, timeout: float) -> dict[str, str]:
+    """
+    Aguarda, via pub/sub, eventos de status dos scans até `done(statuses)`
+    ou até `timeout` segundos. `statuses` (id -> status já conhecido) é
+    atualizado no lugar; um status final nunca volta a ser sobrescrito.
+    """
+    def update(scan_id: str, status: str) -> None:
+        if statuses.get(scan_id) not in TERMINAL_STATUSES:
+            statuses[scan_id] = status
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pubsub = async_redis.pubsub()
+    await pubsub.subscribe(*(events_channel(scan_id) for scan_id in scan_ids))
+    try:
+        # Estado publicado entre a leitura do banco e a inscrição
+        stored = await async_redis.mget([event_state_key(scan_id, "status") for scan_id in scan_ids])
+        for scan_id, raw in zip(scan_ids, stored):
+            if raw:
+                update(str(scan_id), json.loads(raw)["data"]["status"])
+
+        while not done(statuses):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is None:
+                continue
+            payload = json.loads(message["data"])
+            if payload["event"] == "status":
+                channel = message["channel"]
+                channel = channel.decode() if isinstance(channel, bytes) else channel
+                update(channel.split(":")[2], payload["data"]["status"])
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+    return statuses
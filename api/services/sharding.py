@@ -0,0 +1,138 @@
+import math
+from ipaddress import ip_network
+
+
+def _target_units(target: str, unit_hosts: int):
+    """
+    Quebra um alvo em unidades de no máximo `unit_hosts` endereços, sem
+    enumerar hosts: redes grandes viram sub-redes. Hostnames e sintaxes que
+    não são CIDR (ex.: faixas do Nmap) contam como um host indivisível.
+    """
+    try:
+        network = ip_network(target.strip(), strict=False)
+    except ValueError:
+        yield target, 1
+        return
+
+    if network.num_addresses <= unit_hosts:
+        yield target, network.num_addresses
+        return
+
+    new_prefix = network.max_prefixlen - int(math.log2(unit_hosts))
+    for subnet in network.subnets(new_prefix=max(new_prefix, network.prefixlen)):
+        yield str(subnet), subnet.num_addresses
+
+
+def count_hosts(targets: list[str]) -> int:
+    total = 0
+    for target in targets:
+        try:
+            total += ip_network(target.strip(), strict=False).num_addresses
+        except ValueError:
+            total += 1
+    return total
+
+
+def plan_target_shards(targets: list[str], shard_hosts: int, max_shards: int) -> list[list[str]]:
+    """
+    Divide a lista de alvos em shards de ~`shard_hosts` endereços cada,
+    preservando a ordem. Se isso gerar mais de `max_shards` shards, o
+    tamanho do shard cresce (em potências de 2) até caber.
+    """
+    if shard_hosts <= 0:
+        return [targets]
+
+    total = count_hosts(targets)
+    size = 1 << max(0, math.ceil(math.log2(shard_hosts)))
+    if max_shards > 0:
+        while math.ceil(total / size) > max_shards:
+            size <<= 1
+
+    shards: list[list[str]] = []
+    current: list[str] = []
+    current_hosts = 0
+    for target in targets:
+        for unit, hosts in _target_units(target, size):
+            if current and current_hosts + hosts > size:
+                shards.append(current)
+                current, current_hosts = [], 0
+            current.append(unit)
+            current_hosts += hosts
+    if current:
+        shards.append(current)
+    return shards
+
+
+MAX_PORT = 65535
+
+# Portas mais frequentemente abertas (top do nmap-services). Respondem mais
+# e passam por detecção de serviço/scripts, então custam bem mais que as da
+# cauda longa; são distribuídas igualmente entre os shards de portas.
+COMMON_PORTS = frozenset({
+    7, 9, 13, 21, 22, 23, 25, 26, 37, 53, 79, 80, 81, 88, 106, 110, 111, 113,
+    119, 135, 139, 143, 144, 179, 199, 389, 427, 443, 444, 445, 465, 513, 514,
+    515, 543, 544, 548, 554, 587, 631, 646, 873, 990, 993, 995, 1025, 1026,
+    1027, 1028, 1029, 1110, 1433, 1720, 1723, 1755, 1900, 2000, 2001, 2049,
+    2121, 2717, 3000, 3128, 3306, 3389, 3986, 4899, 5000, 5009, 5051, 5060,
+    5101, 5190, 5357, 5432, 5631, 5666, 5800, 5900, 6000, 6001, 6646, 7070,
+    8000, 8008, 8009, 8080, 8081, 8443, 8888, 9100, 9999, 10000, 32768,
+    49152, 49153, 49154, 49155, 49156, 49157,
+})
+
+
+def parse_port_spec(spec: str) -> list[int]:
+    """Expande uma especificação de portas do Nmap ('1-1024,8080', '-100', '60000-')."""
+    ports: set[int] = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, _, end = part.partition('-')
+            low = int(start) if start else 1
+            high = int(end) if end else MAX_PORT
+        else:
+            low = high = int(part)
+        if not 0 <= low <= high <= MAX_PORT:
+            raise ValueError(f"Faixa de portas inválida: '{part}'")
+        ports.update(range(low, high + 1))
+    return sorted(ports)
+
+
+def format_port_spec(ports: list[int]) -> str:
+    """Forma compacta com faixas: [1, 2, 3, 80] -> '1-3,80'."""
+    parts = []
+    start = prev = None
+    for port in sorted(ports):
+        if prev is not None and port == prev + 1:
+            prev = port
+            continue
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}-{prev}")
+        start = prev = port
+    if start is not None:
+        parts.append(str(start) if start == prev else f"{start}-{prev}")
+    return ",".join(parts)
+
+
+def plan_port_shards(spec: str, count: int) -> list[str]:
+    """
+    Divide a especificação de portas em até `count` partes de custo parecido:
+    as portas comuns são repartidas alternadamente entre as partes e a cauda
+    longa em faixas contíguas de mesmo tamanho.
+    """
+    ports = parse_port_spec(spec)
+    count = max(1, min(count, len(ports)))
+    if count == 1:
+        return [spec]
+
+    common = [p for p in ports if p in COMMON_PORTS]
+    tail = [p for p in ports if p not in COMMON_PORTS]
+    chunks = []
+    for index in range(count):
+        low = len(tail) * index // count
+        high = len(tail) * (index + 1) // count
+        chunk = common[index::count] + tail[low:high]
+        if chunk:
+            chunks.append(format_port_spec(chunk))
+    return chunks
@@ -0,0 +1,100 @@
+import json
+import logging
+from uuid import UUID
+
+from redis.exceptions import RedisError
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+INFLIGHT_PREFIX = "autonmap:inflight:"
+IDEMPOTENCY_PREFIX = "autonmap:idempotency:"
+
+# Remove a chave só se ela ainda pertence a quem está liberando
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _claim(redis_conn, key: str, value: str, ttl: int) -> str | None:
+    """
+    SET NX da chave. Retorna None se ela foi ocupada agora, ou o valor de
+    quem já a ocupava.
+    """
+    # Repete se a chave expirar/for liberada entre o SET e o GET
+    for _ in range(3):
+        if redis_conn.set(key, value, nx=True, ex=ttl):
+            return None
+        existing = redis_conn.get(key)
+        if existing is not None:
+            return existing.decode() if isinstance(existing, bytes) else existing
+    return None
+
+
+def claim_scan(redis_conn, fingerprint: str, scan_id) -> UUID | None:
+    """
+    Registra o scan como o que executa a impressão digital. Se já houver um
+    scan idêntico pendente, retorna o id dele (o "líder") e o novo scan deve
+    aguardar o resultado desse em vez de executar o Nmap.
+    """
+    if not settings.SCAN_COALESCE:
+        return None
+    try:
+        leader = _claim(redis_conn, INFLIGHT_PREFIX + fingerprint, str(scan_id), settings.SCAN_INFLIGHT_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Falha ao registrar o scan {scan_id} em execução; seguirá sem agrupamento: {e}")
+        return None
+    return UUID(leader) if leader else None
+
+
+def scan_in_flight(redis_conn, fingerprint: str, leader_id) -> bool:
+    """Se `leader_id` ainda é o scan em execução da impressão digital."""
+    try:
+        current = redis_conn.get(INFLIGHT_PREFIX + fingerprint)
+    except RedisError as e:
+        logger.warning(f"Falha ao consultar o scan em execução {leader_id}: {e}")
+        return False
+    if isinstance(current, bytes):
+        current = current.decode()
+    return current == str(leader_id)
+
+
+def release_scan(redis_conn, fingerprint: str | None, scan_id) -> None:
+    if not fingerprint:
+        return
+    try:
+        redis_conn.eval(_RELEASE_SCRIPT, 1, INFLIGHT_PREFIX + fingerprint, str(scan_id))
+    except RedisError as e:
+        logger.warning(f"Falha ao liberar o registro de execução do scan {scan_id}: {e}")
+
+
+def _idempotency_key(token_id, key: str) -> str:
+    return f"{IDEMPOTENCY_PREFIX}{token_id}:{key}"
+
+
+def claim_idempotency_key(redis_conn, token_id, key: str, scan_id, request_hash: str) -> dict | None:
+    """
+    Associa a Idempotency-Key do token ao scan. Se a chave já foi usada,
+    retorna {"scan_id", "request_hash"} da requisição original.
+    """
+    value = json.dumps({"scan_id": str(scan_id), "request_hash": request_hash})
+    try:
+        existing = _claim(redis_conn, _idempotency_key(token_id, key), value, settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Falha ao registrar Idempotency-Key do token {token_id}: {e}")
+        return None
+    return json.loads(existing) if existing else None
+
+
+def release_idempotency_key(redis_conn, token_id, key: str, scan_id) -> None:
+    """Libera a chave de uma requisição que falhou, para que possa ser repetida."""
+    try:
+        raw = redis_conn.get(_idempotency_key(token_id, key))
+        if raw is not None and json.loads(raw)["scan_id"] == str(scan_id):
+            redis_conn.delete(_idempotency_key(token_id, key))
+    except RedisError as e:
+        logger.warning(f"Falha ao liberar Idempotency-Key do token {token_id}: {e}")
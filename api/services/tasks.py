@@ -1,29 +1,66 @@
 import os
-import json
 import logging
-import xmltodict
-import asyncio
-from datetime import datetime, timezone
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
 from redis import Redis
 from rq import Queue
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
 from ..config import settings
+from .fair_queue import FairQueue
+from .host_index import copy_host_index
+from .host_limits import host_limiter
+from .incremental import run_incremental_scan
+from .rate_limits import active_scan_quota
 from .nmap_runner import run_nmap_scan
 from ..db.session import SessionLocal
-from ..db.models import Scan
+from ..db.models import Scan, ScanResult
+from ..schemas import ScanDiffResponse
+from .nmap_merge import combine_port_results, merge_nmap_xml
+from .results import copy_result_rows, ingest_stored_xml, ingest_xml_result, record_result, result_store
+from .result_cache import result_cache
+from .scan_diff import delta_reference, diff_scans, ensure_host_index
+from .scan_events import TERMINAL_STATUSES, ProgressPublisher, publish_scan_event, status_event
+from .sharding import plan_port_shards, plan_target_shards
+from .singleflight import release_scan
 from .webhooks import send_webhook
 
 logger = logging.getLogger(__name__)
 
 redis_conn = Redis.from_url(settings.REDIS_URL)
-q = Queue('scans', connection=redis_conn)
+q = FairQueue('scans', connection=redis_conn)
+
+JOB_TIMEOUT = '3h'
+
+def execute_scan_task(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str, callback_url: str | None, port_shards: int | None = None,
+                      baseline_id: str | None = None, baseline_max_age: int | None = None):
+    """
+    Função que o worker RQ executa. Agora inclui timing_template. Com
+    `baseline_id`, o scan é um rescan incremental em um único job (ver
+    services/incremental.py).
+    """
+    if baseline_id:
+        shards, port_chunks = [targets], [ports]
+    else:
+        shards = plan_target_shards(targets, settings.SCAN_SHARD_HOSTS, settings.SCAN_MAX_SHARDS)
+        port_chunks = plan_port_shards(ports, port_shards) if ports and port_shards else [ports]
+    sharded = len(shards) * len(port_chunks) > 1
+
+    # Scans divididos respeitam os limites por host e global em cada shard
+    if not sharded and not host_limiter.acquire(redis_conn, str(scan_id), targets):
+        logger.info(f"Scan {scan_id} sem vaga (alvos ou orçamento de pacotes); reagendado em {settings.SCAN_HOST_RETRY_SECONDS}s.")
+        _defer_job(execute_scan_task, dict(
+            scan_id=scan_id, targets=targets, profile=profile, ports=ports,
+            timing_template=timing_template, callback_url=callback_url, port_shards=port_shards,
+            baseline_id=baseline_id, baseline_max_age=baseline_max_age,
+        ))
+        return
 
-def execute_scan_task(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str, callback_url: str | None):
-    """Função que o worker RQ executa. Agora inclui timing_template."""
     db: Session = SessionLocal()
     scan = None
-    xml_path, out_path, err_path = (None, None, None)
     try:
         scan = db.query(Scan).filter(Scan.id == scan_id).first()
         if not scan:
@@ -32,32 +69,47 @@ def execute_scan_task(scan_id: str, targets: list[str], profile: str, ports: str
 
         scan.status = 'running'
         scan.started_at = datetime.now(timezone.utc)
-        db.commit()
 
-        xml_path, out_path, err_path = run_nmap_scan(str(scan.id), targets, profile, ports, timing_template)
+        if sharded:
+            scan.shard_count = len(shards) * len(port_chunks)
+            scan.shards_finished = 0
+            scan.shards_failed = 0
+            db.commit()
+            create_shard_tasks(
+                scan_id, shards, profile, ports, timing_template, callback_url,
+                port_chunks=port_chunks if len(port_chunks) > 1 else None,
+                tenant=q.for_tenant(scan.token_id, scan.priority, scan.token.scan_weight if scan.token else None),
+            )
+            logger.info(f"Scan {scan.id} dividido em {len(shards)} shards de alvos x {len(port_chunks)} de portas.")
+            return
+
+        db.commit()
+        publish_scan_event(redis_conn, scan.id, "status", status_event(scan))
 
-        if not xml_path or not os.path.exists(xml_path):
-            raise RuntimeError("Execução do Nmap falhou em produzir um arquivo de saída XML.")
+        on_progress = ProgressPublisher(redis_conn, scan.id)
+        xml_key = result_store.key_for(str(scan.id), "result.xml")
+        baseline = _baseline_xml(db, baseline_id) if baseline_id else None
+        started = time.monotonic()
+        if baseline:
+            max_age = settings.SCAN_INCREMENTAL_MAX_AGE_SECONDS if baseline_max_age is None else baseline_max_age
+            run = run_incremental_scan(
+                str(scan.id), targets, profile, ports, timing_template, xml_key, *baseline, max_age, on_progress,
+            )
+        else:
+            run = run_nmap_scan(str(scan.id), targets, profile, ports, timing_template, xml_key, on_progress)
+        on_progress.flush()
+        q.record_duration(time.monotonic() - started)
 
-        with open(xml_path, 'r') as f:
-            xml_content = f.read()
+        if not run.stored:
+            raise RuntimeError(f"Execução do Nmap falhou em produzir uma saída XML. {run.stderr_tail}".strip())
 
-        scan.result_xml = xml_content
+        ingest_stored_xml(db, scan.id, run.stored)
         scan.status = 'succeeded'
         scan.finished_at = datetime.now(timezone.utc)
-        logger.info(f"Scan {scan.id} bem-sucedido. Resultado salvo no banco de dados.")
+        logger.info(f"Scan {scan.id} bem-sucedido. Resultados XML e JSON armazenados.")
 
         if callback_url:
-            result_json = xmltodict.parse(xml_content)
-            payload = {
-                "id": str(scan.id),
-                "status": "succeeded",
-                "targets": scan.targets,
-                "profile": scan.profile,
-                "finished_at": scan.finished_at.isoformat(),
-                "result": result_json
-            }
-            asyncio.run(send_webhook(callback_url, payload))
+            _send_result_webhook(db, scan, callback_url)
 
     except Exception as e:
         logger.exception(f"Um erro inesperado ocorreu no scan {scan_id}: {e}")
@@ -65,16 +117,247 @@ def execute_scan_task(scan_id: str, targets: list[str], profile: str, ports: str
             scan.status = 'failed'
             scan.finished_at = datetime.now(timezone.utc)
     finally:
+        if not sharded:
+            host_limiter.release(redis_conn, str(scan_id), targets)
         if scan:
             db.commit()
-        for p in [xml_path, out_path, err_path]:
-            if p and os.path.exists(p):
-                os.remove(p)
+            publish_scan_event(redis_conn, scan.id, "status", status_event(scan))
+            if scan.status in TERMINAL_STATUSES:
+                _complete_scan(db, scan)
         db.close()
 
-def create_scan_task(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str, callback_url: str | None):
-    """Enfileira a tarefa de scan, agora incluindo o timing_template."""
-    q.enqueue(
+def _baseline_xml(db: Session, baseline_id: str) -> tuple[str, float] | None:
+    """(chave do XML, fim do scan) da referência de um rescan incremental."""
+    baseline = db.get(Scan, uuid.UUID(str(baseline_id)))
+    result = db.get(ScanResult, (baseline.id, "xml")) if baseline else None
+    if not result or baseline.status != 'succeeded':
+        logger.warning(f"Scan de referência {baseline_id} indisponível; executando o scan completo.")
+        return None
+    return result.storage_key, baseline.finished_at.timestamp()
+
+def _defer_job(func, kwargs: dict):
+    """Devolve o job à fila após SCAN_HOST_RETRY_SECONDS, sem ocupar o worker até lá."""
+    q.enqueue_in(timedelta(seconds=settings.SCAN_HOST_RETRY_SECONDS), func, kwargs=kwargs, job_timeout=JOB_TIMEOUT)
+
+def _complete_scan(db: Session, scan: Scan):
+    """
+    Etapas comuns ao fim de um scan (já gravado em estado final): indexa o
+    resultado no cache, libera o registro de scan em execução e a vaga na
+    cota de scans ativos do token e entrega o mesmo desfecho aos scans
+    idênticos que aguardavam este.
+    """
+    if scan.status == 'succeeded':
+        result_cache.remember(redis_conn, scan.fingerprint, scan.id, scan.finished_at)
+    # Liberado antes de resolver os seguidores: quem ainda se agrupar a este
+    # scan depois daqui percebe e executa por conta própria (routers/scans.py)
+    release_scan(redis_conn, scan.fingerprint, scan.id)
+    active_scan_quota.release(redis_conn, [(scan.token_id, scan.id)])
+    try:
+        _resolve_followers(db, scan)
+    except Exception as e:
+        logger.exception(f"Falha ao concluir os scans agrupados ao scan {scan.id}: {e}")
+        db.rollback()
+
+def _resolve_followers(db: Session, scan: Scan):
+    followers = db.execute(
+        update(Scan)
+        .where(Scan.cached_from == scan.id, Scan.status.in_(('queued', 'running')))
+        .values(status=scan.status, started_at=scan.started_at, finished_at=scan.finished_at)
+        .returning(Scan.id, Scan.token_id, Scan.callback_url, Scan.status, Scan.shard_count, Scan.shards_finished,
+                   Scan.shards_failed)
+    ).all()
+    if not followers:
+        return
+    if scan.status == 'succeeded':
+        results = db.query(ScanResult).filter(ScanResult.scan_id == scan.id, ScanResult.kind.in_(('xml', 'json'))).all()
+        db.execute(insert(ScanResult), [row for f in followers for row in copy_result_rows(f.id, results)])
+        for follower in followers:
+            copy_host_index(db, scan.id, follower.id)
+    db.commit()
+    logger.info(f"Resultado do scan {scan.id} ({scan.status}) entregue a {len(followers)} scans agrupados.")
+    active_scan_quota.release(redis_conn, [(follower.token_id, follower.id) for follower in followers])
+
+    for follower in followers:
+        publish_scan_event(redis_conn, follower.id, "status", status_event(follower))
+        if follower.callback_url and scan.status == 'succeeded':
+            try:
+                _send_result_webhook(db, db.get(Scan, follower.id), follower.callback_url)
+            except Exception as e:
+                logger.exception(f"Falha ao enviar o webhook do scan {follower.id}: {e}")
+
+def _send_result_webhook(db: Session, scan: Scan, callback_url: str):
+    payload = {
+        "id": str(scan.id),
+        "status": "succeeded",
+        "targets": scan.targets,
+        "profile": scan.profile,
+        "finished_at": scan.finished_at.isoformat(),
+    }
+    result_key = None
+    if scan.callback_mode == "delta":
+        # Só as diferenças; sem referência anterior, todos os hosts são novos
+        reference = delta_reference(db, scan)
+        if reference and not ensure_host_index(db, reference):
+            reference = None
+        diff = diff_scans(db, reference.id if reference else None, scan.id)
+        payload["diff"] = ScanDiffResponse(**diff).model_dump(mode="json")
+    else:
+        # Scans que reaproveitam outro resultado apontam para os arquivos da
+        # origem; o JSON vai do armazenamento para o corpo sem passar pela memória
+        result_key = db.get(ScanResult, (scan.id, "json")).storage_key
+    send_webhook(callback_url, payload, result_key)
+
+def execute_scan_shard(scan_id: str, shard_index: int, targets: list[str], profile: str, ports: str | None, timing_template: str, callback_url: str | None,
+                       port_index: int = 0, port_chunks: list[str] | None = None, port_parallel: int = 0):
+    """
+    Executa um shard de um scan dividido e guarda o XML parcial. O job que
+    concluir o último shard combina os parciais no resultado do scan.
+
+    Com shards de portas, no máximo `port_parallel` partes rodam ao mesmo
+    tempo contra os mesmos alvos: cada job, ao terminar, enfileira a parte
+    seguinte do seu shard de alvos.
+    """
+    kind = f"shard-{shard_index}"
+    if port_chunks:
+        kind = f"shard-{shard_index}-{port_index}"
+    holder = f"{scan_id}:{kind}"
+    if not host_limiter.acquire(redis_conn, holder, targets):
+        logger.info(f"{kind} do scan {scan_id} sem vaga (alvos ou orçamento de pacotes); reagendado em {settings.SCAN_HOST_RETRY_SECONDS}s.")
+        _defer_job(execute_scan_shard, dict(
+            scan_id=scan_id, shard_index=shard_index, targets=targets, profile=profile, ports=ports,
+            timing_template=timing_template, callback_url=callback_url,
+            port_index=port_index, port_chunks=port_chunks, port_parallel=port_parallel,
+        ))
+        return
+
+    db: Session = SessionLocal()
+    scan_uuid = uuid.UUID(str(scan_id))
+    failed = False
+    if port_chunks:
+        ports = port_chunks[port_index]
+    try:
+        on_progress = ProgressPublisher(redis_conn, scan_uuid, shard=kind)
+        started = time.monotonic()
+        run = run_nmap_scan(
+            f"{scan_id}_{kind}", targets, profile, ports, timing_template,
+            result_store.key_for(str(scan_id), f"{kind}.xml"), on_progress,
+        )
+        on_progress.flush()
+        q.record_duration(time.monotonic() - started)
+
+        if not run.stored:
+            raise RuntimeError(f"Execução do Nmap falhou em produzir uma saída XML. {run.stderr_tail}".strip())
+
+        record_result(db, scan_uuid, kind, run.stored)
+        db.commit()
+    except Exception as e:
+        logger.exception(f"Um erro inesperado ocorreu no {kind} do scan {scan_id}: {e}")
+        db.rollback()
+        failed = True
+    finally:
+        host_limiter.release(redis_conn, holder, targets)
+
+    if port_chunks and port_parallel > 0 and port_index + port_parallel < len(port_chunks):
+        q.enqueue_many([_prepare_shard_job(
+            scan_id, shard_index, targets, profile, None, timing_template, callback_url,
+            port_index + port_parallel, port_chunks, port_parallel,
+        )])
+
+    try:
+        # Incremento atômico: só um job enxerga shards_finished == shard_count
+        progress = db.execute(
+            update(Scan)
+            .where(Scan.id == scan_uuid)
+            .values(
+                shards_finished=Scan.shards_finished + 1,
+                shards_failed=Scan.shards_failed + (1 if failed else 0),
+            )
+            .returning(Scan.status, Scan.shard_count, Scan.shards_finished, Scan.shards_failed)
+        ).first()
+        db.commit()
+
+        if progress and progress.shards_finished < progress.shard_count:
+            publish_scan_event(redis_conn, scan_uuid, "status", status_event(progress))
+        if progress and progress.shards_finished >= progress.shard_count:
+            _finalize_sharded_scan(db, scan_uuid, callback_url)
+    finally:
+        db.close()
+
+def _shard_position(result: ScanResult) -> tuple[int, ...]:
+    # "shard-<alvos>" ou "shard-<alvos>-<portas>"
+    return tuple(int(part) for part in result.kind.split('-')[1:])
+
+def _open_shard_results(results: list[ScanResult]):
+    for result in results:
+        with result_store.open(result.storage_key) as f:
+            yield f
+
+def _shard_sources(results: list[ScanResult]):
+    """Um XML por shard de alvos, já com as partes de portas combinadas."""
+    groups: dict[int, list[ScanResult]] = {}
+    for result in sorted(results, key=_shard_position):
+        groups.setdefault(_shard_position(result)[0], []).append(result)
+
+    for group in groups.values():
+        if len(group) == 1:
+            yield from _open_shard_results(group)
+            continue
+        with tempfile.TemporaryFile() as combined:
+            combine_port_results(_open_shard_results(group), combined)
+            combined.seek(0)
+            yield combined
+
+def _finalize_sharded_scan(db: Session, scan_id: uuid.UUID, callback_url: str | None):
+    """Combina os XMLs dos shards no resultado do scan e remove os parciais."""
+    scan = db.query(Scan).filter(Scan.id == scan_id).first()
+    shard_results = db.query(ScanResult).filter(ScanResult.scan_id == scan_id, ScanResult.kind.like('shard-%')).all()
+    merged_path = None
+    try:
+        if not shard_results:
+            raise RuntimeError("Nenhum shard produziu resultado XML.")
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.xml', prefix=f"nmap_{scan_id}_merged_") as merged:
+            merged_path = merged.name
+            merge_nmap_xml(_shard_sources(shard_results), merged)
+
+        ingest_xml_result(db, scan.id, merged_path)
+        # Com shards falhos o resultado combinado (parcial) fica disponível,
+        # mas o scan é marcado como falho.
+        scan.status = 'failed' if scan.shards_failed else 'succeeded'
+        scan.finished_at = datetime.now(timezone.utc)
+        db.commit()
+        logger.info(
+            f"Scan {scan.id} concluído: {scan.shard_count} shards combinados, {scan.shards_failed} com falha."
+        )
+
+        if callback_url and scan.status == 'succeeded':
+            _send_result_webhook(db, scan, callback_url)
+
+    except Exception as e:
+        logger.exception(f"Um erro inesperado ocorreu ao combinar os shards do scan {scan_id}: {e}")
+        db.rollback()
+        if scan:
+            scan.status = 'failed'
+            scan.finished_at = datetime.now(timezone.utc)
+    finally:
+        for result in shard_results:
+            result_store.delete(result.storage_key)
+            db.delete(result)
+        db.commit()
+        if scan:
+            publish_scan_event(redis_conn, scan.id, "status", status_event(scan))
+            _complete_scan(db, scan)
+        if merged_path and os.path.exists(merged_path):
+            os.remove(merged_path)
+
+def create_scan_task(scan_id: str, targets: list[str], profile: str, ports: str | None, timing_template: str, callback_url: str | None, port_shards: int | None = None,
+                     baseline_id: str | None = None, baseline_max_age: int | None = None,
+                     token_id: int | None = None, priority: str | None = None, weight: int | None = None):
+    """
+    Enfileira a tarefa de scan no backlog do token (ver services/fair_queue.py),
+    com o id do scan como id do job.
+    """
+    q.for_tenant(token_id, priority, weight).enqueue(
         execute_scan_task,
         scan_id=scan_id,
         targets=targets,
@@ -82,5 +365,75 @@ def create_scan_task(scan_id: str, targets: list[str], profile: str, ports: str
         ports=ports,
         timing_template=timing_template,
         callback_url=callback_url,
-        job_timeout='3h'
+        port_shards=port_shards,
+        baseline_id=baseline_id,
+        baseline_max_age=baseline_max_age,
+        job_timeout=JOB_TIMEOUT,
+        job_id=scan_id,
     )
+    q.dispatch()
+
+def create_scan_tasks(jobs: list[dict], token_id: int | None = None, weight: int | None = None):
+    """
+    Enfileira vários scans (kwargs de execute_scan_task, mais a `priority`
+    de cada um) em um único pipeline Redis por prioridade.
+    """
+    by_priority: dict[str | None, list] = {}
+    for job in jobs:
+        kwargs = {key: value for key, value in job.items() if key != "priority"}
+        by_priority.setdefault(job.get("priority"), []).append(
+            Queue.prepare_data(execute_scan_task, kwargs=kwargs, timeout=JOB_TIMEOUT, job_id=kwargs["scan_id"])
+        )
+    for priority, job_datas in by_priority.items():
+        q.for_tenant(token_id, priority, weight).enqueue_many(job_datas)
+    q.dispatch()
+
+def _prepare_shard_job(scan_id, shard_index, targets, profile, ports, timing_template, callback_url,
+                       port_index=0, port_chunks=None, port_parallel=0):
+    kwargs = dict(
+        scan_id=scan_id,
+        shard_index=shard_index,
+        targets=targets,
+        profile=profile,
+        ports=ports,
+        timing_template=timing_template,
+        callback_url=callback_url,
+    )
+    if port_chunks:
+        kwargs.update(port_index=port_index, port_chunks=port_chunks, port_parallel=port_parallel)
+    return Queue.prepare_data(execute_scan_shard, kwargs=kwargs, timeout=JOB_TIMEOUT)
+
+def create_shard_tasks(scan_id: str, shards: list[list[str]], profile: str, ports: str | None, timing_template: str, callback_url: str | None,
+                       port_chunks: list[str] | None = None, tenant: FairQueue | None = None):
+    """
+    Enfileira um job por shard de um scan dividido, no backlog do token do
+    scan (`tenant`). Com shards de portas, só as primeiras
+    SCAN_PORT_SHARD_PARALLEL partes de cada shard de alvos são enfileiradas
+    agora; as demais seguem em cadeia, direto na fila.
+    """
+    jobs = []
+    parallel = settings.SCAN_PORT_SHARD_PARALLEL
+    for index, shard in enumerate(shards):
+        if not port_chunks:
+            jobs.append(_prepare_shard_job(scan_id, index, shard, profile, ports, timing_template, callback_url))
+            continue
+        first_wave = len(port_chunks) if parallel <= 0 else min(parallel, len(port_chunks))
+        jobs.extend(
+            _prepare_shard_job(scan_id, index, shard, profile, None, timing_template, callback_url,
+                               port_index, port_chunks, parallel)
+            for port_index in range(first_wave)
+        )
+    (tenant or q).enqueue_many(jobs)
+    q.dispatch()
+
+def send_cached_result_webhook(scan_id: str, callback_url: str):
+    """Webhook de um scan atendido pelo cache de resultados (roda fora do request)."""
+    db: Session = SessionLocal()
+    try:
+        scan = db.query(Scan).filter(Scan.id == scan_id).first()
+        if scan:
+            _send_result_webhook(db, scan, callback_url)
+    except Exception as e:
+        logger.exception(f"Falha ao enviar o webhook do scan {scan_id}: {e}")
+    finally:
+        db.close()
@@ -3,29 +3,68 @@ import hmac
 import hashlib
 import json
 import logging
+import os
 from ..config import settings
+from .results import result_store
 
 logger = logging.getLogger(__name__)
 
-async def send_webhook(callback_url: str, payload: dict):
+WEBHOOK_TIMEOUT_SECONDS = 10.0
+
+# Cliente compartilhado entre os jobs do processo: mantém as conexões
+# (keep-alive/TLS) com os destinos dos webhooks. Criado no primeiro uso.
+_client: httpx.Client | None = None
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=WEBHOOK_TIMEOUT_SECONDS)
+    return _client
+
+
+def _reset_client_after_fork() -> None:
+    # Conexões herdadas do processo pai não podem ser compartilhadas
+    global _client
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_client_after_fork)
+
+
+def _body_chunks(payload: dict, result_key: str | None):
+    """
+    Corpo do webhook em blocos: `payload` e, com `result_key`, o JSON
+    armazenado do resultado no campo "result", lido do armazenamento sem
+    ser carregado inteiro em memória.
+    """
+    head = json.dumps(payload)
+    if result_key is None:
+        yield head.encode('utf-8')
+        return
+    yield f'{head[:-1]}{", " if payload else ""}"result": '.encode('utf-8')
+    yield from result_store.iter_chunks(result_key)
+    yield b'}'
+
+
+def send_webhook(callback_url: str, payload: dict, result_key: str | None = None):
     try:
-        payload_bytes = json.dumps(payload).encode('utf-8')
-        
-        signature = hmac.new(
-            settings.WEBHOOK_HMAC_SECRET.encode('utf-8'),
-            payload_bytes,
-            hashlib.sha256
-        ).hexdigest()
-        
+        # Primeira passada: assinatura e tamanho; a segunda envia
+        signer = hmac.new(settings.WEBHOOK_HMAC_SECRET.encode('utf-8'), digestmod=hashlib.sha256)
+        length = 0
+        for chunk in _body_chunks(payload, result_key):
+            signer.update(chunk)
+            length += len(chunk)
+
         headers = {
             'Content-Type': 'application/json',
-            'X-Autonmap-Signature-256': signature
+            'Content-Length': str(length),
+            'X-Autonmap-Signature-256': signer.hexdigest()
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(callback_url, content=payload_bytes, headers=headers, timeout=10.0)
-            response.raise_for_status()
-            
+        response = _get_client().post(callback_url, content=_body_chunks(payload, result_key), headers=headers)
+        response.raise_for_status()
+
         logger.info(f"Webhook sent successfully to {callback_url}")
 
     except httpx.RequestError as e:
@@ -0,0 +1,153 @@
+import argparse
+import importlib
+import logging
+import os
+import time
+
+from redis import Redis
+from redis.exceptions import RedisError
+from rq.worker import SimpleWorker, Worker, WorkerStatus
+from rq.worker_pool import WorkerPool
+
+from .config import settings
+from .services.fair_queue import FairQueue
+
+logger = logging.getLogger(__name__)
+
+# Abaixo desta fração de SCAN_WORKER_MAX_LOAD o pool volta a crescer (histerese)
+GROW_LOAD_RATIO = 0.75
+# Módulos dos jobs, importados pelas vagas "quentes" antes do primeiro job
+WARM_MODULES = ("api.services.tasks",)
+
+
+def cpu_load() -> float:
+    """Carga média do último minuto por CPU."""
+    return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+
+class ScanWorker(Worker):
+    """Worker padrão do RQ (um work-horse por job) que atende os backlogs do FairQueue."""
+
+    queue_class = FairQueue
+
+
+class WarmWorker(SimpleWorker):
+    """
+    Vaga sem work-horse: os jobs rodam no próprio processo da vaga, que
+    mantém os módulos importados e os pools de conexão (Postgres, Redis e
+    o cliente HTTP dos webhooks) de um job para o outro. O tempo limite do
+    job continua valendo (SIGALRM) e o Nmap segue isolado em subprocesso,
+    encerrado pelo run_nmap_scan em qualquer saída. Se a vaga morrer, o
+    pool a substitui e o RQ trata o job como abandonado. Com `max_jobs`
+    (SCAN_WORKER_MAX_JOBS), a vaga é renovada após esse número de jobs.
+    """
+
+    queue_class = FairQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for module in WARM_MODULES:
+            importlib.import_module(module)
+
+    def work(self, *args, **kwargs):
+        kwargs.setdefault("max_jobs", settings.SCAN_WORKER_MAX_JOBS or None)
+        return super().work(*args, **kwargs)
+
+
+class ScanWorkerPool(WorkerPool):
+    """
+    Várias vagas de scan em um só contêiner. Cada vaga é um `rq worker`
+    completo: um work-horse por job, com o heartbeat, o tempo limite
+    (JOB_TIMEOUT) e o tratamento de falhas de sempre do execute_scan_task;
+    uma vaga que morre é substituída.
+
+    Com `max_load`, o número de vagas acompanha a carga da máquina entre
+    `min_slots` e `max_slots`: perde uma vaga quando a carga por CPU passa
+    do limite e ganha uma quando cai abaixo de GROW_LOAD_RATIO dele. A vaga
+    retirada é de preferência uma ociosa e sempre termina o job atual.
+    """
+
+    def __init__(self, queues, connection: Redis, max_slots: int, min_slots: int = 1,
+                 max_load: float = 0.0, resize_interval: float = 30.0, **kwargs):
+        super().__init__(queues, connection=connection, num_workers=max_slots, **kwargs)
+        self.max_slots = max_slots
+        self.min_slots = max(1, min(min_slots, max_slots))
+        self.max_load = max_load
+        self.resize_interval = resize_interval
+        self._last_resize = time.monotonic()
+        # Vagas já avisadas para encerrar, que ainda terminam o job atual
+        self._retiring: set[str] = set()
+
+    def target_slots(self) -> int:
+        if self.max_load <= 0:
+            return self.max_slots
+        load = cpu_load()
+        if load > self.max_load:
+            return max(self.min_slots, self.num_workers - 1)
+        if load < self.max_load * GROW_LOAD_RATIO:
+            return min(self.max_slots, self.num_workers + 1)
+        return self.num_workers
+
+    def _idle_first(self, names: list[str]) -> list[str]:
+        def busy(name: str) -> bool:
+            worker = Worker.find_by_key(Worker.redis_worker_namespace_prefix + name, connection=self.connection)
+            return worker is None or worker.get_state() != WorkerStatus.IDLE
+        try:
+            return sorted(names, key=busy)
+        except RedisError:
+            return names
+
+    def check_workers(self, respawn: bool = True) -> None:
+        self.reap_workers()
+        self._retiring &= self.worker_dict.keys()
+        if not respawn or self.status == self.Status.STOPPED:
+            return
+
+        now = time.monotonic()
+        if now - self._last_resize >= self.resize_interval:
+            self._last_resize = now
+            target = self.target_slots()
+            if target != self.num_workers:
+                logger.info(f"Carga por CPU {cpu_load():.2f}: vagas de scan {self.num_workers} -> {target}.")
+                self.num_workers = target
+
+        active = [name for name in self.worker_dict if name not in self._retiring]
+        for _ in range(self.num_workers - len(active)):
+            self.start_worker(burst=self._burst, _sleep=self._sleep)
+        for name in self._idle_first(active)[:max(0, len(active) - self.num_workers)]:
+            self._retiring.add(name)
+            self.stop_worker(self.worker_dict[name])
+
+    def stop_workers(self):
+        # Um segundo SIGINT interromperia o job das vagas que já estão saindo
+        for name, worker_data in list(self.worker_dict.items()):
+            if name not in self._retiring:
+                self.stop_worker(worker_data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker de scans com várias vagas simultâneas.")
+    parser.add_argument("queues", nargs="*", default=["scans"], help="Filas atendidas. Padrão: scans")
+    parser.add_argument("--slots", type=int, default=settings.SCAN_WORKER_SLOTS,
+                        help="Vagas (jobs simultâneos) no máximo. Padrão: SCAN_WORKER_SLOTS")
+    parser.add_argument("--min-slots", type=int, default=settings.SCAN_WORKER_MIN_SLOTS,
+                        help="Vagas mantidas mesmo com a máquina carregada. Padrão: SCAN_WORKER_MIN_SLOTS")
+    parser.add_argument("--max-load", type=float, default=settings.SCAN_WORKER_MAX_LOAD,
+                        help="Carga por CPU acima da qual o pool encolhe (0 = fixo). Padrão: SCAN_WORKER_MAX_LOAD")
+    parser.add_argument("--warm", action=argparse.BooleanOptionalAction, default=settings.SCAN_WORKER_WARM,
+                        help="Jobs no próprio processo da vaga, sem fork por job. Padrão: SCAN_WORKER_WARM")
+    parser.add_argument("--url", default=settings.REDIS_URL, help="URL do Redis. Padrão: REDIS_URL")
+    parser.add_argument("--burst", action="store_true", help="Encerra quando as filas esvaziarem.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    pool = ScanWorkerPool(
+        args.queues, connection=Redis.from_url(args.url), max_slots=max(1, args.slots),
+        min_slots=args.min_slots, max_load=args.max_load, resize_interval=settings.SCAN_WORKER_RESIZE_SECONDS,
+        worker_class=WarmWorker if args.warm else ScanWorker,
+    )
+    pool.start(burst=args.burst)
+
+
+if __name__ == "__main__":
+    main()
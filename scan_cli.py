@@ -2,7 +2,6 @@
 import os
 import sys
 import json
-import time
 import argparse
 import subprocess
 from pathlib import Path
@@ -137,6 +136,51 @@ def resolve_token(cli_token: str = None) -> str:
     print(f"{Colors.RED}Erro: Token da API não fornecido.{Colors.RESET}", file=sys.stderr)
     sys.exit(1)
 
+def format_progress(status: str, progress: dict) -> str:
+    parts = [f"Status atual: {Colors.CYAN}{status}{Colors.RESET}"]
+    if progress.get("phase"):
+        phase = progress["phase"]
+        if progress.get("percent") is not None:
+            phase += f" {progress['percent']:.1f}%"
+        if progress.get("etc"):
+            phase += f" (ETC {progress['etc']})"
+        parts.append(phase)
+    if progress:
+        parts.append(f"hosts: {progress.get('hosts_completed', 0)}")
+        parts.append(f"portas abertas: {progress.get('open_ports', 0)}")
+    return " | ".join(parts)
+
+def follow_scan_events(scan_id: str, headers: dict) -> str:
+    """Acompanha o scan pelo stream SSE /events até o status final."""
+    current_status, progress, event = "queued", {}, None
+    with requests.get(f"{API_URL}/v1/scans/{scan_id}/events", headers=headers, stream=True, timeout=(10, 60)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line.split(":", 1)[1])
+                if event == "status":
+                    current_status = data["status"]
+                elif event == "progress":
+                    progress = data
+                print(f"{format_progress(current_status, progress)}         ", end='\r', flush=True)
+                if current_status in ["succeeded", "failed"]:
+                    return current_status
+    raise requests.exceptions.ConnectionError("Stream de eventos encerrado antes do fim do scan.")
+
+def wait_scan_status(scan_id: str, headers: dict) -> str:
+    """Long-poll em /wait: cada requisição volta assim que o scan termina (ou em 60s)."""
+    while True:
+        status_response = requests.get(
+            f"{API_URL}/v1/scans/{scan_id}/wait", headers=headers, params={"timeout": 60}, timeout=(10, 90)
+        )
+        status_response.raise_for_status()
+        current_status = status_response.json()['status']
+        print(f"Status atual: {Colors.CYAN}{current_status}{Colors.RESET}         ", end='\r', flush=True)
+        if current_status in ["succeeded", "failed"]:
+            return current_status
+
 def execute_and_wait(payload: dict, headers: dict):
     try:
         response = requests.post(f"{API_URL}/v1/scans/", headers=headers, json=payload)
@@ -145,15 +189,11 @@ def execute_and_wait(payload: dict, headers: dict):
         print(f"Scan enfileirado com sucesso. ID: {scan_id}")
         print("Aguardando a conclusão...")
 
-        while True:
-            status_response = requests.get(f"{API_URL}/v1/scans/{scan_id}", headers=headers)
-            status_response.raise_for_status()
-            current_status = status_response.json()['status']
-            print(f"Status atual: {Colors.CYAN}{current_status}{Colors.RESET}         ", end='\r', flush=True)
-            if current_status in ["succeeded", "failed"]:
-                print(f"\nTarefa concluída com status: {current_status}")
-                break
-            time.sleep(15)
+        try:
+            current_status = follow_scan_events(scan_id, headers)
+        except requests.exceptions.RequestException:
+            current_status = wait_scan_status(scan_id, headers)
+        print(f"\nTarefa concluída com status: {current_status}")
 
         if current_status == "succeeded":
             print("\nResultado Final do Scan")
@@ -225,6 +265,8 @@ def main():
         "vuln_syn_stealth", "proxy_vuln_scan"
     ], help="O perfil de scan a ser utilizado.")
     parser.add_argument("-P", "--ports", help="Define as portas a serem escaneadas.")
+    parser.add_argument("-S", "--port-shards", type=int, help="Divide as portas (-P) em N jobs paralelos no servidor.")
+    parser.add_argument("-B", "--baseline", help="ID de um scan anterior: reexamina só os hosts que mudaram desde ele.")
     parser.add_argument("-T", "--timing", default="T3", choices=["T0", "T1", "T2", "T3", "T4", "T5"], help="Define o timing template.")
     parser.add_argument("-k", "--token", help="Token da API para esta execução.")
     parser.add_argument("-h", "--help", action="store_true", help="Mostra esta ajuda.")
@@ -247,6 +289,8 @@ def main():
     headers = {"X-API-Token": token, "Content-Type": "application/json"}
     payload = {"targets": [args.target], "profile": args.profile, "timing_template": args.timing}
     if args.ports: payload["ports"] = args.ports
+    if args.port_shards: payload["port_shards"] = args.port_shards
+    if args.baseline: payload["baseline_id"] = args.baseline
     execute_and_wait(payload, headers)
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+# scripts/bench_allowlist_middleware.py
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from ipaddress import ip_address, ip_network
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from api.security.ip_allowlist import IPAllowlistMiddleware
+
+CHUNK = b"x" * 65536
+
+
+class LegacyAllowlistMiddleware(BaseHTTPMiddleware):
+    """A implementação anterior (BaseHTTPMiddleware), reproduzida para comparação."""
+
+    def __init__(self, app, allowlist: str):
+        super().__init__(app)
+        self.allowed_ips = {ip_network(entry.strip()) for entry in allowlist.split(",")}
+
+    async def dispatch(self, request: Request, call_next):
+        client_ip = ip_address(request.client.host)
+        if not any(client_ip in network for network in self.allowed_ips):
+            raise HTTPException(status_code=403, detail=f"IP address {client_ip} is not allowed.")
+        return await call_next(request)
+
+
+def build_app() -> FastAPI:
+    """App mínima com o middleware de BENCH_MIDDLEWARE (none, legacy, asgi)."""
+    app = FastAPI()
+    allowlist = "127.0.0.1,::1,10.0.0.0/8"
+    middleware = os.environ["BENCH_MIDDLEWARE"]
+    if middleware == "legacy":
+        app.add_middleware(LegacyAllowlistMiddleware, allowlist=allowlist)
+    elif middleware == "asgi":
+        app.add_middleware(IPAllowlistMiddleware, allowlist=allowlist, trusted_proxies="")
+
+    @app.get("/")
+    def root():
+        return {"message": "ok"}
+
+    @app.get("/big")
+    def big(mb: int = 8):
+        return StreamingResponse((CHUNK for _ in range(mb * 16)), media_type="application/octet-stream")
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def measure(base_url: str, requests: int, downloads: int, mb: int, concurrency: int) -> tuple[float, float]:
+    """(requisições pequenas/s, MB/s em downloads) com `concurrency` clientes."""
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def small(n):
+            for _ in range(n):
+                (await client.get("/")).raise_for_status()
+
+        async def download(n):
+            for _ in range(n):
+                async with client.stream("GET", "/big", params={"mb": mb}) as response:
+                    async for _ in response.aiter_raw():
+                        pass
+
+        started = time.perf_counter()
+        await asyncio.gather(*(small(requests // concurrency) for _ in range(concurrency)))
+        small_rate = requests / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(download(max(1, downloads // concurrency)) for _ in range(concurrency)))
+        throughput = downloads * mb / (time.perf_counter() - started)
+    return small_rate, throughput
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Vazão da API com a allowlist antiga (BaseHTTPMiddleware) e a ASGI.")
+    parser.add_argument("--requests", type=int, default=4000, help="Requisições pequenas por medição. Padrão: 4000")
+    parser.add_argument("--downloads", type=int, default=64, help="Downloads por medição. Padrão: 64")
+    parser.add_argument("--mb", type=int, default=8, help="Tamanho de cada download em MB. Padrão: 8")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clientes simultâneos. Padrão: 16")
+    args = parser.parse_args()
+
+    print(f"{'middleware':>10} {'req/s':>8} {'MB/s':>8}")
+    for middleware in ("none", "legacy", "asgi"):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "scripts.bench_allowlist_middleware:build_app",
+             "--port", str(port), "--log-level", "warning"],
+            env={**os.environ, "BENCH_MIDDLEWARE": middleware},
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            for _ in range(100):
+                try:
+                    httpx.get(base_url + "/", timeout=1)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            small_rate, throughput = asyncio.run(
+                measure(base_url, args.requests, args.downloads, args.mb, args.concurrency)
+            )
+            print(f"{middleware:>10} {small_rate:>8.0f} {throughput:>8.0f}", flush=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
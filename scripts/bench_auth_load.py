@@ -0,0 +1,110 @@
+# scripts/bench_auth_load.py
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+from api.db.session import SessionLocal
+from api.db.models import Token
+from api.security.auth import generate_api_token, hash_token
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000 if samples else 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def probe(client: httpx.AsyncClient, seconds: float) -> list[float]:
+    """Latências de GET / (sem autenticação), uma requisição por vez."""
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        (await client.get("/")).raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def saturate(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event, counts: dict) -> None:
+    """Requisições autenticadas sem parar; cada uma paga consulta ao banco + argon2."""
+    while not stop.is_set():
+        response = await client.get("/v1/health/metrics", headers=headers)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def run(base_url: str, headers: dict, concurrency: int, seconds: float) -> None:
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        idle = await probe(client, seconds)
+
+        stop, counts = asyncio.Event(), {}
+        workers = [asyncio.create_task(saturate(client, headers, stop, counts)) for _ in range(concurrency)]
+        started = time.monotonic()
+        loaded = await probe(client, seconds)
+        stop.set()
+        await asyncio.gather(*workers)
+        elapsed = time.monotonic() - started
+        metrics = (await client.get("/v1/health/metrics", headers=headers)).json()["auth_executor"]
+
+    print(f"{'cenário':>22} {'reqs':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, samples in (("GET / ocioso", idle), (f"GET / com {concurrency} autent.", loaded)):
+        print(f"{name:>22} {len(samples):>6} {percentile(samples, 0.5):>8.1f} "
+              f"{percentile(samples, 0.99):>8.1f} {max(samples) * 1000:>8.1f}")
+    total = sum(counts.values())
+    print(f"autenticadas: {total / elapsed:.1f} req/s, respostas {dict(sorted(counts.items()))}; "
+          f"espera no executor p50 {metrics['queue_wait_ms_p50']}ms p99 {metrics['queue_wait_ms_p99']}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Latência de GET / enquanto requisições autenticadas (sem cache de tokens) saturam a API."
+    )
+    parser.add_argument("--concurrency", type=int, default=64, help="Requisições autenticadas simultâneas. Padrão: 64")
+    parser.add_argument("--seconds", type=float, default=10, help="Duração de cada medição. Padrão: 10")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    raw, prefix = generate_api_token()
+    token = Token(name=f"bench-auth-{prefix}", hashed_token=hash_token(raw), token_prefix=prefix,
+                  scopes=["admin:read"])
+    db.add(token)
+    db.commit()
+
+    port = free_port()
+    # Sem cache, toda requisição autenticada vai ao executor; sem limite de
+    # requisições para medir só a autenticação
+    env = {**os.environ, "TOKEN_CACHE_SIZE": "0", "RATE_LIMIT_PER_MINUTE": "0", "RATE_LIMIT_ROUTES": "{}",
+           "GLOBAL_IP_ALLOWLIST": "127.0.0.1"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        asyncio.run(run(base_url, {"X-API-Token": raw}, args.concurrency, args.seconds))
+    finally:
+        server.terminate()
+        server.wait()
+        db.delete(token)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# scripts/bench_batch_submit.py
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+from rq.job import Job
+
+from api.db.session import SessionLocal
+from api.db.models import Scan, Token
+from api.security.auth import generate_api_token, hash_token
+from api.services.fair_queue import FAIR_PREFIX, PRIORITIES
+from api.services.rate_limits import ACTIVE_SCANS_PREFIX
+from api.services.singleflight import release_scan
+from api.services.tasks import q, redis_conn
+
+
+def scan_body(index: int) -> dict:
+    # Alvos distintos: nenhum item é agrupado a outro
+    return {"targets": [f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"], "profile": "basic_version_detection"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def submit_single(client: httpx.AsyncClient, headers: dict, scans: int, concurrency: int, offset: int) -> float:
+    async def worker(indexes):
+        for index in indexes:
+            (await client.post("/v1/scans/", headers=headers, json=scan_body(index))).raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(range(offset + c, offset + scans, concurrency)) for c in range(concurrency)))
+    return scans / (time.perf_counter() - started)
+
+
+async def submit_batches(client: httpx.AsyncClient, headers: dict, scans: int, batch: int, offset: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, scans, batch):
+        items = [scan_body(offset + i) for i in range(start, min(scans, start + batch))]
+        response = await client.post("/v1/scans/batch", headers=headers, json={"scans": items})
+        response.raise_for_status()
+        if response.json()["rejected"]:
+            raise RuntimeError(response.json()["results"][0])
+    return scans / (time.perf_counter() - started)
+
+
+def cleanup(db, token: Token) -> None:
+    """Remove os scans do benchmark, seus jobs e registros no Redis."""
+    scans = db.query(Scan.id, Scan.fingerprint).filter(Scan.token_id == token.id).all()
+    for scan_id, fingerprint in scans:
+        release_scan(redis_conn, fingerprint, scan_id)
+    for job in Job.fetch_many([str(scan_id) for scan_id, _ in scans], connection=redis_conn):
+        if job is not None:
+            job.delete()
+    redis_conn.delete(
+        *(f"{FAIR_PREFIX}{q.name}:{priority}:jobs:{token.id}" for priority in PRIORITIES),
+        f"{ACTIVE_SCANS_PREFIX}{token.id}",
+    )
+    db.query(Scan).filter(Scan.token_id == token.id).delete()
+    db.delete(token)
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Scans/s enviados um a um x em lotes. Use um ambiente sem workers: os scans ficam na fila."
+    )
+    parser.add_argument("--scans", type=int, default=2000, help="Scans por medição. Padrão: 2000")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clientes simultâneos no envio um a um. Padrão: 8")
+    parser.add_argument("--batch", default="100,500,1000", help="Tamanhos de lote medidos. Padrão: 100,500,1000")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    raw, prefix = generate_api_token()
+    # Sem limites de requisições nem cota de scans ativos para medir só o envio
+    token = Token(name=f"bench-batch-{prefix}", hashed_token=hash_token(raw), token_prefix=prefix,
+                  scopes=["scan:write"], rate_limits={"default": 0, "create_scan": 0, "create_scan_batch": 0},
+                  max_active_scans=0)
+    db.add(token)
+    db.commit()
+
+    port = free_port()
+    env = {**os.environ, "GLOBAL_IP_ALLOWLIST": "127.0.0.1"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+
+    async def run():
+        headers = {"X-API-Token": raw}
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            print(f"{'modo':>16} {'scans/s':>9} {'ganho':>6}")
+            baseline = await submit_single(client, headers, args.scans, args.concurrency, 0)
+            print(f"{f'um a um (x{args.concurrency})':>16} {baseline:>9.1f} {1:>5.1f}x", flush=True)
+            for n, size in enumerate(int(b) for b in args.batch.split(",")):
+                rate = await submit_batches(client, headers, args.scans, size, (n + 1) * args.scans)
+                print(f"{f'lotes de {size}':>16} {rate:>9.1f} {rate / baseline:>5.1f}x", flush=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait()
+        cleanup(db, token)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# scripts/bench_cidr_index.py
+import time
+import random
+import argparse
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+
+from api.security.cidr_index import CIDRIndex, disallowed_targets
+
+
+def random_networks(count: int, rng: random.Random) -> list:
+    """Redes aleatórias, 3/4 IPv4 (/16 a /32) e 1/4 IPv6 (/32 a /128)."""
+    networks = []
+    for i in range(count):
+        if i % 4:
+            networks.append(IPv4Network((rng.getrandbits(32), rng.randint(16, 32)), strict=False))
+        else:
+            networks.append(IPv6Network((rng.getrandbits(128), rng.randint(32, 128)), strict=False))
+    return networks
+
+
+def random_addresses(count: int, networks: list, rng: random.Random) -> list:
+    """Metade dentro de alguma rede (pior caso da busca linear é a outra metade)."""
+    addresses = []
+    for i in range(count):
+        if i % 2:
+            net = rng.choice(networks)
+            addresses.append(net.network_address + rng.randrange(net.num_addresses))
+        elif i % 4:
+            addresses.append(IPv4Address(rng.getrandbits(32)))
+        else:
+            addresses.append(IPv6Address(rng.getrandbits(128)))
+    return addresses
+
+
+def timed(fn, repeat: int) -> float:
+    """Tempo médio por chamada (µs) em `repeat` chamadas."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Busca linear x índice CIDR compilado em allowlists grandes.")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="Redes na allowlist. Padrão: 100,1000,10000,50000")
+    parser.add_argument("--lookups", type=int, default=2000, help="Consultas por medição. Padrão: 2000")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'redes':>7} {'compilar ms':>12} {'linear µs':>10} {'índice µs':>10} {'ganho':>8} {'alvos µs':>9}")
+    for size in (int(n) for n in args.sizes.split(",")):
+        networks = random_networks(size, rng)
+        addresses = random_addresses(args.lookups, networks, rng)
+
+        started = time.perf_counter()
+        index = CIDRIndex(networks)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # A busca linear é medida em uma amostra: em 50k redes ela leva segundos
+        sample = addresses[:max(20, args.lookups * 1000 // size)]
+        linear = timed(lambda: [any(a in n for n in networks if n.version == a.version) for a in sample], 1) / len(sample)
+        indexed = timed(lambda: [a in index for a in addresses], 5) / len(addresses)
+        for a in sample:
+            assert (a in index) == any(a in n for n in networks if n.version == a.version)
+
+        # Checagem de allowed_targets (cacheada por lista) com 50 alvos CIDR/IP
+        allowed = [str(n) for n in networks]
+        targets = [str(IPv4Network((int(a), 28), strict=False)) if a.version == 4 else str(a) for a in addresses[:50]]
+        disallowed_targets(targets, allowed)
+        target_check = timed(lambda: disallowed_targets(targets, allowed), 20)
+
+        print(f"{size:>7} {build_ms:>12.1f} {linear:>10.1f} {indexed:>10.2f} {linear / indexed:>7.0f}x {target_check:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# scripts/bench_db_engines.py
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from uuid import UUID
+
+import httpx
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from api import schemas
+from api.db import models
+from api.db.session import SessionLocal, get_db
+from api.main import app
+from api.routers.scans import _can_read, _with_queue_estimates
+from api.security import auth
+from api.security.auth import generate_api_token, hash_token
+
+NAME = "bench-engines"
+
+
+# Variantes síncronas (pool do psycopg2, uma thread do threadpool por requisição)
+# das rotas assíncronas medidas; o servidor do benchmark sobe este `app`
+@app.get("/bench/sync/scans", response_model=list[schemas.ScanResponse], include_in_schema=False)
+def list_scans_sync(
+    db: Session = Depends(get_db),
+    token: models.Token = Depends(auth.require_scope("scan:read")),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    query = select(models.Scan)
+    if "admin:read" not in token.scopes:
+        query = query.where(models.Scan.token_id == token.id)
+    query = query.order_by(models.Scan.created_at.desc(), models.Scan.id.desc())
+    return _with_queue_estimates(schemas.ScanResponse, db.execute(query.limit(limit + 1)).scalars().all()[:limit])
+
+
+@app.get("/bench/sync/scans/{id}", response_model=schemas.ScanResultResponse, include_in_schema=False)
+def get_scan_details_sync(
+    id: UUID,
+    db: Session = Depends(get_db),
+    token: models.Token = Depends(auth.require_scope("scan:read")),
+):
+    db_scan = db.get(models.Scan, id)
+    if not db_scan or not _can_read(token, db_scan):
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return _with_queue_estimates(schemas.ScanResultResponse, [db_scan])[0]
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000 if samples else 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def load(base_url: str, headers: dict, paths: list[str], concurrency: int, seconds: float) -> tuple:
+    """`concurrency` clientes em laço fechado sobre `paths`; devolve latências, req/s e erros."""
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60, limits=limits) as client:
+        deadline = time.monotonic() + seconds
+
+        async def worker(offset: int) -> None:
+            nonlocal errors
+            index = offset
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                response = await client.get(paths[index % len(paths)])
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 200
+                index += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return latencies, len(latencies) / elapsed, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compara, sob concorrência, list_scans e get_scan_details no engine assíncrono "
+                    "(asyncpg, rotas de produção) com variantes síncronas (psycopg2 + threadpool)."
+    )
+    parser.add_argument("--scans", type=int, default=1000, help="Scans do token medido. Padrão: 1000")
+    parser.add_argument("--limit", type=int, default=50, help="Tamanho da página de list_scans. Padrão: 50")
+    parser.add_argument("--concurrency", default="1,16,64", help="Níveis de concorrência. Padrão: 1,16,64")
+    parser.add_argument("--seconds", type=float, default=10, help="Duração de cada medição. Padrão: 10")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    raw, prefix = generate_api_token()
+    token = models.Token(name=NAME, hashed_token=hash_token(raw), token_prefix=prefix, scopes=["scan:read"])
+    db.add(token)
+    db.commit()
+    db.execute(text("""
+        INSERT INTO scans (id, profile, targets, status, token_id, tags, created_at, finished_at)
+        SELECT gen_random_uuid(), 'basic_version_detection', '["10.0.0.1"]'::json, 'succeeded', :token_id,
+               '[]'::json, now() - i * interval '1 minute', now() - i * interval '1 minute' + interval '30 seconds'
+        FROM generate_series(1, :total) AS i
+    """), {"token_id": token.id, "total": args.scans})
+    db.commit()
+    ids = [str(i) for i in db.execute(
+        select(models.Scan.id).where(models.Scan.token_id == token.id).limit(200)
+    ).scalars()]
+
+    port = free_port()
+    # Sem limite de requisições; o cache de tokens fica ligado para medir só o banco
+    env = {**os.environ, "RATE_LIMIT_PER_MINUTE": "0", "RATE_LIMIT_ROUTES": "{}", "GLOBAL_IP_ALLOWLIST": "127.0.0.1"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "scripts.bench_db_engines:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        routes = [
+            ("list_scans", "assíncrono", [f"/v1/scans/?limit={args.limit}"]),
+            ("list_scans", "síncrono", [f"/bench/sync/scans?limit={args.limit}"]),
+            ("get_scan_details", "assíncrono", [f"/v1/scans/{i}" for i in ids]),
+            ("get_scan_details", "síncrono", [f"/bench/sync/scans/{i}" for i in ids]),
+        ]
+        headers = {"X-API-Token": raw}
+        print(f"{'rota':>17} {'engine':>11} {'conc.':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'erros':>6}")
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            for route, engine, paths in routes:
+                latencies, rate, errors = asyncio.run(load(base_url, headers, paths, concurrency, args.seconds))
+                print(f"{route:>17} {engine:>11} {concurrency:>6} {rate:>8.1f} {percentile(latencies, 0.5):>8.1f} "
+                      f"{percentile(latencies, 0.99):>8.1f} {errors:>6}", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        db.execute(text("DELETE FROM scans WHERE token_id = :token_id"), {"token_id": token.id})
+        db.delete(token)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
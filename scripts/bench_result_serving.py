@@ -0,0 +1,75 @@
+# scripts/bench_result_serving.py
+import io
+import json
+import time
+import uuid
+import argparse
+
+import xmltodict
+
+from api.services.nmap_stream import iter_nmap_json
+from api.services.results import result_store
+
+
+def fake_nmap_xml(hosts: int, ports_per_host: int) -> bytes:
+    """XML no formato do Nmap com `hosts` hosts e `ports_per_host` portas abertas cada."""
+    parts = ['<?xml version="1.0"?><nmaprun scanner="nmap" args="nmap -sV" start="1700000000" version="7.94">']
+    for h in range(hosts):
+        parts.append(
+            f'<host starttime="1700000000" endtime="1700000100"><status state="up" reason="syn-ack"/>'
+            f'<address addr="10.0.{h // 256}.{h % 256}" addrtype="ipv4"/><hostnames/><ports>'
+        )
+        for p in range(1, ports_per_host + 1):
+            parts.append(
+                f'<port protocol="tcp" portid="{p}"><state state="open" reason="syn-ack" reason_ttl="64"/>'
+                f'<service name="http" product="nginx" version="1.{p % 20}" method="probed" conf="10">'
+                f'<cpe>cpe:/a:nginx:nginx:1.{p % 20}</cpe></service>'
+                f'<script id="http-title" output="Site {h}-{p}"><elem key="title">Site {h}-{p}</elem></script></port>'
+            )
+        parts.append('</ports><times srtt="100" rttvar="50" to="100000"/></host>')
+    parts.append(f'<runstats><finished time="1700000100" elapsed="100" exit="success"/>'
+                 f'<hosts up="{hosts}" down="0" total="{hosts}"/></runstats></nmaprun>')
+    return "".join(parts).encode()
+
+
+def measure(fn, repeat: int) -> tuple[float, float]:
+    """(ms de relógio, ms de CPU) médios por chamada."""
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - wall) / repeat * 1000, (time.process_time() - cpu) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Custo por requisição de result.json: parse a cada vez x JSON armazenado.")
+    parser.add_argument("--hosts", type=int, default=50, help="Hosts no resultado. Padrão: 50")
+    parser.add_argument("--ports", type=int, default=100, help="Portas abertas por host. Padrão: 100 (5k no total)")
+    parser.add_argument("--repeat", type=int, default=20, help="Requisições por medição. Padrão: 20")
+    args = parser.parse_args()
+
+    xml = fake_nmap_xml(args.hosts, args.ports)
+    key = result_store.key_for(f"bench-{uuid.uuid4().hex}", "result.json")
+    try:
+        # Ingestão (uma vez por scan, no worker)
+        ingest_ms, ingest_cpu = measure(lambda: result_store.save_chunks(key, iter_nmap_json(io.BytesIO(xml))), 1)
+        stored = result_store.save_chunks(key, iter_nmap_json(io.BytesIO(xml)))
+
+        cases = {
+            # O que GET result.json fazia antes: parse do XML inteiro + dumps
+            "antes (xmltodict)": lambda: json.dumps(xmltodict.parse(xml)).encode(),
+            "depois (descompacta)": lambda: b"".join(result_store.iter_chunks(key)),
+            "depois (gzip direto)": lambda: b"".join(result_store.iter_raw_chunks(key)),
+        }
+        print(f"{args.hosts * args.ports} portas; XML {len(xml) / 1e6:.1f} MB, JSON {stored.size / 1e6:.1f} MB "
+              f"({stored.stored_size / 1e6:.2f} MB armazenado)")
+        print(f"ingestão única: {ingest_ms:.0f} ms ({ingest_cpu:.0f} ms de CPU)")
+        print(f"{'por requisição':>22} {'ms':>8} {'CPU ms':>8} {'req/s/CPU':>10}")
+        for name, fn in cases.items():
+            wall, cpu = measure(fn, args.repeat)
+            print(f"{name:>22} {wall:>8.1f} {cpu:>8.1f} {1000 / max(cpu, 1e-3):>10.0f}")
+    finally:
+        result_store.delete(key)
+
+
+if __name__ == "__main__":
+    main()
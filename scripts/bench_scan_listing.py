@@ -0,0 +1,190 @@
+# scripts/bench_scan_listing.py
+import os
+import sys
+import time
+import base64
+import socket
+import argparse
+import statistics
+import subprocess
+
+import httpx
+from sqlalchemy import text
+
+from api.db.session import SessionLocal, engine
+from api.db.models import Token
+from api.security.auth import generate_api_token, hash_token
+
+# Donos das linhas geradas: o token medido fica com 1/10 delas
+OWNER = "bench-listing"
+OTHERS = "bench-listing-others"
+
+POPULATE_SQL = """
+INSERT INTO scans (id, status, profile, targets, tags, created_at, started_at, finished_at, token_id)
+SELECT gen_random_uuid(),
+       (ARRAY['succeeded','succeeded','succeeded','succeeded','succeeded','succeeded','succeeded','failed','queued','running'])[1 + i % 10],
+       (ARRAY['basic_version_detection','aggressive_scan','vuln_tcp_evasive'])[1 + i % 3],
+       jsonb_build_array('10.' || (i / 65536 % 256) || '.' || (i / 256 % 256) || '.' || (i % 256)),
+       jsonb_build_array('env-' || (i % 7), 'team-' || (i % 50)),
+       now() - i * interval '1 second',
+       now() - i * interval '1 second',
+       CASE WHEN i % 10 < 8 THEN now() - i * interval '1 second' + interval '90 seconds' END,
+       CASE WHEN i % 10 = 0 THEN :owner ELSE :others END
+FROM generate_series(:start, :stop) AS i
+"""
+
+
+def get_token(db, name: str, scopes: list[str]) -> tuple[Token, str]:
+    """Cria o token ou gera um novo valor para ele (as linhas continuam dele)."""
+    raw, prefix = generate_api_token()
+    token = db.query(Token).filter(Token.name == name, Token.owner_username.is_(None)).first()
+    if token is None:
+        token = Token(name=name, scopes=scopes)
+        db.add(token)
+    token.hashed_token, token.token_prefix, token.scopes, token.is_revoked = hash_token(raw), prefix, scopes, False
+    db.commit()
+    return token, raw
+
+
+def populate(db, rows: int, owner: Token, others: Token, batch: int = 500_000) -> None:
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    existing = db.execute(
+        text("SELECT count(*) FROM scans WHERE token_id IN (:a, :b)"), {"a": owner.id, "b": others.id}
+    ).scalar()
+    for start in range(existing, rows, batch):
+        stop = min(rows, start + batch) - 1
+        db.execute(text(POPULATE_SQL), {"start": start, "stop": stop, "owner": owner.id, "others": others.id})
+        db.commit()
+        db.execute(text("SET LOCAL statement_timeout = 0"))
+        print(f"{stop + 1} linhas...", file=sys.stderr, flush=True)
+    db.execute(text("ANALYZE scans"))
+    db.commit()
+
+
+def remove(db, owner: Token, others: Token) -> None:
+    """
+    Apaga as linhas geradas. As chaves estrangeiras de scans para scans
+    (cached_from, baseline_id) não têm índice completo: sem os temporários,
+    cada linha apagada varreria a tabela.
+    """
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    for column in ("cached_from", "baseline_id"):
+        db.execute(text(f"CREATE INDEX IF NOT EXISTS bench_scans_{column} ON scans ({column})"))
+    db.execute(text("DELETE FROM scans WHERE token_id IN (:a, :b)"), {"a": owner.id, "b": others.id})
+    for column in ("cached_from", "baseline_id"):
+        db.execute(text(f"DROP INDEX bench_scans_{column}"))
+    db.delete(owner)
+    db.delete(others)
+    db.commit()
+
+
+def cursor_at(db, depth: int, token_id: int | None) -> str | None:
+    """Cursor equivalente a ter paginado até `depth` linhas (fora da medição)."""
+    if depth == 0:
+        return None
+    where = "WHERE token_id = :token" if token_id else ""
+    row = db.execute(
+        text(f"SELECT created_at, id FROM scans {where} ORDER BY created_at DESC, id DESC OFFSET :n LIMIT 1"),
+        {"n": depth - 1, "token": token_id},
+    ).first()
+    if row is None:
+        return None
+    return base64.urlsafe_b64encode(f"{row.created_at.isoformat()}|{row.id}".encode()).decode().rstrip("=")
+
+
+def timed(fn, repeat: int = 5) -> float:
+    """Mediana em ms de `repeat` execuções, após uma de aquecimento."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Listagem de scans (OFFSET x cursor, filtros) em uma tabela grande.")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Linhas geradas em scans. Padrão: 10000000")
+    parser.add_argument("--depths", default="0,10000,100000,1000000,5000000",
+                        help="Profundidades de página medidas. Padrão: 0,10000,100000,1000000,5000000")
+    parser.add_argument("--limit", type=int, default=100, help="Tamanho da página. Padrão: 100")
+    parser.add_argument("--keep", action="store_true", help="Mantém as linhas geradas para as próximas execuções.")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("Requer PostgreSQL (generate_series, JSONB e os índices parciais).")
+
+    db = SessionLocal()
+    owner, owner_raw = get_token(db, OWNER, ["scan:read"])
+    others, _ = get_token(db, OTHERS, ["scan:read"])
+    admin, admin_raw = get_token(db, f"{OWNER}-admin", ["scan:read", "admin:read"])
+    populate(db, args.rows, owner, others)
+
+    port = free_port()
+    env = {**os.environ, "RATE_LIMIT_PER_MINUTE": "0", "GLOBAL_IP_ALLOWLIST": "127.0.0.1"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+    try:
+        client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300)
+        for _ in range(100):
+            try:
+                client.get("/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        def listing(raw: str, **params):
+            def call():
+                response = client.get("/v1/scans/", headers={"X-API-Token": raw}, params={"limit": args.limit, **params})
+                response.raise_for_status()
+            return call
+
+        def offset(depth: int, token_id: int | None):
+            where = "WHERE token_id = :token" if token_id else ""
+            sql = text(f"SELECT * FROM scans {where} ORDER BY created_at DESC OFFSET :n LIMIT :limit")
+            return lambda: db.execute(sql, {"n": depth, "limit": args.limit, "token": token_id}).all()
+
+        print(f"{'profundidade':>12} {'OFFSET ms':>10} {'cursor ms':>10} {'escopo OFFSET':>14} {'escopo cursor':>14}")
+        for depth in (int(d) for d in args.depths.split(",")):
+            if depth >= args.rows:
+                continue
+            scoped_depth = depth // 10
+            print(
+                f"{depth:>12} {timed(offset(depth, None), 3):>10.1f} "
+                f"{timed(listing(admin_raw, **({'cursor': cursor_at(db, depth, None)} if depth else {}))):>10.1f} "
+                f"{timed(offset(scoped_depth, owner.id), 3):>14.1f} "
+                f"{timed(listing(owner_raw, **({'cursor': cursor_at(db, scoped_depth, owner.id)} if scoped_depth else {}))):>14.1f}",
+                flush=True,
+            )
+
+        filters = {
+            "status=failed": {"status": "failed"},
+            "status=queued,running": {"status": ["queued", "running"]},
+            "tag=team-7": {"tag": "team-7"},
+            "target=10.0.1.1": {"target": "10.0.1.1"},
+            "profile+created_after": {"profile": "aggressive_scan", "created_after": "2000-01-01T00:00:00Z"},
+        }
+        print(f"{'filtro (1ª página)':>24} {'admin ms':>9} {'escopo ms':>10}")
+        for name, params in filters.items():
+            print(f"{name:>24} {timed(listing(admin_raw, **params)):>9.1f} {timed(listing(owner_raw, **params)):>10.1f}",
+                  flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+        db.delete(admin)
+        db.commit()
+        if not args.keep:
+            remove(db, owner, others)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
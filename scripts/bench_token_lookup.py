@@ -0,0 +1,121 @@
+# scripts/bench_token_lookup.py
+import time
+import argparse
+import secrets
+import statistics
+
+from sqlalchemy import text
+
+from api.db.session import SessionLocal
+from api.db.models import Token
+from api.security.auth import _authenticate, generate_api_token, hash_token
+
+NAME = "bench-lookup"
+
+# Tokens de enchimento: prefixos aleatórios e hashes fictícios (únicos, nunca
+# verificados pela busca por prefixo)
+FILL_SQL = """
+INSERT INTO tokens (name, hashed_token, token_prefix, scopes, allowed_ips, allowed_targets)
+SELECT :name, 'bench-lookup-' || i || '-' || md5(random()::text), substr(md5(random()::text), 1, 16),
+       '["scan:read"]'::json, '[]'::json, '[]'::json
+FROM generate_series(:start, :stop) AS i
+"""
+
+
+def fillers(db) -> int:
+    return db.execute(text("SELECT count(*) FROM tokens WHERE name = :name"), {"name": NAME}).scalar()
+
+
+def fill(db, total: int) -> None:
+    existing = fillers(db)
+    if existing < total:
+        db.execute(text(FILL_SQL), {"name": NAME, "start": existing, "stop": total - 1})
+        db.execute(text("ANALYZE tokens"))
+        db.commit()
+
+
+def add_token(db, raw: str, prefix: str | None) -> Token:
+    """O token medido é sempre o último inserido (maior id)."""
+    token = Token(name=f"{NAME}-real", hashed_token=hash_token(raw), token_prefix=prefix, scopes=["scan:read"])
+    db.add(token)
+    db.commit()
+    return token
+
+
+def timed(raw: str, repeats: int, reset=None) -> float:
+    samples = []
+    for _ in range(repeats):
+        if reset:
+            reset()
+        started = time.perf_counter()
+        if _authenticate(raw) is None:
+            raise RuntimeError("token medido não autenticou")
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench_prefix(db, sizes: list[int], repeats: int) -> None:
+    print(f"{'tokens':>8} {'autenticação (mediana) ms':>26}")
+    raw, prefix = generate_api_token()
+    for size in sizes:
+        fill(db, size - 1)
+        token = add_token(db, raw, prefix)
+        try:
+            print(f"{size:>8} {timed(raw, repeats):>26.1f}", flush=True)
+        finally:
+            db.delete(token)
+            db.commit()
+
+
+def bench_legacy(db, sizes: list[int], repeats: int) -> None:
+    """Caminho legado: uma verificação argon2 por token ainda sem prefixo."""
+    print(f"\n{'legados':>8} {'autenticação (mediana) ms':>26}")
+    raw = secrets.token_urlsafe(32)
+    created: list[Token] = []
+    try:
+        for size in sizes:
+            while len(created) < size - 1:
+                created.append(add_token(db, secrets.token_urlsafe(32), None))
+            token = add_token(db, raw, None)
+
+            def reset():
+                db.execute(text("UPDATE tokens SET token_prefix = NULL WHERE id = :id"), {"id": token.id})
+                db.commit()
+
+            try:
+                print(f"{size:>8} {timed(raw, repeats, reset):>26.1f}", flush=True)
+            finally:
+                db.delete(token)
+                db.commit()
+    finally:
+        for token in created:
+            db.delete(token)
+        db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Mede a autenticação (busca + argon2) com o token medido inserido por último, "
+                    "variando a quantidade de tokens no banco."
+    )
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="Quantidades de tokens. Padrão: 10,100,1000,10000")
+    parser.add_argument("--legacy-sizes", default="1,5,10",
+                        help="Quantidades de tokens legados (vazio pula). Padrão: 1,5,10")
+    parser.add_argument("--repeats", type=int, default=15, help="Autenticações por tamanho. Padrão: 15")
+    parser.add_argument("--keep", action="store_true", help="Mantém os tokens de enchimento no banco.")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        bench_prefix(db, [int(s) for s in args.sizes.split(",")], args.repeats)
+        if args.legacy_sizes:
+            bench_legacy(db, [int(s) for s in args.legacy_sizes.split(",")], max(1, args.repeats // 5))
+        if not args.keep:
+            db.execute(text("DELETE FROM tokens WHERE name = :name"), {"name": NAME})
+            db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# scripts/bench_worker_pool.py
+import os
+import sys
+import stat
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from redis import Redis
+from rq import Queue
+
+from api.config import settings
+from api.worker import ScanWorker, ScanWorkerPool, WarmWorker
+
+# Nmap falso: espera como um scan preso na rede e devolve um XML mínimo
+FAKE_NMAP = """#!/bin/sh
+sleep "${BENCH_NMAP_SECONDS:-5}"
+echo '<?xml version="1.0"?><nmaprun scanner="nmap"><runstats><finished elapsed="0"/><hosts up="0" down="0" total="0"/></runstats></nmaprun>'
+"""
+
+WORKER_MODES = {"fork": ScanWorker, "warm": WarmWorker}
+
+
+def fake_scan(index: int) -> int | None:
+    """
+    Job do benchmark, com o custo fixo de um scan real: sessão no banco,
+    Redis, o run_nmap_scan de verdade (processo, gravação do XML, tempo
+    limite) e o webhook para um receptor local. O perfil via proxychains é
+    resolvido pelo PATH e aponta para o Nmap falso.
+    """
+    # Importados aqui para que o modo com fork pague a importação como em produção
+    from sqlalchemy import text
+    from api.db.session import SessionLocal
+    from api.schemas import ScanProfile
+    from api.services import tasks
+    from api.services.nmap_runner import run_nmap_scan
+    from api.services.results import result_store
+    from api.services.webhooks import send_webhook
+
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+    finally:
+        db.close()
+    tasks.redis_conn.ping()
+
+    xml_key = result_store.key_for(f"bench-{index}", "result.xml")
+    run = run_nmap_scan(f"bench-{index}", ["127.0.0.1"], ScanProfile.PROXY_VULN_SCAN.value, None, "T4", xml_key)
+    result_store.delete(xml_key)
+    send_webhook(os.environ["BENCH_WEBHOOK_URL"], {"id": f"bench-{index}", "status": "succeeded"})
+    return run.returncode
+
+
+class _WebhookSink(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def bench(connection: Redis, mode: str, slots: int, jobs: int) -> tuple[float, int]:
+    """Executa `jobs` scans falsos com `slots` vagas. Retorna (segundos, jobs concluídos)."""
+    queue = Queue(f"bench-{uuid.uuid4().hex}", connection=connection)
+    queue.enqueue_many([
+        Queue.prepare_data("scripts.bench_worker_pool.fake_scan", args=(i,), timeout=600) for i in range(jobs)
+    ])
+    pool = ScanWorkerPool(
+        [queue.name], connection=connection, max_slots=slots, max_load=0, worker_class=WORKER_MODES[mode],
+    )
+    started = time.monotonic()
+    pool.start(burst=True, logging_level="WARNING")
+    elapsed = time.monotonic() - started
+    finished = queue.finished_job_registry.count
+    queue.delete(delete_jobs=True)
+    return elapsed, finished
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mede jobs/hora do worker de scans com um Nmap falso que só espera.")
+    parser.add_argument("--slots", default="1,2,4,8", help="Números de vagas a medir. Padrão: 1,2,4,8")
+    parser.add_argument("--modes", default="fork,warm", help="Modos das vagas (fork, warm). Padrão: fork,warm")
+    parser.add_argument("--jobs", type=int, default=16, help="Jobs por medição. Padrão: 16")
+    parser.add_argument("--seconds", type=float, default=5,
+                        help="Duração de cada scan falso; 0 mede só o custo fixo por job. Padrão: 5")
+    args = parser.parse_args()
+
+    bin_dir = tempfile.mkdtemp(prefix="autonmap-bench-")
+    fake = os.path.join(bin_dir, "proxychains")
+    with open(fake, "w") as f:
+        f.write(FAKE_NMAP)
+    os.chmod(fake, os.stat(fake).st_mode | stat.S_IXUSR)
+    sink = ThreadingHTTPServer(("127.0.0.1", 0), _WebhookSink)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    # Herdados pelas vagas, que são processos filhos
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ["BENCH_NMAP_SECONDS"] = str(args.seconds)
+    os.environ["BENCH_WEBHOOK_URL"] = f"http://127.0.0.1:{sink.server_port}/"
+
+    connection = Redis.from_url(settings.REDIS_URL)
+    print(f"{args.jobs} jobs de {args.seconds}s cada", file=sys.stderr, flush=True)
+    print(f"{'modo':>5} {'vagas':>5} {'segundos':>9} {'jobs/hora':>10} {'ganho':>6} {'extra/job':>10}")
+    baseline = None
+    try:
+        for mode in args.modes.split(","):
+            for slots in (int(n) for n in args.slots.split(",")):
+                elapsed, finished = bench(connection, mode, slots, args.jobs)
+                rate = finished / elapsed * 3600 if elapsed else 0
+                baseline = baseline or rate
+                # Tempo de cada vaga por job além da espera do Nmap falso
+                extra_ms = max(0.0, elapsed * slots / max(finished, 1) - args.seconds) * 1000
+                print(
+                    f"{mode:>5} {slots:>5} {elapsed:>9.1f} {rate:>10.0f} {rate / baseline:>5.1f}x {extra_ms:>8.0f}ms",
+                    flush=True,
+                )
+                if finished != args.jobs:
+                    print(f"Aviso: só {finished} de {args.jobs} jobs concluídos ({mode}, {slots} vagas).",
+                          file=sys.stderr, flush=True)
+    finally:
+        sink.shutdown()
+        shutil.rmtree(bin_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
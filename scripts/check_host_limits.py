@@ -0,0 +1,70 @@
+# scripts/check_host_limits.py
+import sys
+import uuid
+
+from redis import Redis
+
+from api.config import settings
+from api.services.host_limits import HostLimiter, host_keys
+
+# (alvos do job A, alvos do job B, devem colidir), com agrupamento /32 e /128
+CASES = [
+    (["10.0.0.0/24"], ["10.0.0.5"], True),
+    (["10.0.0.5"], ["10.0.0.0/24"], True),
+    (["10.0.0.0/24"], ["10.0.1.5"], False),
+    (["10.0.0.5"], ["10.0.0.6"], False),
+    (["10.0.0.0/25"], ["10.0.0.128/25"], False),
+    (["10.0.0.0/24"], ["10.0.0.64/26"], True),
+    (["2001:db8::/120"], ["2001:db8::ff"], True),
+    (["2001:db8::/120"], ["2001:db8::1:0"], False),
+    (["scanme.example.com"], ["SCANME.example.com."], True),
+    # Acima de SCAN_HOST_LIMIT_MAX_KEYS sub-redes: níveis maiores, com contenção
+    (["10.0.0.0/16"], ["10.0.200.7"], True),
+    (["10.0.200.7"], ["10.0.0.0/16"], True),
+    (["10.0.0.0/8"], ["10.20.0.0/12"], True),
+    (["10.0.0.0/8"], ["11.0.0.1"], False),
+    (["2001:db8::/32"], ["2001:db8:1::1"], True),
+]
+
+
+def collides(redis_conn, limiter: HostLimiter, a: list[str], b: list[str]) -> bool:
+    """Se, com uma vaga por host, o job sobre `b` fica sem vaga enquanto o de `a` executa."""
+    holder_a, holder_b = f"check-{uuid.uuid4().hex}", f"check-{uuid.uuid4().hex}"
+    try:
+        if not limiter.acquire(redis_conn, holder_a, a):
+            raise RuntimeError(f"Sem vaga para {a} com o limitador vazio.")
+        return not limiter.acquire(redis_conn, holder_b, b)
+    finally:
+        limiter.release(redis_conn, holder_a, a)
+        limiter.release(redis_conn, holder_b, b)
+
+
+def main() -> None:
+    settings.SCAN_HOST_LIMIT_PREFIX_V4, settings.SCAN_HOST_LIMIT_PREFIX_V6 = 32, 128
+    redis_conn = Redis.from_url(settings.REDIS_URL)
+    limiter = HostLimiter(1)
+    failed = False
+    for a, b, expected in CASES:
+        collided = collides(redis_conn, limiter, a, b)
+        ok = collided == expected
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FALHA':>5} {', '.join(a)} x {', '.join(b)}: "
+              f"{'colidem' if collided else 'independentes'} (esperado: {'colidem' if expected else 'independentes'})")
+
+    for target in ("10.0.0.0/8", "10.0.0.0/23", "2001:db8::/32", "::/0"):
+        count = len(host_keys([target]))
+        if count > settings.SCAN_HOST_LIMIT_MAX_KEYS:
+            print(f"FALHA {target}: {count} chaves (máximo {settings.SCAN_HOST_LIMIT_MAX_KEYS})")
+            failed = True
+
+    # A vaga volta após a liberação
+    holder = f"check-{uuid.uuid4().hex}"
+    admitted = limiter.acquire(redis_conn, holder, ["10.0.0.5"])
+    limiter.release(redis_conn, holder, ["10.0.0.5"])
+    failed = failed or not admitted
+    print(f"{'ok' if admitted else 'FALHA':>5} vagas liberadas após cada caso")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# scripts/check_shard_merge.py
+import io
+import sys
+import random
+import argparse
+import xml.etree.ElementTree as ET
+
+from api.services.nmap_merge import combine_port_results, merge_nmap_xml
+
+SERVICES = ["http", "ssh", "smtp", "domain", "https", "mysql", "rdp", "snmp"]
+
+
+def canned_network(hosts: int, ports: int, rng: random.Random) -> list[tuple[str, bool, dict[int, str]]]:
+    """(endereço, up, {porta aberta: serviço}) para `hosts` hosts; 1/8 deles fora do ar."""
+    network = []
+    for h in range(hosts):
+        up = h % 8 != 7
+        open_ports = {p: rng.choice(SERVICES) for p in rng.sample(range(1, ports + 1), rng.randint(0, 12))} if up else {}
+        network.append((f"10.0.{h // 256}.{h % 256}", up, open_ports))
+    return network
+
+
+def nmap_xml(network, first_port: int, last_port: int, start: int = 1700000000) -> bytes:
+    """
+    XML de uma execução do Nmap sobre `network` e as portas first_port-last_port,
+    com o ruído de progresso (taskbegin/taskprogress/taskend) que o merge descarta.
+    """
+    parts = [
+        f'<?xml version="1.0"?><nmaprun scanner="nmap" args="nmap -sV -p{first_port}-{last_port}" '
+        f'start="{start}" version="7.94">',
+        f'<scaninfo type="syn" protocol="tcp" numservices="{last_port - first_port + 1}" services="{first_port}-{last_port}"/>',
+        '<verbose level="0"/><debugging level="0"/>',
+        f'<taskbegin task="SYN Stealth Scan" time="{start}"/>',
+        f'<taskprogress task="SYN Stealth Scan" time="{start + 5}" percent="50.00" remaining="5" etc="{start + 10}"/>',
+        f'<taskend task="SYN Stealth Scan" time="{start + 10}" extrainfo="{len(network)} total ports"/>',
+    ]
+    up = 0
+    for address, host_up, open_ports in network:
+        if not host_up:
+            parts.append(f'<host><status state="down" reason="no-response" reason_ttl="0"/>'
+                         f'<address addr="{address}" addrtype="ipv4"/></host>')
+            continue
+        up += 1
+        in_range = sorted(p for p in open_ports if first_port <= p <= last_port)
+        parts.append(f'<host starttime="{start}" endtime="{start + 10}"><status state="up" reason="syn-ack"/>'
+                     f'<address addr="{address}" addrtype="ipv4"/><hostnames/><ports>')
+        closed = last_port - first_port + 1 - len(in_range)
+        if closed:
+            parts.append(f'<extraports state="closed" count="{closed}">'
+                         f'<extrareasons reason="reset" count="{closed}"/></extraports>')
+        for port in in_range:
+            parts.append(f'<port protocol="tcp" portid="{port}"><state state="open" reason="syn-ack"/>'
+                         f'<service name="{open_ports[port]}" method="probed" conf="10"/></port>')
+        parts.append('</ports></host>')
+    parts.append(f'<runstats><finished time="{start + 10}" elapsed="10" exit="success"/>'
+                 f'<hosts up="{up}" down="{len(network) - up}" total="{len(network)}"/></runstats></nmaprun>')
+    return "".join(parts).encode()
+
+
+def summary(xml: bytes) -> dict:
+    """O que precisa coincidir: hosts (na ordem), estado, portas, extraports e runstats."""
+    root = ET.fromstring(xml)
+    hosts = []
+    for host in root.iter("host"):
+        ports = [
+            (p.get("protocol"), int(p.get("portid")), p.find("state").get("state"), p.find("service").get("name"))
+            for p in host.iterfind("ports/port")
+        ]
+        extraports = {e.get("state"): int(e.get("count")) for e in host.iterfind("ports/extraports")}
+        hosts.append((host.find("address").get("addr"), host.find("status").get("state"), ports, extraports))
+    runstats = root.findall("runstats")
+    counts = [runstats[-1].find("hosts").get(k) for k in ("up", "down", "total")] if runstats else None
+    skipped = [e.tag for e in root if e.tag in ("taskbegin", "taskprogress", "taskend")]
+    return {"hosts": hosts, "runstats": (len(runstats), counts), "scaninfo": len(root.findall("scaninfo")),
+            "skipped": skipped}
+
+
+def split(items: list, parts: int) -> list[list]:
+    size = -(-len(items) // parts)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def port_ranges(ports: int, parts: int) -> list[tuple[int, int]]:
+    return [(chunk[0], chunk[-1]) for chunk in split(list(range(1, ports + 1)), parts)]
+
+
+def run(fn, sources: list[bytes]) -> bytes:
+    out = io.BytesIO()
+    fn([io.BytesIO(s) for s in sources], out)
+    return out.getvalue()
+
+
+def compare(expected: dict, merged: dict) -> list[str]:
+    problems = []
+    if merged["skipped"]:
+        problems.append(f"ruído de progresso no resultado: {merged['skipped']}")
+    if merged["scaninfo"] != 1:
+        problems.append(f"{merged['scaninfo']} scaninfo (esperado 1)")
+    if merged["runstats"][0] != 1:
+        problems.append(f"{merged['runstats'][0]} runstats (esperado 1)")
+    if merged["runstats"][1] != expected["runstats"][1]:
+        problems.append(f"runstats up/down/total {merged['runstats'][1]} (esperado {expected['runstats'][1]})")
+    expected_hosts = {h[0]: h for h in expected["hosts"]}
+    merged_hosts = {h[0]: h for h in merged["hosts"]}
+    if len(merged_hosts) != len(merged["hosts"]):
+        problems.append("hosts repetidos")
+    if [h[0] for h in merged["hosts"]] != [h[0] for h in expected["hosts"]]:
+        problems.append("hosts em ordem diferente ou faltando")
+    for address, host in expected_hosts.items():
+        if merged_hosts.get(address, host) != host:
+            problems.append(f"{address}: {merged_hosts[address][1:]} (esperado {host[1:]})")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Confere o XML combinado dos shards (alvos, portas, ambos) contra o de uma execução única."
+    )
+    parser.add_argument("--hosts", type=int, default=64, help="Hosts da rede simulada. Padrão: 64")
+    parser.add_argument("--ports", type=int, default=1000, help="Faixa de portas (1-N). Padrão: 1000")
+    parser.add_argument("--target-shards", type=int, default=4, help="Shards de alvos. Padrão: 4")
+    parser.add_argument("--port-shards", type=int, default=3, help="Shards de portas. Padrão: 3")
+    parser.add_argument("--seed", type=int, default=42, help="Semente da rede simulada. Padrão: 42")
+    args = parser.parse_args()
+
+    network = canned_network(args.hosts, args.ports, random.Random(args.seed))
+    expected = summary(nmap_xml(network, 1, args.ports))
+    groups = split(network, args.target_shards)
+    ranges = port_ranges(args.ports, args.port_shards)
+
+    cases = {
+        # merge_nmap_xml: um XML por shard de alvos, todas as portas
+        "alvos": lambda: run(merge_nmap_xml, [nmap_xml(group, 1, args.ports) for group in groups]),
+        # combine_port_results: todos os alvos, uma faixa de portas por XML
+        "portas": lambda: run(combine_port_results, [nmap_xml(network, a, b) for a, b in ranges]),
+        # Como _shard_sources: portas combinadas por shard de alvos, depois os shards
+        "alvos x portas": lambda: run(merge_nmap_xml, [
+            run(combine_port_results, [nmap_xml(group, a, b) for a, b in ranges]) for group in groups
+        ]),
+    }
+
+    print(f"{args.hosts} hosts, portas 1-{args.ports}, {len(groups)} shards de alvos, {len(ranges)} de portas")
+    failed = False
+    for name, merge in cases.items():
+        problems = compare(expected, summary(merge()))
+        print(f"{name:>16}: {'ok' if not problems else f'{len(problems)} diferença(s)'}")
+        for problem in problems[:10]:
+            print(f"{'':>18}{problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# scripts/check_shard_pipeline.py
+import os
+import sys
+import stat
+import random
+import argparse
+import tempfile
+from collections import deque
+from ipaddress import ip_network
+
+from api.config import settings
+from api.db.session import SessionLocal
+from api.db.models import Scan, ScanResult
+from api.services import tasks
+from api.services.results import result_store
+from api.services.sharding import format_port_spec, parse_port_spec
+from scripts.check_shard_merge import SERVICES, compare, summary
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Perfil que resolve "nmap" pelo PATH (via proxychains); os demais usam /usr/bin/nmap
+PROFILE = "proxy_vuln_scan"
+# Opções do Nmap seguidas de um valor, para separar os alvos dos argumentos
+OPTIONS_WITH_VALUE = {"-oX", "-p", "--stats-every", "--max-rate", "--mtu"}
+
+PROXYCHAINS_STUB = """#!/bin/sh
+[ "$1" = "-q" ] && shift
+exec "$@"
+"""
+
+NMAP_STUB = f"""#!{sys.executable}
+import sys
+sys.path.insert(0, {ROOT!r})
+from scripts.check_shard_pipeline import stub_nmap
+stub_nmap(sys.argv[1:])
+"""
+
+
+def host_state(address: str, seed: int) -> tuple[bool, dict[int, str]]:
+    """Estado fixo de cada endereço: 1/8 fora do ar, até 12 portas abertas em 1-1000."""
+    rng = random.Random(f"{seed}-{address}")
+    if rng.random() < 1 / 8:
+        return False, {}
+    return True, {p: rng.choice(SERVICES) for p in rng.sample(range(1, 1001), rng.randint(0, 12))}
+
+
+def stub_nmap(argv: list[str]) -> None:
+    """
+    Nmap simulado: escreve em stdout o XML que o Nmap escreveria para os
+    alvos e portas pedidos (-p), com o ruído de progresso no meio dos hosts.
+    """
+    ports, targets, skip = None, [], False
+    for index, arg in enumerate(argv):
+        if skip:
+            skip = False
+            continue
+        if arg in OPTIONS_WITH_VALUE:
+            skip = True
+            if arg == "-p":
+                ports = parse_port_spec(argv[index + 1])
+        elif not arg.startswith("-"):
+            targets.append(arg)
+    ports = ports or list(range(1, 1001))
+    seed = int(os.environ.get("STUB_NMAP_SEED", "42"))
+    start = 1700000000
+
+    out = sys.stdout
+    out.write(f'<?xml version="1.0"?><nmaprun scanner="nmap" args="nmap {" ".join(argv)}" start="{start}" version="7.94">')
+    out.write(f'<scaninfo type="connect" protocol="tcp" numservices="{len(ports)}" services="{format_port_spec(ports)}"/>')
+    out.write('<verbose level="2"/><debugging level="0"/>')
+    out.write(f'<taskbegin task="Connect Scan" time="{start}"/>\n')
+    wanted, up, total = set(ports), 0, 0
+    for target in targets:
+        for address in ip_network(target, strict=False):
+            total += 1
+            host_up, open_ports = host_state(str(address), seed)
+            if not host_up:
+                out.write(f'<host><status state="down" reason="no-response" reason_ttl="0"/>'
+                          f'<address addr="{address}" addrtype="ipv4"/></host>\n')
+                continue
+            up += 1
+            in_range = sorted(p for p in open_ports if p in wanted)
+            out.write(f'<host starttime="{start}" endtime="{start + 10}"><status state="up" reason="user-set"/>'
+                      f'<address addr="{address}" addrtype="ipv4"/><hostnames/><ports>')
+            closed = len(ports) - len(in_range)
+            if closed:
+                out.write(f'<extraports state="closed" count="{closed}">'
+                          f'<extrareasons reason="conn-refused" count="{closed}"/></extraports>')
+            for port in in_range:
+                out.write(f'<port protocol="tcp" portid="{port}"><state state="open" reason="syn-ack"/>'
+                          f'<service name="{open_ports[port]}" method="probed" conf="10"/></port>')
+            out.write('</ports></host>\n')
+            if total % 16 == 0:
+                out.write(f'<taskprogress task="Connect Scan" time="{start + 5}" percent="50.00" '
+                          f'remaining="5" etc="{start + 10}"/>\n')
+    out.write(f'<taskend task="Connect Scan" time="{start + 10}"/>\n')
+    out.write(f'<runstats><finished time="{start + 10}" elapsed="10" exit="success"/>'
+              f'<hosts up="{up}" down="{total - up}" total="{total}"/></runstats></nmaprun>\n')
+
+
+def install_stubs(directory: str) -> None:
+    """Coloca proxychains e nmap simulados no início do PATH (herdado pelo worker)."""
+    for name, content in (("proxychains", PROXYCHAINS_STUB), ("nmap", NMAP_STUB)):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = f"{directory}{os.pathsep}{os.environ['PATH']}"
+
+
+class SyncQueue:
+    """
+    Faz as vezes da fila dos workers: guarda os jobs enfileirados e os
+    executa em ordem, neste processo, até não restar nenhum.
+    """
+
+    def __init__(self):
+        self.jobs = deque()
+        self.executed = 0
+
+    def for_tenant(self, *args, **kwargs) -> "SyncQueue":
+        return self
+
+    def enqueue_many(self, jobs) -> None:
+        self.jobs.extend(jobs)
+
+    def dispatch(self) -> int:
+        return 0
+
+    def record_duration(self, seconds: float) -> None:
+        pass
+
+    def drain(self) -> None:
+        while self.jobs:
+            job = self.jobs.popleft()
+            job.func(*(job.args or ()), **(job.kwargs or {}))
+            self.executed += 1
+
+
+def run_scan(db, queue: SyncQueue, targets: list[str], ports: str, shard_hosts: int, port_shards: int | None) -> Scan:
+    """Cria o scan e o executa como o worker faria: execute_scan_task, shards e combinação."""
+    settings.SCAN_SHARD_HOSTS = shard_hosts
+    scan = Scan(profile=PROFILE, targets=targets, ports=ports, status="queued")
+    db.add(scan)
+    db.commit()
+    queue.executed = 0
+    tasks.execute_scan_task(str(scan.id), targets, PROFILE, ports, "T4", None, port_shards=port_shards)
+    queue.drain()
+    db.refresh(scan)
+    return scan
+
+
+def stored_xml(db, scan: Scan) -> bytes:
+    result = db.get(ScanResult, (scan.id, "xml"))
+    if result is None:
+        raise RuntimeError(f"Scan {scan.id} ({scan.status}) sem resultado XML.")
+    with result_store.open(result.storage_key) as f:
+        return f.read()
+
+
+def remove(db, scans: list[Scan]) -> None:
+    for scan in scans:
+        for result in db.query(ScanResult).filter(ScanResult.scan_id == scan.id).all():
+            result_store.delete(result.storage_key)
+        db.delete(scan)
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Executa um scan dividido de ponta a ponta (execute_scan_task, jobs dos shards e "
+                    "combinação) com um Nmap simulado no PATH e compara o resultado com o de um único job."
+    )
+    parser.add_argument("--targets", default="10.0.0.0/26,10.0.1.0/28", help="Alvos, separados por vírgula.")
+    parser.add_argument("--ports", default="1-1000", help="Portas. Padrão: 1-1000")
+    parser.add_argument("--shard-hosts", type=int, default=16, help="SCAN_SHARD_HOSTS do scan dividido. Padrão: 16")
+    parser.add_argument("--port-shards", type=int, default=3, help="port_shards do scan dividido (0 = sem). Padrão: 3")
+    args = parser.parse_args()
+
+    queue = SyncQueue()
+    tasks.q = queue
+    settings.SCAN_HOST_CONCURRENCY = 0
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+
+    db = SessionLocal()
+    scans = []
+    with tempfile.TemporaryDirectory(prefix="stub-nmap-") as stubs:
+        install_stubs(stubs)
+        try:
+            single = run_scan(db, queue, targets, args.ports, 0, None)
+            scans.append(single)
+            sharded = run_scan(db, queue, targets, args.ports, args.shard_hosts, args.port_shards or None)
+            scans.append(sharded)
+
+            print(f"único: {single.status}; dividido: {sharded.status}, {sharded.shard_count} shards "
+                  f"({sharded.shards_failed} com falha), {queue.executed} jobs")
+            problems = []
+            if single.status != "succeeded" or sharded.status != "succeeded":
+                problems.append("scan não terminou como succeeded")
+            if not sharded.shard_count or sharded.shard_count < 2:
+                problems.append("o scan não foi dividido")
+            leftover = db.query(ScanResult).filter(
+                ScanResult.scan_id == sharded.id, ScanResult.kind.like("shard-%")
+            ).count()
+            if leftover:
+                problems.append(f"{leftover} resultados parciais não removidos")
+            if not problems:
+                problems = compare(summary(stored_xml(db, single)), summary(stored_xml(db, sharded)))
+        finally:
+            remove(db, scans)
+            db.close()
+
+    print("ok" if not problems else f"{len(problems)} diferença(s)")
+    for problem in problems[:10]:
+        print(f"  {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
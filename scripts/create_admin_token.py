@@ -1,11 +1,12 @@
 # scripts/create_admin_token.py
 import sys
-import secrets
 import argparse
 
 from api.db.session import SessionLocal
 from api.db.models import Token
-from api.security.auth import hash_token
+from api.security.auth import generate_api_token, hash_token
+from api.security.token_cache import publish_revocation
+from api.services.tasks import redis_conn
 
 
 def issue_admin_token(name: str, force: bool) -> int:
@@ -31,22 +32,28 @@ def issue_admin_token(name: str, force: bool) -> int:
             return 0
 
         # Gera token novo
-        admin_token_raw = secrets.token_urlsafe(32)
+        admin_token_raw, token_prefix = generate_api_token()
         hashed = hash_token(admin_token_raw)
 
         if existing and force:
             existing.hashed_token = hashed
+            existing.token_prefix = token_prefix
             existing.scopes = scopes
         else:
             db_token = Token(
                 name=name,
                 hashed_token=hashed,
+                token_prefix=token_prefix,
                 scopes=scopes,
             )
             db.add(db_token)
 
         db.commit()
 
+        if existing and force:
+            # Derruba o valor antigo dos caches das réplicas da API
+            publish_revocation(redis_conn, existing.id)
+
         # Cabeçalho e rodapé no STDERR
         print('--- ADMIN TOKEN GERADO (NUNCA EXPIRA) ---', file=sys.stderr, flush=True)
         print('Guarde este token em um local seguro. Ele só será exibido uma vez:', file=sys.stderr, flush=True)
@@ -0,0 +1,62 @@
+# scripts/legacy_tokens.py
+import sys
+import argparse
+
+from api.db.session import SessionLocal
+from api.db.models import Token
+from api.security.token_cache import publish_revocation
+from api.services.tasks import redis_conn
+
+
+def legacy_tokens(revoke: bool) -> int:
+    """
+    Lista os tokens ativos emitidos antes do formato com prefixo que ainda
+    não foram usados desde então (sem `token_prefix`). Esses tokens só são
+    aceitos pelo caminho legado da autenticação; com --revoke, são revogados.
+    Retorna quantos restam ativos.
+    """
+    db = SessionLocal()
+    try:
+        tokens = db.query(Token).filter(
+            Token.is_revoked == False,
+            Token.token_prefix.is_(None),
+        ).order_by(Token.id).all()
+
+        for token in tokens:
+            print(f"{token.id}\t{token.name}\t{token.owner_username or '-'}\t{token.created_at}", flush=True)
+
+        if revoke and tokens:
+            for token in tokens:
+                token.is_revoked = True
+            db.commit()
+            for token in tokens:
+                publish_revocation(redis_conn, token.id)
+            print(f"{len(tokens)} tokens legados revogados.", file=sys.stderr, flush=True)
+            return 0
+
+        if tokens:
+            print(
+                f"{len(tokens)} tokens legados ativos. Reemita-os (ou use --revoke) antes de "
+                "definir LEGACY_TOKEN_LOOKUP=false.",
+                file=sys.stderr,
+                flush=True,
+            )
+        else:
+            print("Nenhum token legado ativo: defina LEGACY_TOKEN_LOOKUP=false.", file=sys.stderr, flush=True)
+        return len(tokens)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Lista (e opcionalmente revoga) tokens sem prefixo de busca.")
+    parser.add_argument("--revoke", action="store_true", help="Revoga os tokens legados listados.")
+    args = parser.parse_args()
+
+    remaining = legacy_tokens(revoke=args.revoke)
+    # Código de saída != 0 enquanto restarem tokens legados (útil em automação)
+    sys.exit(1 if remaining else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# scripts/migrate_results.py
+import sys
+import uuid
+import argparse
+
+from sqlalchemy import exists, inspect, text
+from sqlalchemy.orm import aliased
+
+from api.db.session import SessionLocal, engine
+from api.db.models import ScanResult
+from api.services.nmap_stream import iter_nmap_json
+from api.services.results import record_result, result_store
+
+
+def migrate_legacy_results(batch_size: int = 50) -> tuple[int, int, int]:
+    """
+    Move o XML bruto de `scans.result_xml` (esquema antigo) para o
+    armazenamento de resultados compactado e remove a coluna ao final.
+    Retoma de onde parou se interrompido. Retorna (scans, bytes_originais, bytes_armazenados).
+    """
+    columns = {c["name"] for c in inspect(engine).get_columns("scans")}
+    if "result_xml" not in columns:
+        return 0, 0, 0
+
+    migrated = raw_total = stored_total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                text("SELECT id, result_xml FROM scans WHERE result_xml IS NOT NULL LIMIT :n"),
+                {"n": batch_size},
+            ).all()
+            if not rows:
+                break
+
+            for scan_id, result_xml in rows:
+                stored = result_store.save_bytes(
+                    result_store.key_for(str(scan_id), "result.xml"), result_xml.encode("utf-8")
+                )
+                record_result(db, uuid.UUID(str(scan_id)), "xml", stored)
+                db.execute(text("UPDATE scans SET result_xml = NULL WHERE id = :id"), {"id": scan_id})
+                migrated += 1
+                raw_total += stored.size
+                stored_total += stored.stored_size
+
+            db.commit()
+            print(f"{migrated} resultados migrados...", file=sys.stderr, flush=True)
+
+        db.execute(text("ALTER TABLE scans DROP COLUMN IF EXISTS result_xml"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return migrated, raw_total, stored_total
+
+
+def backfill_json_results(batch_size: int = 50) -> int:
+    """Gera o JSON canônico para resultados XML que ainda não o possuem."""
+    json_result = aliased(ScanResult)
+    generated = 0
+    db = SessionLocal()
+    try:
+        while True:
+            pending = db.query(ScanResult).filter(
+                ScanResult.kind == "xml",
+                ~exists().where(json_result.scan_id == ScanResult.scan_id, json_result.kind == "json"),
+            ).limit(batch_size).all()
+            if not pending:
+                break
+
+            for xml_result in pending:
+                with result_store.open(xml_result.storage_key) as f:
+                    stored = result_store.save_chunks(
+                        result_store.key_for(str(xml_result.scan_id), "result.json"), iter_nmap_json(f)
+                    )
+                record_result(db, xml_result.scan_id, "json", stored)
+                generated += 1
+
+            db.commit()
+            print(f"{generated} resultados JSON gerados...", file=sys.stderr, flush=True)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return generated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migra scans.result_xml para o armazenamento de resultados e gera o JSON canônico.")
+    parser.add_argument("--batch-size", type=int, default=50, help="Scans por transação. Padrão: 50")
+    args = parser.parse_args()
+
+    try:
+        migrated, raw_total, stored_total = migrate_legacy_results(args.batch_size)
+    except Exception as e:
+        print(f'Erro ao migrar resultados: {e}', file=sys.stderr, flush=True)
+        sys.exit(1)
+
+    try:
+        generated = backfill_json_results(args.batch_size)
+    except Exception as e:
+        print(f'Erro ao gerar resultados JSON: {e}', file=sys.stderr, flush=True)
+        sys.exit(1)
+    if generated:
+        print(f"{generated} resultados JSON gerados a partir do XML.", file=sys.stderr, flush=True)
+
+    if migrated:
+        ratio = raw_total / stored_total if stored_total else 0
+        print(
+            f"{migrated} resultados migrados: {raw_total} -> {stored_total} bytes ({ratio:.1f}x).",
+            file=sys.stderr, flush=True,
+        )
+    else:
+        print("Nenhum resultado legado para migrar.", file=sys.stderr, flush=True)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# scripts/upgrade_db.py
+import sys
+
+from sqlalchemy import text
+
+from api.db.models import Base
+from api.db.session import engine
+from scripts.migrate_results import backfill_json_results, migrate_legacy_results
+
+# Passos idempotentes aplicados em bancos criados por versões anteriores.
+# `create_all` só cria tabelas que não existem; colunas e índices novos em
+# tabelas já existentes precisam ser adicionados aqui.
+UPGRADE_STEPS = [
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS token_prefix VARCHAR(64)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_tokens_token_prefix ON tokens (token_prefix)",
+    # targets/tags passam a JSONB para filtros por contenção na listagem
+    """
+    DO $$ BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'scans' AND column_name = 'targets' AND data_type = 'json') THEN
+            ALTER TABLE scans ALTER COLUMN targets TYPE JSONB USING targets::jsonb;
+        END IF;
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'scans' AND column_name = 'tags' AND data_type = 'json') THEN
+            ALTER TABLE scans ALTER COLUMN tags TYPE JSONB USING tags::jsonb;
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_scans_created_at_id ON scans (created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_scans_token_created_at_id ON scans (token_id, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_scans_active_created_at_id ON scans (created_at DESC, id DESC) "
+    "WHERE status IN ('queued', 'running')",
+    "CREATE INDEX IF NOT EXISTS ix_scans_failed_created_at_id ON scans (created_at DESC, id DESC) "
+    "WHERE status = 'failed'",
+    "CREATE INDEX IF NOT EXISTS ix_scans_tags ON scans USING gin (tags jsonb_path_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_scans_targets ON scans USING gin (targets jsonb_path_ops)",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS shard_count INTEGER",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS shards_finished INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS shards_failed INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS cached_from UUID REFERENCES scans (id) ON DELETE SET NULL",
+    "CREATE INDEX IF NOT EXISTS ix_scans_pending_cached_from ON scans (cached_from) "
+    "WHERE status IN ('queued', 'running')",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS baseline_id UUID REFERENCES scans (id) ON DELETE SET NULL",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS host_count INTEGER",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS callback_mode VARCHAR(10)",
+    "CREATE INDEX IF NOT EXISTS ix_scans_fingerprint_finished_at ON scans (fingerprint, finished_at DESC) "
+    "WHERE status = 'succeeded'",
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS scan_weight INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE scans ADD COLUMN IF NOT EXISTS priority VARCHAR(10)",
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS rate_limits JSON",
+    "ALTER TABLE tokens ADD COLUMN IF NOT EXISTS max_active_scans INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_scans_token_status_created_at_id "
+    "ON scans (token_id, status, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_scans_token_active_created_at_id ON scans (token_id, created_at DESC, id DESC) "
+    "WHERE status IN ('queued', 'running')",
+    "CREATE INDEX IF NOT EXISTS ix_scans_token_tags ON scans "
+    "USING gin ((tags || CAST(CAST(token_id AS TEXT) AS JSONB)) jsonb_path_ops)",
+]
+
+
+def upgrade() -> int:
+    """
+    Cria tabelas ausentes e aplica os passos de UPGRADE_STEPS.
+    Pode ser executado repetidamente sem efeitos colaterais.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        for step in UPGRADE_STEPS:
+            print(f"-> {' '.join(step.split())[:120]}", file=sys.stderr, flush=True)
+            conn.execute(text(step))
+
+    migrated, raw_total, stored_total = migrate_legacy_results()
+    if migrated:
+        print(
+            f"{migrated} resultados movidos de scans.result_xml: {raw_total} -> {stored_total} bytes.",
+            file=sys.stderr, flush=True,
+        )
+
+    generated = backfill_json_results()
+    if generated:
+        print(f"{generated} resultados JSON gerados a partir do XML.", file=sys.stderr, flush=True)
+
+    print("Banco de dados atualizado.", file=sys.stderr, flush=True)
+    return 0
+
+
+def main() -> None:
+    try:
+        rc = upgrade()
+    except Exception as e:
+        print(f'Erro ao atualizar o banco de dados: {e}', file=sys.stderr, flush=True)
+        sys.exit(1)
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()